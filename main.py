@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import os
 import sys
 import argparse
 import numpy as np
@@ -9,6 +10,9 @@ from PyQt5.QtWidgets import QApplication
 from qtgui.main import DeepVisMainWindow
 from network.keras_tensorflow import Network as KerasTensorFlowNetwork
 from network.torch import Network as TorchNetwork
+from network.store import ActivationStore
+from network.threads import ThreadingPolicy, benchmark_policies
+from visualizations.store import HeatmapStore
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Neural network analysis.')
@@ -19,22 +23,39 @@ if __name__ == '__main__':
     parser.add_argument("--framework", help = 'the framework to use '
                         '(keras-tensorflow, torch)',
                         default = 'keras-tensorflow')
+    parser.add_argument("--store", help = 'directory of an activation store '
+                        'to serve precomputed activations from')
+    parser.add_argument("--scan", help = 'compute the activations of all '
+                        'layers for the dataset and write them to the store',
+                        action = 'store_true')
+    parser.add_argument("--heatmap-cache", help = 'directory keeping computed '
+                        'heatmaps (e.g. occlusion maps) across sessions',
+                        default = os.path.join(os.path.expanduser('~'), '.cache',
+                                               'qtpyviz', 'heatmaps'))
+    parser.add_argument("--heatmap-cache-size", help = 'maximal size of the '
+                        'heatmap cache in MiB (0 disables the cache)',
+                        type = int, default = 256)
+    ThreadingPolicy.add_arguments(parser)
+    parser.add_argument("--tune-threads", help = 'measure the speed of '
+                        'different threading settings for the model and '
+                        'use the fastest', action = 'store_true')
     args = parser.parse_args()
 
-    if args.framework == 'keras-tensorflow':
-        #network = KerasNetwork(args.model)
-        if not args.model:
-            args.model = 'models/example_keras_mnist_model.h5'
-        network = KerasTensorFlowNetwork(model_file=args.model)
-    elif args.framework == 'torch':
-        # FIXME[hack]: provide these parameter on the command line ...
-        net_file = "models/example_torch_mnist_net.py"
-        net_class = "Net"
-        parameter_file = "models/example_torch_mnist_model.pth"
-        input_shape = (28,28)
-        network = TorchNetwork(net_file, parameter_file,
-                               net_class = net_class,
-                               input_shape = input_shape)
+    def create_network():
+        if args.framework == 'keras-tensorflow':
+            #network = KerasNetwork(args.model)
+            if not args.model:
+                args.model = 'models/example_keras_mnist_model.h5'
+            return KerasTensorFlowNetwork(model_file=args.model)
+        elif args.framework == 'torch':
+            # FIXME[hack]: provide these parameter on the command line ...
+            net_file = "models/example_torch_mnist_net.py"
+            net_class = "Net"
+            parameter_file = "models/example_torch_mnist_model.pth"
+            input_shape = (28,28)
+            return TorchNetwork(net_file, parameter_file,
+                                net_class = net_class,
+                                input_shape = input_shape)
 
     if args.data=='mnist':
         from keras.datasets import mnist
@@ -44,8 +65,32 @@ if __name__ == '__main__':
 
     data = data.reshape(data.shape[0],data.shape[1],data.shape[2],1)
 
+    # The threading policy has to be applied before the network is created.
+    ThreadingPolicy.from_arguments(args).apply()
+    if args.tune_threads:
+        policy, timings = benchmark_policies(create_network, data[:64])
+        for candidate, seconds in timings:
+            print("{}: {:.4f}s".format(candidate, seconds))
+        print("Using {}".format(policy))
+    network = create_network()
+
+    if args.store:
+        store = ActivationStore(args.store)
+        if args.scan:
+            missing = [layer_id for layer_id in network.layer_ids
+                       if not store.contains(network, layer_id)]
+            if missing:
+                print("Scanning activations for layers {}".format(missing))
+                store.write(network, missing, data)
+        network.attach_store(store)
+
+    heatmapStore = None
+    if args.heatmap_cache_size > 0:
+        heatmapStore = HeatmapStore(args.heatmap_cache,
+                                    max_bytes = args.heatmap_cache_size * 2**20)
+
     app = QApplication(sys.argv)
-    mainWindow = DeepVisMainWindow()
+    mainWindow = DeepVisMainWindow(heatmapStore = heatmapStore)
     mainWindow.setNetwork(network, data)
     mainWindow.show()
 
@@ -0,0 +1,205 @@
+from typing import Any, Hashable, Tuple
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def array_digest(array: np.ndarray) -> str:
+    """Compute a content digest for an array.
+
+    The digest covers the shape and dtype as well as the raw data, so
+    that two arrays get the same digest only if they are equal in every
+    respect that matters for the computation of activations.
+
+    Parameters
+    ----------
+    array
+        The array to be hashed.
+
+    Returns
+    -------
+    The hexadecimal digest.
+    """
+    array = np.ascontiguousarray(array)
+    digest = hashlib.sha1()
+    digest.update(str(array.shape).encode('utf8'))
+    digest.update(array.dtype.str.encode('utf8'))
+    digest.update(array.view(np.uint8).reshape(-1).data)
+    return digest.hexdigest()
+
+
+class ActivationCache:
+    """A bounded least recently used (LRU) cache for activation values.
+
+    Entries are keyed by a tuple (input_digest, layer_id, data_format,
+    kind), where kind is either 'activation' or 'net_input'. The cache
+    is bounded by the total number of bytes of the stored arrays: when
+    a new entry exceeds the budget, the least recently used entries
+    are evicted.
+
+    Stored arrays are made read-only, as they are handed out to
+    several callers. Callers that want to modify values have to copy
+    them first.
+
+    The cache may be accessed from several threads.
+    """
+
+    def __init__(self, max_bytes: int=256 * 2**20):
+        """
+
+        Parameters
+        ----------
+        max_bytes
+            The memory budget of the cache in bytes. A value of 0
+            disables caching.
+        """
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(input_digest: str, layer_id: Any, data_format: str, kind: str) -> Tuple:
+        return (input_digest, layer_id, data_format, kind)
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def num_bytes(self) -> int:
+        """The number of bytes currently occupied by cached arrays."""
+        return self._num_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> np.ndarray:
+        """Look up an entry and mark it as recently used.
+
+        Returns
+        -------
+        The cached array or None, if there is no entry for the key.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: np.ndarray) -> None:
+        """Store an array, evicting least recently used entries if necessary.
+        Arrays larger than the whole budget are not stored at all.
+        """
+        if value.nbytes > self._max_bytes:
+            return
+        value.flags.writeable = False
+        with self._lock:
+            old_value = self._entries.pop(key, None)
+            if old_value is not None:
+                self._num_bytes -= old_value.nbytes
+            self._entries[key] = value
+            self._num_bytes += value.nbytes
+            while self._num_bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._num_bytes -= evicted.nbytes
+
+    def clear(self) -> None:
+        """Remove all entries. The hit and miss counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._num_bytes = 0
+
+    @property
+    def info(self) -> OrderedDict:
+        info_dict = OrderedDict()
+        info_dict['entries'] = len(self)
+        info_dict['bytes'] = self._num_bytes
+        info_dict['max_bytes'] = self._max_bytes
+        info_dict['hits'] = self.hits
+        info_dict['misses'] = self.misses
+        return info_dict
+
+
+class LRUCache:
+    """A least recently used (LRU) cache holding a bounded number of
+    arbitrary values.
+
+    The cache may be accessed from several threads.
+    """
+
+    def __init__(self, maxsize: int=128):
+        """
+
+        Parameters
+        ----------
+        maxsize
+            The maximal number of entries. A value of 0 disables caching.
+        """
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        """Look up an entry and mark it as recently used.
+
+        Returns
+        -------
+        The cached value or default, if there is no entry for the key.
+        """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entry if necessary."""
+        if self._maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries. The hit and miss counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def info(self) -> OrderedDict:
+        info_dict = OrderedDict()
+        info_dict['entries'] = len(self)
+        info_dict['maxsize'] = self._maxsize
+        info_dict['hits'] = self.hits
+        info_dict['misses'] = self.misses
+        return info_dict
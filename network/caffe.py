@@ -2,6 +2,7 @@ from __future__ import absolute_import
 from typing import Union, List
 
 import os
+import queue
 
 import numpy as np
 import caffe
@@ -42,6 +43,11 @@ class Network(BaseNetwork):
 
     _TRANSFORMATION_LAYER_TYPES = {'Pooling', 'Flatten', 'Dropout'}
 
+    # Batch sizes the net is reshaped to. A batch is padded up to the next
+    # bucket, so that varying batch sizes do not cause a reshape every time.
+    # Larger batches are fed with their exact size.
+    _BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
 
     def __init__(self, **kwargs):
         """
@@ -53,9 +59,16 @@ class Network(BaseNetwork):
                 Path to the .prototxt model definition file.
             model_weights
                 Path the .caffemodel weights file.
+            batch_size_buckets
+                Sorted sequence of batch sizes the net is reshaped to
+                (optional).
+            num_replicas
+                The number of caffe nets used to serve concurrent
+                requests (default 1). The replicas share the weights.
         """
         # Caffe uses channels first as data format.
         kwargs['data_format'] = 'channels_first'
+        self._batch_size_buckets = tuple(kwargs.get('batch_size_buckets', self._BATCH_SIZE_BUCKETS))
         self.protonet = self._remove_inplace(kwargs['model_def'])
         # Write the new protobuf model definition to a file, so it can be read to create a caffe net.
         # This would probably not be necessary with boost > 1.58, see https://stackoverflow.com/a/34172374/4873972
@@ -65,6 +78,23 @@ class Network(BaseNetwork):
             self._caffenet = caffe.Net(fp.name,
                                        kwargs['model_weights'],
                                        caffe.TEST)
+            # A caffe net holds the blobs of a forward pass and can thus only
+            # serve one request at a time. Each request checks out a replica.
+            # Every replica keeps its own blob shapes, i.e. its own batch size.
+            self._num_replicas = max(1, kwargs.get('num_replicas', 1))
+            self._replicas = queue.Queue()
+            self._replicas.put(self._caffenet)
+            for _ in range(self._num_replicas - 1):
+                replica = caffe.Net(fp.name, caffe.TEST)
+                # Use the weights of the first net instead of loading them again.
+                replica.share_with(self._caffenet)
+                self._replicas.put(replica)
+        # The layer computing each blob, to determine where a forward pass can stop.
+        self._layer_names = list(self._caffenet._layer_names)
+        self._blob_producers = {}
+        for layer_index, layer_name in enumerate(self._layer_names):
+            for blob_name in self._caffenet.top_names[layer_name]:
+                self._blob_producers[blob_name] = layer_index
         self.layer_dict = self._create_layer_dict()
 
         super().__init__(**kwargs)
@@ -150,48 +180,80 @@ class Network(BaseNetwork):
         -------
 
         """
-
-        activation_layers = []
-        # Try to find the activation layer for each layer id. If it cannot be found the layer only has one output.
-        for layer_id in layer_ids:
-            try:
-                activation_layers.append(self.layer_dict[layer_id].activation_layer_name)
-            except AttributeError:
-                activation_layers.append(self.layer_dict[layer_id].layer_name)
-
-            # maybe_activation_layer = getattr(self.layer_dict[layer_id], 'activation_layer_name', None)
-            # if maybe_activation_layer is not None:
-            #     activation_layers.append(maybe_activation_layer)
-            # else:
-            #     activation_layers.append(self.layer_dict[layer_id].layer_name)
-
-
-        return self._feed_input(activation_layers, input_samples)
+        return self._compute_outputs([(layer_id, 'activation') for layer_id in layer_ids], input_samples)
 
     def _compute_net_input(self, layer_ids: list, input_samples: np.ndarray):
+        return self._compute_outputs([(layer_id, 'net_input') for layer_id in layer_ids], input_samples)
+
+    def _compute_outputs(self, requests: list, input_samples: np.ndarray) -> List[np.ndarray]:
+        # All blobs are available after one forward pass, so just collect their names.
+        # Net input and activation of a layer without activation layer share a blob,
+        # which is fetched only once.
+        blob_names = [self._blob_name(layer_id, kind) for layer_id, kind in requests]
+        unique_names = list(OrderedDict.fromkeys(blob_names))
+        values = dict(zip(unique_names, self._feed_input(unique_names, input_samples)))
+        return [values[blob_name] for blob_name in blob_names]
+
+    def _blob_name(self, layer_id, kind: str) -> str:
+        """Get the name of the blob holding the activation or net input of a layer."""
+        layer = self.layer_dict[layer_id]
+        if kind == 'activation':
+            # Try to find the activation layer. If it cannot be found the layer only has one output.
+            return getattr(layer, 'activation_layer_name', layer.layer_name)
         # Use the default output as this corresponds to the net input for neural layers
-        net_input_layers = [self.layer_dict[layer_id].layer_name for layer_id in layer_ids]
-        return self._feed_input(net_input_layers, input_samples)
-
+        return layer.layer_name
 
+    @property
+    def _max_concurrent_batches(self) -> int:
+        # Leave one replica for interactive requests during dataset scans.
+        return max(1, self._num_replicas - 1)
 
     def _feed_input(self, fetches: list, input_samples: np.ndarray) -> List[np.ndarray]:
+        caffenet = self._replicas.get()
+        try:
+            return self._forward(caffenet, fetches, input_samples)
+        finally:
+            self._replicas.put(caffenet)
+
+    def _forward(self, caffenet, fetches: list, input_samples: np.ndarray) -> List[np.ndarray]:
+        """Feed the input samples into a caffe net and get the values of the
+        fetched blobs."""
         # Assuming the first layer is the input layer.
-        input_blob = next(iter(self._caffenet.blobs.values()))
-        # Reshape the loaded_network. Change only the batch size.
-        # The batch size is otherwise fixed in the model definition.
-        old_input_shape = input_blob.data.shape
-        new_input_shape = list(old_input_shape)
-        new_input_shape[0] = input_samples.shape[0]
-        input_blob.reshape(*new_input_shape)
-        self._caffenet.reshape()
-        # Feed the input into the loaded_network and forward it.
-        input_blob.data[...] = input_samples
-        self._caffenet.forward()
-
-        outputs = [self._caffenet.blobs[fetch].data for fetch in fetches]
+        input_blob = next(iter(caffenet.blobs.values()))
+        batch_size = input_samples.shape[0]
+        # Reshape the loaded_network, if the batch does not fit into the current
+        # bucket. Change only the batch size, which is otherwise fixed in the
+        # model definition. Reshaping every call would let each layer set up
+        # its buffers again.
+        bucket_size = self._bucket_size(batch_size)
+        if input_blob.data.shape[0] != bucket_size:
+            new_input_shape = list(input_blob.data.shape)
+            new_input_shape[0] = bucket_size
+            input_blob.reshape(*new_input_shape)
+            caffenet.reshape()
+            # Rows used for padding only should hold defined values.
+            input_blob.data[...] = 0
+        # Feed the input into the loaded_network and forward it, but only
+        # up to the deepest layer computing one of the fetched blobs.
+        # The samples are independent, so the padding rows do not matter.
+        input_blob.data[:batch_size] = input_samples
+        end = max(self._blob_producers[fetch] for fetch in fetches)
+        caffenet.forward(end=self._layer_names[end])
+
+        # The blob data is overwritten by the next forward pass, so the
+        # outputs have to be copied before they can be handed out (and cached).
+        # Fresh arrays are used, as the values may be kept by the caller for an
+        # arbitrary time. Only the rows of the actual samples are copied.
+        outputs = [caffenet.blobs[fetch].data[:batch_size].copy() for fetch in fetches]
         return outputs
 
+    def _bucket_size(self, batch_size: int) -> int:
+        """The batch size the net is reshaped to for a given number of samples."""
+        for bucket_size in self._batch_size_buckets:
+            if bucket_size >= batch_size:
+                return bucket_size
+        return batch_size
+
     def _remove_inplace(self, model_def):
         """Remove inplace operations from caffe protobuf model definition, so net input
         and activations and be retrieved separately.
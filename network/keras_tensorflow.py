@@ -2,13 +2,16 @@ from __future__ import absolute_import
 
 import keras
 import numpy as np
+import tensorflow as tf
 
 from collections import OrderedDict
 from frozendict import FrozenOrderedDict
 from network.exceptions import ParsingError
 
 from .keras import Network as KerasNetwork
+from .cache import LRUCache
 from .layers import keras_tensorflow_layers
+from .threads import current_policy
 
 class Network(KerasNetwork):
 
@@ -25,6 +28,11 @@ class Network(KerasNetwork):
     # Layer types that just map input to output without trainable parameters.
     _transformation_layer_types = {'MaxPooling2D', 'Flatten', 'Dropout'}
 
+    # Default number of backend functions kept, one per distinct set of fetches.
+    _DEFAULT_MAX_FUNCTIONS = 32
+    # Default number of samples fed to the network at once.
+    _DEFAULT_BATCH_SIZE = 256
+
     def __init__(self, **kwargs):
         """
         Load Keras model.
@@ -32,9 +40,22 @@ class Network(KerasNetwork):
         ----------
         modelfile_path
             Path to the .h5 model file.
+        max_functions
+            The number of backend functions, one per distinct set of
+            fetched tensors, that are kept for reuse.
+        batch_size
+            Larger inputs are fed to the network in chunks of this size.
         """
+        policy = current_policy()
+        if not policy.is_default:
+            # The model is loaded into the session of the keras backend.
+            keras.backend.set_session(tf.Session(config=policy.session_config()))
         super().__init__(**kwargs)
         self._sess = keras.backend.get_session()
+        self._input_tensor = self._model.layers[0].input
+        # Backend functions keyed by the tuple of fetched tensors.
+        self._functions = LRUCache(kwargs.get('max_functions', self._DEFAULT_MAX_FUNCTIONS))
+        self._batch_size = kwargs.get('batch_size', self._DEFAULT_BATCH_SIZE)
 
     def _create_layer_dict(self):
 
@@ -96,21 +117,36 @@ class Network(KerasNetwork):
         -------
 
         """
-        activation_tensors  = [self.layer_dict[layer_id].output for layer_id in layer_ids]
-        return self._feed_input(activation_tensors, input_samples)
+        return self._compute_outputs([(layer_id, 'activation') for layer_id in layer_ids], input_samples)
 
     def _compute_net_input(self, layer_ids: list, input_samples: np.ndarray):
-        ops = self._sess.graph.get_operations()
-        net_input_tensors = []
-        # To get the net input of a layer we take the second to last operation as the net input.
-        # This operation corresponds usually to the addition of the bias.
-        for layer_id in layer_ids:
-            output_op = self.layer_dict[layer_id].output.op
-            # Assumes the input to the activation is the net input.
-            net_input_tensors.append(output_op.inputs[0])
-        return self._feed_input(net_input_tensors, input_samples)
+        return self._compute_outputs([(layer_id, 'net_input') for layer_id in layer_ids], input_samples)
+
+    def _compute_outputs(self, requests: list, input_samples: np.ndarray) -> list:
+        fetches = []
+        for layer_id, kind in requests:
+            output = self.layer_dict[layer_id].output
+            if kind == 'activation':
+                fetches.append(output)
+            else:
+                # To get the net input of a layer we take the input of the activation function.
+                # This operation corresponds usually to the addition of the bias.
+                fetches.append(output.op.inputs[0])
+        return self._feed_input(fetches, input_samples)
 
     def _feed_input(self, fetches: list, input_samples: np.ndarray):
-        network_input_tensor = self._model.layers[0].input
-        return self._sess.run(fetches=fetches, feed_dict={network_input_tensor: input_samples})
+        # A backend function is built once for every set of fetches. Only the
+        # part of the graph the fetches depend on is run.
+        key = tuple(fetches)
+        function = self._functions.get(key)
+        if function is None:
+            function = keras.backend.function([self._input_tensor], list(fetches))
+            self._functions.put(key, function)
+        if len(input_samples) <= self._batch_size:
+            return function([input_samples])
+        # Feed large inputs in chunks, like Model.predict does, to bound the
+        # memory needed for intermediate values.
+        chunks = [function([input_samples[start:start + self._batch_size]])
+                  for start in range(0, len(input_samples), self._batch_size)]
+        return [np.concatenate(outputs) for outputs in zip(*chunks)]
 
@@ -72,23 +72,25 @@ class CaffeNeuralLayer(CaffeLayer, layers.NeuralLayer):
         self._caffe_act_layer_proto = caffe_act_layer_proto
         self.activation_layer_name = caffe_act_layer_proto.name
 
-    @property
-    def parameters(self):
+    # TODO check whether the weight format has also be adapted to channel last
+    def _fetch_parameters(self):
+        # The data of a blob is a view on the memory of the net, so no copy is made.
         return tuple(blob.data for blob in self._caffe_layer_obj.blobs)
 
     @property
-    def num_parameters(self):
-        return self._caffe_layer_obj.blobs[0].count + self._caffe_layer_obj.blobs[1].count
+    def parameter_shapes(self):
+        return tuple(tuple(blob.shape) for blob in self._caffe_layer_obj.blobs)
 
-    # TODO check whether the weight format has also be adapted to channel last
     @property
-    def weights(self):
-        return self._caffe_layer_obj.blobs[0].data
-
+    def num_parameters(self):
+        return sum(blob.count for blob in self._caffe_layer_obj.blobs)
 
     @property
-    def bias(self):
-        return self._caffe_layer_obj.blobs[1].data
+    def activation_function(self):
+        # Without activation layer, the layer itself is passed as activation layer.
+        if self.activation_layer_name == self.layer_name:
+            return 'linear'
+        return self._caffe_act_layer_obj.type.lower()
 
 class CaffeStridingLayer(CaffeLayer, layers.StridingLayer):
 
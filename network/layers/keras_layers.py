@@ -20,22 +20,23 @@ class KerasLayer(layers.Layer):
 
 class KerasNeuralLayer(KerasLayer, layers.NeuralLayer):
 
-    @property
-    def parameters(self):
+    def _fetch_parameters(self):
         return self._keras_layer_objs[0].get_weights()
 
     @property
-    def num_parameters(self):
-        return self._keras_layer_objs[0].count_params()
+    def parameter_shapes(self):
+        # Imported here, as this module is loaded even if keras is not installed.
+        from keras import backend as K
+        return tuple(K.int_shape(weight) for weight in self._keras_layer_objs[0].weights)
 
     @property
-    def weights(self):
-        return self._keras_layer_objs[0].get_weights()[0]
-
+    def num_parameters(self):
+        return self._keras_layer_objs[0].count_params()
 
     @property
-    def bias(self):
-        return self._keras_layer_objs[0].get_weights()[1]
+    def activation_function(self):
+        # Either the layer itself or a separate Activation layer.
+        return self._keras_layer_objs[-1].activation.__name__
 
 class KerasStridingLayer(KerasLayer, layers.StridingLayer):
     @property
@@ -33,22 +33,58 @@ class NeuralLayer(Layer):
     Calculating the net input by taking some inner product between weights and input.
     Adding a bias.
     Applying some (mostly non-linear) activation function.
+
+    The parameter values are fetched from the framework only once and
+    kept as a read-only snapshot, until `invalidate_parameters` is
+    called (e.g. because new weights were loaded).
     """
 
+    _parameter_snapshot = None
+
+    def _fetch_parameters(self) -> Tuple[np.ndarray, ...]:
+        """To be implemented by subclasses. Fetch the current values of
+        the parameters (weights first, bias second) from the framework.
+        """
+        raise NotImplementedError
+
+    def invalidate_parameters(self) -> None:
+        """Discard the parameter snapshot, so that the values are fetched
+        again on the next access."""
+        self._parameter_snapshot = None
+
     @property
     def parameters(self) -> Tuple[np.ndarray, ...]:
-        raise NotImplementedError
+        snapshot = self._parameter_snapshot
+        if snapshot is None:
+            snapshot = tuple(self._fetch_parameters())
+            for parameter in snapshot:
+                parameter.flags.writeable = False
+            self._parameter_snapshot = snapshot
+        return snapshot
+
+    @property
+    def parameter_shapes(self) -> Tuple[Tuple[int, ...], ...]:
+        """The shapes of the parameters. Subclasses should reimplement this
+        to obtain the shapes without fetching the values."""
+        return tuple(parameter.shape for parameter in self.parameters)
 
     @property
     def num_parameters(self) -> int:
-        return sum(param.size for param in self.parameters)
+        return sum(int(np.prod(shape)) for shape in self.parameter_shapes)
 
     @property
-    def weights(self) -> np.ndarray:
+    def activation_function(self) -> str:
+        """The name of the activation function in lower case, e.g. 'relu',
+        'sigmoid' or 'softmax'. 'linear' if the layer has none."""
         raise NotImplementedError
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self.parameters[0]
+
     @property
     def bias(self) -> np.ndarray:
-        raise NotImplementedError
+        return self.parameters[1]
 
     @property
     def info(self) -> OrderedDict:
@@ -20,31 +20,31 @@ class TensorFlowLayer(layers.Layer):
     def output_shape(self):
         return tuple(self._ops[-1].outputs[0].shape.as_list())
 
-
-class TensorFlowNeuralLayer(TensorFlowLayer, layers.NeuralLayer):
-
     @property
-    def parameters(self):
-        return (self.weights, self.bias)
+    def activation_tensor(self):
+        """The tensor that contains the activations of the layer."""
+        # For now assume that the last operation is the activation.
+        # Maybe differentiate with subclasses later.
+        return self._ops[-1].outputs[0]
 
-    @property
-    def num_parameters(self):
-        return self.weights.size + self.bias.size
 
-    @property
-    def weights(self):
-        return self._network._sess.run(self.weight_tensor)
+class TensorFlowNeuralLayer(TensorFlowLayer, layers.NeuralLayer):
+
+    def _fetch_parameters(self):
+        # Fetch weights and bias in one run.
+        return self._network._sess.run((self.weight_tensor, self.bias_tensor))
 
     @property
-    def bias(self):
-        return self._network._sess.run(self.bias_tensor)
+    def parameter_shapes(self):
+        return (tuple(self.weight_tensor.shape.as_list()),
+                tuple(self.bias_tensor.shape.as_list()))
 
     @property
-    def activation_tensor(self):
-        """The tensor that contains the activations of the layer."""
-        # For now assume that the last operation is the activation.
-        # Maybe differentiate with subclasses later.
-        return self._ops[-1].outputs[0]
+    def activation_function(self):
+        # Without activation function, the bias operation is duplicated as activation.
+        if self._ops[-1] is self._ops[-2]:
+            return 'linear'
+        return self._ops[-1].type.lower()
 
     @property
     def net_input_tensor(self):
@@ -1,12 +1,19 @@
-from typing import Tuple, Any, Union, List
+from typing import Tuple, Any, Union, List, Iterator
 
 import functools
+import hashlib
 import operator
+import threading
 import numpy as np
 
+from concurrent.futures import ThreadPoolExecutor
+
+from collections import OrderedDict
 from frozendict import FrozenOrderedDict
 
 from .util import convert_data_format
+from .cache import ActivationCache, array_digest
+from .layers.layers import NeuralLayer
 
 # FIXME[design]: we should decide on some points:
 #
@@ -49,6 +56,9 @@ class Network:
 
     """
 
+    # Default memory budget for the activation cache (256 MiB).
+    _DEFAULT_CACHE_SIZE = 256 * 2**20
+
     # ------------ Public interface ----------------
 
     def __init__(self, **kwargs):
@@ -59,6 +69,9 @@ class Network:
         **kwargs
             data_format: {'channels_last', 'channels_first'}
                 The place of the color channels in the tensors.
+            cache_size: int
+                Memory budget in bytes for caching activations and
+                net inputs. Set to 0 to disable caching.
         """
         # Prohibited instantiation of base class.
         if self.__class__ == Network:
@@ -68,6 +81,12 @@ class Network:
         data_format = kwargs.get('data_format', 'channels_last')
         self._data_format = data_format
 
+        # Cache for activations and net inputs of recently seen inputs.
+        self._activation_cache = ActivationCache(kwargs.get('cache_size', self._DEFAULT_CACHE_SIZE))
+        # Optional on-disk store with activations for whole datasets.
+        self._activation_store = None
+        self._fingerprint = None
+
         # Create the layer representation.
         self.layer_dict = self._create_layer_dict()
 
@@ -76,6 +95,11 @@ class Network:
         """Provide access to the layers by number. Access by id is provided via `layer_dict`."""
         return tuple(self.layer_dict.values())[item]
 
+    @property
+    def layer_ids(self) -> list:
+        """Get list of layer ids, in the order of the layers in the network."""
+        return list(self.layer_dict.keys())
+
 
     def get_activations(self, layer_ids: Any,
                         input_samples: np.ndarray,
@@ -101,17 +125,7 @@ class Network:
         Array of shape (input_samples, image_height, image_width, feature_maps).
 
         """
-        # Check whether the layer_ids are actually a list.
-        layer_ids, is_list = self._force_list(layer_ids)
-        # Transform the input_sample appropriate for the loaded_network.
-        input_samples = self._transform_input(input_samples, data_format)
-        activations = self._compute_activations(layer_ids, input_samples)
-        # Transform the output to stick to the canocial interface.
-        activations = [self._transform_outputs(activation, data_format) for activation in activations]
-        # If it was just asked for the activations of a single layer, return just an array.
-        if not is_list:
-            activations = activations[0]
-        return activations
+        return self._get_layer_values(layer_ids, 'activation', input_samples, data_format)
 
     def get_net_input(self, layer_ids: Any,
                       input_samples: np.ndarray,
@@ -135,17 +149,287 @@ class Network:
         Array of shape (input_samples, image_height, image_width, feature_maps).
 
         """
-        # Check whether the layer_ids are actually a list.
+        return self._get_layer_values(layer_ids, 'net_input', input_samples, data_format)
+
+    def has_net_input(self, layer_id) -> bool:
+        """Check whether a net input can be obtained for the given layer,
+        see `get_net_input`."""
+        return self._has_net_input(layer_id)
+
+    def get_layer_outputs(self, layer_ids: Any,
+                          input_samples: np.ndarray,
+                          kinds: Tuple[str, ...]=('net_input', 'activation'),
+                          data_format: str='channels_last',
+                          use_cache: bool=True) -> Tuple:
+        """Gives several kinds of values (e.g. net input and activation) for
+        given layers and an input sample. All values are fetched in a
+        single forward pass.
+
+        Parameters
+        ----------
+        layer_ids
+            The layers the values should be fetched for. Single
+            layer_id or list of layer_ids.
+        input_samples
+             For multi-channel, two-dimensional data, we expect the
+             input data to be given in with channel last, that is
+             (N,H,W,C). For plain data of dimensionality D we expect
+             batch first (N,D).
+        kinds
+            The kinds of values to fetch, each either 'net_input' or
+            'activation'.
+        data_format: {'channels_last', 'channels_first'}
+            The format in which the data is provided.
+        use_cache
+            If False, the values are computed without using the
+            activation cache. This is useful for inputs that will not
+            be seen again, e.g. perturbed copies of a sample.
+
+        Returns
+        -------
+        A tuple with one entry per kind, in the order of kinds. Each
+        entry is an array, or a list of arrays if layer_ids was a list.
+
+        Raises
+        ------
+        ValueError
+            If an unknown kind is requested, or the net input is
+            requested for a layer that does not have one.
+        """
         layer_ids, is_list = self._force_list(layer_ids)
-        # Transform the input_sample appropriate for the loaded_network.
-        input_samples = self._transform_input(input_samples, data_format)
-        activations = self._compute_net_input(layer_ids, input_samples)
-        # Transform the output to stick to the canocial interface.
-        activations = [self._transform_outputs(activation, data_format) for activation in activations]
-        # If it was just asked for the activations of a single layer, return just an array.
+        requests = [(layer_id, kind) for kind in kinds for layer_id in layer_ids]
+        outputs = self.get_outputs(requests, input_samples, data_format, use_cache)
+        num_layers = len(layer_ids)
+        values = [outputs[idx * num_layers:(idx + 1) * num_layers] for idx in range(len(kinds))]
         if not is_list:
-            activations = activations[0]
-        return activations
+            values = [value[0] for value in values]
+        return tuple(values)
+
+    def get_outputs(self, requests: List[Tuple[Any, str]],
+                    input_samples: np.ndarray,
+                    data_format: str='channels_last',
+                    use_cache: bool=True) -> List[np.ndarray]:
+        """Gives the values for a list of (layer_id, kind) pairs, where
+        each layer may ask for a different kind of value. All values
+        are fetched in a single forward pass.
+
+        Parameters
+        ----------
+        requests
+            The (layer_id, kind) pairs, kind being either 'net_input'
+            or 'activation'.
+        input_samples
+             For multi-channel, two-dimensional data, we expect the
+             input data to be given in with channel last, that is
+             (N,H,W,C). For plain data of dimensionality D we expect
+             batch first (N,D).
+        data_format: {'channels_last', 'channels_first'}
+            The format in which the data is provided.
+        use_cache
+            If False, the values are computed without using the
+            activation cache.
+
+        Returns
+        -------
+        A list with one array per request, in the order of requests.
+
+        Raises
+        ------
+        ValueError
+            If an unknown kind is requested, or the net input is
+            requested for a layer that does not have one.
+        """
+        requests = list(requests)
+        for layer_id, kind in requests:
+            if kind not in ('activation', 'net_input'):
+                raise ValueError('Unknown kind of layer output: {}'.format(kind))
+            if kind == 'net_input' and not self._has_net_input(layer_id):
+                raise ValueError('Layer {} has no net input.'.format(layer_id))
+
+        if use_cache:
+            return self._get_cached_outputs(requests, input_samples, data_format)
+        outputs = self._compute_outputs(requests, self._transform_input(input_samples, data_format))
+        return [self._transform_outputs(output, data_format) for output in outputs]
+
+    def get_all_activations(self, input_samples: np.ndarray,
+                            include_net_input: bool=True,
+                            data_format: str='channels_last') -> Union[OrderedDict, Tuple[OrderedDict, OrderedDict]]:
+        """Gives the activations of all layers of the network (and optionally
+        their net inputs) for an input sample. All values are fetched
+        in a single forward pass.
+
+        Parameters
+        ----------
+        input_samples
+             For multi-channel, two-dimensional data, we expect the
+             input data to be given in with channel last, that is
+             (N,H,W,C). For plain data of dimensionality D we expect
+             batch first (N,D).
+        include_net_input
+            Whether the net inputs should be fetched as well.
+        data_format: {'channels_last', 'channels_first'}
+            The format in which the data is provided.
+
+        Returns
+        -------
+        An OrderedDict mapping each layer_id to the activations of
+        that layer. If include_net_input is True, a second OrderedDict
+        is returned, mapping the ids of all layers that have a net
+        input (the neural layers) to the net input of that layer.
+        """
+        requests = [(layer_id, 'activation') for layer_id in self.layer_ids]
+        if include_net_input:
+            requests += [(layer_id, 'net_input') for layer_id in self.layer_ids
+                         if self._has_net_input(layer_id)]
+        outputs = self._get_cached_outputs(requests, input_samples, data_format)
+
+        activations = OrderedDict()
+        net_inputs = OrderedDict()
+        for (layer_id, kind), output in zip(requests, outputs):
+            if kind == 'activation':
+                activations[layer_id] = output
+            else:
+                net_inputs[layer_id] = output
+        if not include_net_input:
+            return activations
+        return activations, net_inputs
+
+    def iter_activations(self, layer_ids: Any,
+                         dataset: np.ndarray,
+                         batch_size: int=64,
+                         data_format: str='channels_last') -> Iterator[Tuple[np.ndarray, Any]]:
+        """Iterate over the activations for a whole dataset, batch by batch.
+
+        Batches are read, transformed and computed in background threads.
+        While a batch is processed by the network, the next batch is
+        already prepared. Networks that can compute several batches
+        concurrently (see `_max_concurrent_batches`) get that many
+        batches at once. The activation cache is bypassed, as the values
+        of a dataset scan are usually not requested again.
+
+        Parameters
+        ----------
+        layer_ids
+            The layers the activations should be fetched for. Single
+            layer_id or list of layer_ids.
+        dataset
+            Array-like collection of input samples supporting `len`
+            and slicing along the first axis, e.g. an array or a
+            `np.memmap`.
+        batch_size
+            The number of samples fed to the network at once.
+        data_format: {'channels_last', 'channels_first'}
+            The format in which the data is provided.
+
+        Yields
+        ------
+        Tuples (indices, activations), where indices is an array with the
+        dataset indices of the samples in the batch and activations is an
+        array, or a list of arrays if layer_ids was a list.
+        """
+        layer_ids, is_list = self._force_list(layer_ids)
+        starts = range(0, len(dataset), batch_size)
+
+        # Reading and transforming the batches runs ahead on the thread
+        # pool, while the forward passes are limited to the number of
+        # batches the network can compute concurrently.
+        num_pending = self._max_concurrent_batches + 1
+        forward_passes = threading.Semaphore(self._max_concurrent_batches)
+
+        def compute(start: int) -> Tuple[np.ndarray, List[np.ndarray]]:
+            batch = np.asarray(dataset[start:start + batch_size])
+            input_samples = self._transform_input(batch, data_format)
+            with forward_passes:
+                activations = self._compute_activations(layer_ids, input_samples)
+            activations = [self._transform_outputs(activation, data_format)
+                           for activation in activations]
+            return np.arange(start, start + len(input_samples)), activations
+
+        with ThreadPoolExecutor(max_workers=num_pending) as executor:
+            pending = [executor.submit(compute, start) for start in starts[:num_pending]]
+            for idx in range(len(starts)):
+                indices, activations = pending.pop(0).result()
+                if idx + num_pending < len(starts):
+                    pending.append(executor.submit(compute, starts[idx + num_pending]))
+                yield indices, (activations if is_list else activations[0])
+
+    def prefetch_activations(self, layer_ids: Any,
+                             input_samples: np.ndarray,
+                             data_format: str='channels_last') -> None:
+        """Compute activations for a batch of samples and put them into the
+        activation cache sample by sample, so that later calls of
+        `get_activations` for any of the individual samples (with a batch
+        axis of size 1) are answered from the cache. All samples that are
+        not cached yet are computed in a single forward pass.
+
+        Parameters
+        ----------
+        layer_ids
+            The layers the activations should be fetched for. Single
+            layer_id or list of layer_ids.
+        input_samples
+            The samples, with batch axis.
+        data_format: {'channels_last', 'channels_first'}
+            The format in which the data is provided.
+        """
+        layer_ids, _ = self._force_list(layer_ids)
+        cache = self._activation_cache
+        keys = []
+        for idx in range(len(input_samples)):
+            input_digest = array_digest(input_samples[idx:idx + 1])
+            keys.append([cache.make_key(input_digest, layer_id, data_format, 'activation')
+                         for layer_id in layer_ids])
+        missing = [idx for idx, sample_keys in enumerate(keys)
+                   if any(key not in cache for key in sample_keys)]
+        if not missing:
+            return
+
+        batch = self._transform_input(input_samples[missing], data_format)
+        activations = self._compute_activations(layer_ids, batch)
+        for layer_idx, activation in enumerate(activations):
+            activation = self._transform_outputs(activation, data_format)
+            for row, idx in enumerate(missing):
+                # Copy, so that the cache entry does not keep the whole batch alive.
+                cache.put(keys[idx][layer_idx], activation[row:row + 1].copy())
+
+    @property
+    def activation_cache(self) -> ActivationCache:
+        """The cache holding recently computed activations and net inputs.
+        It provides hit and miss counters via its `info` property.
+        """
+        return self._activation_cache
+
+    def invalidate_cache(self) -> None:
+        """Discard all cached values. This has to be called whenever the
+        model changes, e.g. when new weights are loaded.
+        """
+        self._activation_cache.clear()
+        self._fingerprint = None
+        for layer in self.layer_dict.values():
+            if isinstance(layer, NeuralLayer):
+                layer.invalidate_parameters()
+
+    def attach_store(self, store) -> None:
+        """Attach an `ActivationStore`. Activations contained in the store are
+        then served from it instead of being computed. Use None to detach
+        the current store.
+        """
+        self._activation_store = store
+
+    @property
+    def fingerprint(self) -> str:
+        """A digest identifying the model, computed from the architecture
+        (layer ids and types) and the values of all parameters.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha1(type(self).__name__.encode('utf8'))
+            for layer_id, layer in self.layer_dict.items():
+                digest.update('{}:{}'.format(layer_id, type(layer).__name__).encode('utf8'))
+                if isinstance(layer, NeuralLayer):
+                    for parameter in layer.parameters:
+                        digest.update(array_digest(parameter).encode('utf8'))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
 
 
     def get_layer_info(self, layername):
@@ -170,6 +454,35 @@ class Network:
         """To be implemented by subclasses. Computes a list of net inputs from a list of layer ids."""
         raise NotImplementedError
 
+    def _compute_outputs(self, requests: List[Tuple[Any, str]], input_samples: np.ndarray) -> List[np.ndarray]:
+        """Compute the values for a list of (layer_id, kind) pairs, where kind
+        is either 'activation' or 'net_input'.
+
+        Subclasses should reimplement this to fetch all values in a single
+        forward pass. The default implementation falls back to
+        `_compute_activations` and `_compute_net_input`.
+        """
+        outputs = [None] * len(requests)
+        for kind, compute_fn in (('activation', self._compute_activations),
+                                 ('net_input', self._compute_net_input)):
+            indices = [idx for idx, request in enumerate(requests) if request[1] == kind]
+            if indices:
+                computed = compute_fn([requests[idx][0] for idx in indices], input_samples)
+                for idx, output in zip(indices, computed):
+                    outputs[idx] = output
+        return outputs
+
+    @property
+    def _max_concurrent_batches(self) -> int:
+        """The number of batches that should be computed concurrently in
+        dataset scans. Subclasses that can compute several batches in
+        parallel should reimplement this."""
+        return 1
+
+    def _has_net_input(self, layer_id) -> bool:
+        """Check whether a net input can be obtained for the given layer."""
+        return isinstance(self.layer_dict[layer_id], NeuralLayer)
+
     def _create_layer_dict(self) -> FrozenOrderedDict:
         """Create the mapping from layer ids to layer objects.
 
@@ -181,6 +494,58 @@ class Network:
 
     # ---------------------- Private helper functions --------------------------------
 
+    def _get_layer_values(self, layer_ids: Any, kind: str,
+                          input_samples: np.ndarray,
+                          data_format: str) -> Union[np.ndarray, List[np.ndarray]]:
+        """Get activations or net inputs for a single layer_id or a list of layer_ids.
+
+        Returns
+        -------
+        An array, or a list of arrays if layer_ids was a list.
+        """
+        # Check whether the layer_ids are actually a list.
+        layer_ids, is_list = self._force_list(layer_ids)
+        outputs = self._get_cached_outputs([(layer_id, kind) for layer_id in layer_ids],
+                                           input_samples, data_format)
+        # If it was just asked for the values of a single layer, return just an array.
+        if not is_list:
+            outputs = outputs[0]
+        return outputs
+
+    def _get_cached_outputs(self, requests: List[Tuple[Any, str]],
+                            input_samples: np.ndarray,
+                            data_format: str) -> List[np.ndarray]:
+        """Get the values for a list of (layer_id, kind) pairs, taking values
+        from the cache where possible. All values that are not cached are
+        computed in a single call of `_compute_outputs`.
+        """
+        cache = self._activation_cache
+        input_digest = array_digest(input_samples)
+        keys = [cache.make_key(input_digest, layer_id, data_format, kind)
+                for layer_id, kind in requests]
+        outputs = [cache.get(key) for key in keys]
+
+        missing = [idx for idx, output in enumerate(outputs) if output is None]
+        store = self._activation_store
+        if store is not None and any(requests[idx][1] == 'activation' for idx in missing):
+            # Serve activations from the store, which returns views into memory maps.
+            digests = store.sample_digests(self, input_samples, data_format)
+            for idx in missing:
+                layer_id, kind = requests[idx]
+                if kind == 'activation':
+                    outputs[idx] = store.get(self, layer_id, data_format, digests)
+            missing = [idx for idx in missing if outputs[idx] is None]
+
+        if missing:
+            # Transform the input_sample appropriate for the loaded_network.
+            input_samples = self._transform_input(input_samples, data_format)
+            computed = self._compute_outputs([requests[idx] for idx in missing], input_samples)
+            for idx, output in zip(missing, computed):
+                # Transform the output to stick to the canocial interface.
+                outputs[idx] = self._transform_outputs(output, data_format)
+                cache.put(keys[idx], outputs[idx])
+        return outputs
+
     def _transform_input(self, inputs: np.ndarray, data_format: str) -> np.ndarray:
         """Fills up the ranks of the input, e.g. if no batch size was specified and
         converts the input to the data format of the model.
@@ -312,7 +677,7 @@ class Network:
             ## Only width and height, so we will add the channel information
             ## from the loaded_network input.
             input_shape = (1, *input_shape, network_input_channels)
-        elif len(input_shape.shape) == 3:
+        elif len(input_shape) == 3:
             if input_shape[-1] == network_input_channels:
                 ## channel information is provided, add batch
                 input_shape = (1, *input_shape)
@@ -322,7 +687,7 @@ class Network:
         elif len(input_shape) != 4:
             raise ValueError('Incorrect input shape {}, len should be {}'
                              .format(input_shape, 4))
-        elif input_shape[-1] != input_network_input_channels:
+        elif input_shape[-1] != network_input_channels:
             raise ValueError('Invalid input shape {}: channels should be {}'
                              .format(input_shape, network_input_channels))
         return input_shape
@@ -403,6 +768,10 @@ class Network:
         return self.layer_dict[layer_id].weights
 
     def _get_layer_weights_shape(self, layer_id) -> tuple:
+        layer = self.layer_dict[layer_id]
+        if isinstance(layer, NeuralLayer):
+            # Use the static shape to avoid fetching the weights.
+            return layer.parameter_shapes[0]
         weights = self.get_layer_weights(layer_id)
         if weights is None:
             return None
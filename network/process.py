@@ -0,0 +1,302 @@
+"""A network running in a separate worker process.
+
+The network of a deep learning framework (TensorFlow session, Torch
+model, Caffe net) lives in a worker process, so that a crash or a long
+running forward pass holding the GIL does not affect the main (GUI)
+process. Computed values are transported back through a shared memory
+segment instead of being pickled and sent through a pipe. This needs
+Python 3.8 or newer.
+"""
+from typing import List
+
+import importlib
+import multiprocessing
+import threading
+import traceback
+import weakref
+from collections import OrderedDict
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Shared memory segments are available from Python 3.8 on.
+    shared_memory = None
+
+import numpy as np
+from frozendict import FrozenOrderedDict
+
+from . import Network as BaseNetwork
+from .layers.layers import Layer
+
+
+class RemoteLayer(Layer):
+    """Description of a layer of a network living in a worker process."""
+
+    def __init__(self, network, description: dict):
+        super().__init__(network)
+        self._description = description
+
+    @property
+    def input_shape(self):
+        return self._description['input_shape']
+
+    @property
+    def output_shape(self):
+        return self._description['output_shape']
+
+    @property
+    def info(self) -> OrderedDict:
+        return OrderedDict(self._description['info'])
+
+
+class Network(BaseNetwork):
+    """Network interface forwarding all computations to a network in a
+    worker process.
+
+    Each instance starts its own worker process, so several models can
+    be served in parallel. Computations of one instance are serialized.
+    """
+
+    # Size of the initial shared memory segment (16 MiB). The segment grows
+    # on demand.
+    _INITIAL_SEGMENT_SIZE = 16 * 2**20
+
+    def __init__(self, **kwargs):
+        """
+        Start the worker process and load the network in it.
+
+        Parameters
+        ----------
+        **kwargs
+            backend
+                The module implementing the network, e.g.
+                'network.keras_tensorflow'.
+            backend_args
+                Positional arguments for the network constructor (optional).
+            All other keyword arguments are passed on to the network
+            constructor in the worker process.
+        """
+        if shared_memory is None:
+            raise RuntimeError('A network in a worker process needs '
+                               'multiprocessing.shared_memory (Python 3.8 or newer).')
+        backend = kwargs.pop('backend')
+        backend_args = kwargs.pop('backend_args', ())
+        self._lock = threading.Lock()
+        # The resources are released by a finalizer, so that they do not
+        # outlive the network even if `close` is not called.
+        self._resources = {
+            'segment': shared_memory.SharedMemory(create=True, size=self._INITIAL_SEGMENT_SIZE)
+        }
+        # Input shapes completed by `_fill_up_ranks`.
+        self._input_shapes = {}
+
+        # Do not fork a process that may already hold framework and GUI threads.
+        context = multiprocessing.get_context('spawn')
+        self._connection, worker_connection = context.Pipe()
+        self._process = context.Process(target=_serve,
+                                        args=(worker_connection, backend, backend_args, kwargs),
+                                        daemon=True)
+        self._process.start()
+        worker_connection.close()
+        self._finalizer = weakref.finalize(self, _release, self._process,
+                                           self._connection, self._resources)
+
+        self._description = self._request('describe')
+        kwargs['data_format'] = self._description['data_format']
+        super().__init__(**kwargs)
+
+    def close(self) -> None:
+        """Stop the worker process and release the shared memory. This
+        happens as well when the network is garbage collected or the
+        interpreter exits."""
+        with self._lock:
+            self._finalizer()
+
+    @property
+    def _segment(self) -> 'shared_memory.SharedMemory':
+        """The shared memory segment the worker writes its outputs to."""
+        return self._resources['segment']
+
+    @_segment.setter
+    def _segment(self, segment: 'shared_memory.SharedMemory') -> None:
+        self._resources['segment'] = segment
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def fingerprint(self) -> str:
+        if self._fingerprint is None:
+            self._fingerprint = self._request('fingerprint')
+        return self._fingerprint
+
+    def _create_layer_dict(self) -> FrozenOrderedDict:
+        return FrozenOrderedDict((description['layer_id'], RemoteLayer(self, description))
+                                 for description in self._description['layers'])
+
+    def _has_net_input(self, layer_id) -> bool:
+        return self.layer_dict[layer_id]._description['has_net_input']
+
+    def _fill_up_ranks(self, inputs: np.ndarray) -> np.ndarray:
+        # Let the worker decide, as some networks determine their
+        # input shape only when seeing the first input. The answer only
+        # depends on the shape, so it is asked once per shape.
+        shape = self._input_shapes.get(inputs.shape)
+        if shape is None:
+            shape = self._input_shapes[inputs.shape] = self._request('fill_up_ranks', inputs.shape)
+        return inputs.reshape(shape)
+
+    def _compute_activations(self, layer_ids: list, input_samples: np.ndarray) -> List[np.ndarray]:
+        return self._compute_outputs([(layer_id, 'activation') for layer_id in layer_ids], input_samples)
+
+    def _compute_net_input(self, layer_ids: list, input_samples: np.ndarray) -> List[np.ndarray]:
+        return self._compute_outputs([(layer_id, 'net_input') for layer_id in layer_ids], input_samples)
+
+    def _compute_outputs(self, requests: list, input_samples: np.ndarray) -> List[np.ndarray]:
+        return self._request('compute', requests, input_samples)
+
+    def _request(self, *message):
+        """Send a request to the worker process and wait for the reply.
+
+        Raises
+        ------
+        RuntimeError
+            If the worker process failed to process the request.
+        """
+        with self._lock:
+            if not self._finalizer.alive:
+                raise RuntimeError('The worker process has been closed.')
+            self._connection.send(message + (self._segment.name,))
+            while True:
+                try:
+                    reply = self._connection.recv()
+                except EOFError:
+                    raise RuntimeError('The worker process died (exit code {}).'
+                                       .format(self._process.exitcode))
+                if reply[0] == 'resize':
+                    # The outputs do not fit into the segment: provide a larger one.
+                    self._segment.close()
+                    self._segment.unlink()
+                    self._segment = shared_memory.SharedMemory(create=True, size=reply[1])
+                    self._connection.send(('segment', self._segment.name))
+                elif reply[0] == 'error':
+                    raise RuntimeError('Error in worker process:\n' + reply[1])
+                elif reply[0] == 'outputs':
+                    # The worker overwrites the segment on the next request,
+                    # so the values are copied out while holding the lock.
+                    return [np.ndarray(shape, dtype, buffer=self._segment.buf, offset=offset).copy()
+                            for offset, shape, dtype in reply[1]]
+                else:
+                    return reply[1]
+
+
+def _release(process, connection, resources: dict) -> None:
+    """Stop the worker process and release the shared memory segment."""
+    try:
+        connection.send(('close',))
+    except (BrokenPipeError, OSError):
+        pass
+    process.join(timeout=5)
+    if process.is_alive():
+        process.terminate()
+    connection.close()
+    resources['segment'].close()
+    resources['segment'].unlink()
+
+
+# ---------------------- Worker process --------------------------------
+
+
+def _describe_layer(network, layer_id, layer) -> dict:
+    description = {
+        'layer_id': layer_id,
+        'has_net_input': network._has_net_input(layer_id)
+    }
+    for attribute in ('input_shape', 'output_shape'):
+        try:
+            description[attribute] = getattr(layer, attribute)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            description[attribute] = None
+    try:
+        description['info'] = list(layer.info.items())
+    except (AttributeError, NotImplementedError):
+        description['info'] = []
+    return description
+
+
+def _write_outputs(connection, segment, outputs: List[np.ndarray]):
+    """Write the outputs into the shared memory segment, asking for a larger
+    segment if necessary.
+
+    Returns
+    -------
+    The segment and the list of (offset, shape, dtype) describing the outputs.
+    """
+    outputs = [np.ascontiguousarray(output) for output in outputs]
+    # Align each array to 64 bytes.
+    offsets = []
+    size = 0
+    for output in outputs:
+        offsets.append(size)
+        size += -(-output.nbytes // 64) * 64
+    if size > segment.size:
+        segment.close()
+        connection.send(('resize', size))
+        _, name = connection.recv()
+        segment = shared_memory.SharedMemory(name=name)
+    layout = []
+    for offset, output in zip(offsets, outputs):
+        np.ndarray(output.shape, output.dtype, buffer=segment.buf, offset=offset)[...] = output
+        layout.append((offset, output.shape, output.dtype.str))
+    return segment, layout
+
+
+def _serve(connection, backend: str, backend_args: tuple, kwargs: dict) -> None:
+    """Main loop of the worker process."""
+    try:
+        network = importlib.import_module(backend).Network(*backend_args, **kwargs)
+    except Exception:
+        # Report the error on the first request.
+        error = traceback.format_exc()
+        network = None
+    segment = None
+    while True:
+        message = connection.recv()
+        command, arguments, segment_name = message[0], message[1:-1], message[-1]
+        if command == 'close':
+            break
+        if network is None:
+            connection.send(('error', error))
+            continue
+        try:
+            if command == 'describe':
+                description = {
+                    'data_format': network._data_format,
+                    'layers': [_describe_layer(network, layer_id, layer)
+                               for layer_id, layer in network.layer_dict.items()]
+                }
+                connection.send(('value', description))
+            elif command == 'fingerprint':
+                connection.send(('value', network.fingerprint))
+            elif command == 'fill_up_ranks':
+                shape, = arguments
+                inputs = np.broadcast_to(np.zeros((), dtype=np.uint8), shape)
+                connection.send(('value', network._fill_up_ranks(inputs).shape))
+            elif command == 'compute':
+                requests, input_samples = arguments
+                outputs = network._compute_outputs(requests, input_samples)
+                if segment is None or segment.name != segment_name:
+                    if segment is not None:
+                        segment.close()
+                    segment = shared_memory.SharedMemory(name=segment_name)
+                segment, layout = _write_outputs(connection, segment, outputs)
+                connection.send(('outputs', layout))
+            else:
+                connection.send(('error', 'Unknown command: {}'.format(command)))
+        except Exception:
+            connection.send(('error', traceback.format_exc()))
+    if segment is not None:
+        segment.close()
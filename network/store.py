@@ -0,0 +1,201 @@
+from typing import Any, List
+
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from .cache import array_digest
+
+
+class ActivationStore:
+    """A persistent on-disk store for the activations of a layer for a whole
+    dataset.
+
+    For every (model, layer, data_format) the activations are written to
+    an `.npy` file, that is later opened as a read-only memory map, so
+    that slices can be served without copying and without loading the
+    whole file. A second `.npy` file holds a digest for each sample,
+    which allows to find the row belonging to an input sample. The
+    directory contains a small JSON index describing the entries (file
+    names, shape, dtype, model fingerprint and data_format).
+
+    A store can be attached to a network via `Network.attach_store`.
+    `Network.get_activations` will then take the values from the store,
+    if all requested samples are contained in it.
+    """
+
+    _INDEX_FILE = 'index.json'
+
+    def __init__(self, directory: str):
+        """
+
+        Parameters
+        ----------
+        directory
+            The directory holding the store. It is created if it does
+            not exist.
+        """
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Opened memory maps and digest lookup tables, by entry key.
+        self._arrays = {}
+        self._rows = {}
+        self._index = self._read_index()
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @staticmethod
+    def _entry_key(fingerprint: str, layer_id: Any, data_format: str) -> str:
+        return '{}/{}/{}'.format(fingerprint, layer_id, data_format)
+
+    def contains(self, network, layer_id: Any, data_format: str='channels_last') -> bool:
+        """Check whether the store holds activations for a layer of the network."""
+        return self._entry_key(network.fingerprint, layer_id, data_format) in self._index['entries']
+
+    def write(self, network, layer_ids: Any, dataset: np.ndarray,
+              batch_size: int=64, data_format: str='channels_last') -> None:
+        """Compute the activations of one or more layers for a whole dataset
+        and write them to the store, replacing existing entries.
+
+        Parameters
+        ----------
+        network
+            The network to compute the activations with.
+        layer_ids
+            The layers the activations should be stored for. Single
+            layer_id or list of layer_ids.
+        dataset
+            The input samples, as accepted by `Network.iter_activations`.
+        batch_size
+            The number of samples fed to the network at once.
+        data_format: {'channels_last', 'channels_first'}
+            The format in which the data is provided and stored.
+        """
+        layer_ids, _ = network._force_list(layer_ids)
+        fingerprint = network.fingerprint
+        num_samples = len(dataset)
+        entries = [self._new_entry(fingerprint, layer_id, data_format) for layer_id in layer_ids]
+        arrays = [None] * len(layer_ids)
+        # Close memory maps of entries that are about to be overwritten.
+        with self._lock:
+            for layer_id in layer_ids:
+                key = self._entry_key(fingerprint, layer_id, data_format)
+                self._index['entries'].pop(key, None)
+                self._arrays.pop(key, None)
+                self._rows.pop(key, None)
+
+        for indices, activations in network.iter_activations(layer_ids, dataset,
+                                                             batch_size, data_format):
+            for idx, activation in enumerate(activations):
+                if arrays[idx] is None:
+                    shape = (num_samples, *activation.shape[1:])
+                    arrays[idx] = np.lib.format.open_memmap(self._path(entries[idx]['file']),
+                                                            mode='w+', dtype=activation.dtype,
+                                                            shape=shape)
+                arrays[idx][indices[0]:indices[-1] + 1] = activation
+
+        digests = np.array(self.sample_digests(network, dataset, data_format, batch_size), dtype='S40')
+        for entry, array in zip(entries, arrays):
+            if array is None:
+                continue
+            array.flush()
+            np.save(self._path(entry['digests']), digests)
+            entry['shape'] = list(array.shape)
+            entry['dtype'] = array.dtype.str
+            key = self._entry_key(fingerprint, entry['layer_id'], data_format)
+            with self._lock:
+                self._index['entries'][key] = entry
+        self._write_index()
+
+    def get(self, network, layer_id: Any, data_format: str,
+            digests: List[str]) -> np.ndarray:
+        """Get the stored activations for a list of samples.
+
+        Parameters
+        ----------
+        network
+            The network the activations were computed with.
+        layer_id
+            The layer the activations are requested for.
+        data_format: {'channels_last', 'channels_first'}
+            The data format of the activations.
+        digests
+            The digests of the samples, as computed by `sample_digests`.
+
+        Returns
+        -------
+        The activations or None, if the layer or any of the samples is
+        not contained in the store. If the samples occupy consecutive
+        rows in the store, the result is a view into the memory map.
+        """
+        key = self._entry_key(network.fingerprint, layer_id, data_format)
+        if key not in self._index['entries']:
+            return None
+        array, rows = self._open(key)
+        try:
+            indices = [rows[digest] for digest in digests]
+        except KeyError:
+            return None
+        if indices and indices == list(range(indices[0], indices[0] + len(indices))):
+            return array[indices[0]:indices[0] + len(indices)]
+        return array[indices]
+
+    @staticmethod
+    def sample_digests(network, input_samples: np.ndarray,
+                       data_format: str='channels_last',
+                       batch_size: int=1024) -> List[str]:
+        """Compute a digest for every sample in a batch of inputs. The inputs
+        are brought into canonical rank first, so that a sample gets the
+        same digest with or without a batch axis.
+        """
+        input_samples = network._fill_up_ranks(input_samples)
+        digests = []
+        for start in range(0, len(input_samples), batch_size):
+            batch = np.asarray(input_samples[start:start + batch_size])
+            digests.extend(array_digest(sample) for sample in batch)
+        return digests
+
+    def _open(self, key: str):
+        """Open the memory map and the digest lookup table of an entry."""
+        with self._lock:
+            if key not in self._arrays:
+                entry = self._index['entries'][key]
+                self._arrays[key] = np.load(self._path(entry['file']), mmap_mode='r')
+                digests = np.load(self._path(entry['digests']))
+                self._rows[key] = {digest.decode('ascii'): row for row, digest in enumerate(digests)}
+            return self._arrays[key], self._rows[key]
+
+    def _new_entry(self, fingerprint: str, layer_id: Any, data_format: str) -> dict:
+        # Layer ids may contain characters that are not allowed in file names.
+        name = '{}_{}_{}'.format(fingerprint[:16], re.sub(r'[^\w.-]', '_', str(layer_id)), data_format)
+        return {
+            'fingerprint': fingerprint,
+            'layer_id': layer_id,
+            'data_format': data_format,
+            'file': name + '.npy',
+            'digests': name + '_digests.npy'
+        }
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self._directory, filename)
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self._path(self._INDEX_FILE), 'r') as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return {'version': 1, 'entries': {}}
+
+    def _write_index(self) -> None:
+        # Write to a temporary file first, so that a crash does not leave a broken index.
+        tmp_path = self._path(self._INDEX_FILE + '.tmp')
+        with self._lock:
+            with open(tmp_path, 'w') as fp:
+                json.dump(self._index, fp, indent=2)
+            os.replace(tmp_path, self._path(self._INDEX_FILE))
@@ -8,6 +8,8 @@ from collections import OrderedDict
 from frozendict import FrozenOrderedDict
 
 from . import Network as BaseNetwork
+from .cache import LRUCache
+from .threads import current_policy
 from .exceptions import ParsingError
 from .layers.tensorflow_layers import TensorFlowLayer as Layer
 from .layers.tensorflow_layers import TensorFlowNeuralLayer as NeuralLayer
@@ -24,6 +26,9 @@ class NonMatchingLayerDefinition(Exception):
 class Network(BaseNetwork):
     """Network interface to TensorFlow."""
 
+    # Default number of compiled fetch callables kept.
+    _DEFAULT_MAX_CALLABLES = 32
+
     _OPERATION_TYPES = {
         'activation_functions': {'Relu',
                                  'Relu6',
@@ -106,20 +111,46 @@ class Network(BaseNetwork):
                     'Mul']
     }
 
+    # Operations that do not compute anything themselves (variables,
+    # constants, saving and restoring). They are not reported as unmatched.
+    _BOOKKEEPING_OP_TYPES = {'Const', 'Identity', 'NoOp', 'Placeholder', 'PlaceholderWithDefault',
+                             'Variable', 'VariableV2', 'VarHandleOp', 'ReadVariableOp',
+                             'Assign', 'AssignVariableOp', 'VarIsInitializedOp',
+                             'SaveV2', 'RestoreV2', 'SaveSlices', 'RestoreSlice', 'ShardedFilename',
+                             'MergeV2Checkpoints', 'StringJoin', 'Pack'}
+
     keras_name_regex = re.compile(r'(.)([A-Z][a-z0-9]+)')
 
     def __init__(self, **kwargs):
+        """
+        Load TensorFlow model.
+
+        Parameters
+        ----------
+        **kwargs
+            checkpoint
+                Path of the checkpoint to restore the model from.
+            session
+                A session holding the model (instead of a checkpoint).
+            max_callables
+                The number of compiled callables, one per distinct set
+                of fetched tensors, that are kept for reuse.
+        """
         checkpoint = kwargs.get('checkpoint', None)
         sess = kwargs.get('session', None)
         if checkpoint is not None and sess is None:
             # Restore the tensorflow model from a file.
-            self._sess = tf.Session()
+            self._sess = tf.Session(config=current_policy().session_config())
             saver = tf.train.import_meta_graph(checkpoint + '.meta', clear_devices=True)
             model_dir = os.path.split(checkpoint)[0]
             saver.restore(self._sess, tf.train.latest_checkpoint(model_dir))
         elif checkpoint is None and sess is not None:
             # Just store the session since the model is already there.
             self._sess = sess
+        # Assuming the first op is the input.
+        self._input_tensor = self._sess.graph.get_operations()[0].outputs[0]
+        # Callables for running the graph, keyed by the tuple of fetched tensors.
+        self._callables = LRUCache(kwargs.get('max_callables', self._DEFAULT_MAX_CALLABLES))
         # TensorFlow uses channels last as data format by default. This can however be changed
         # by the user.
         # TODO make this more flexible.
@@ -130,57 +161,111 @@ class Network(BaseNetwork):
         """Try to find the sequences in operations of the graph that
         match the idea of a layer.
 
+        The operations are scanned once. At each operation only the layer
+        definitions starting with the type of that operation are tried,
+        so the time is linear in the number of operations. Regions of
+        operations that are not part of any layer are recorded, see
+        `unmatched_regions`.
+
         Returns
         -------
         A mapping of layer_ids to layer objects.
         """
+        ops = self._sess.graph.get_operations()
+        layer_defs_by_type = self._layer_defs_by_first_type()
         layer_dict = OrderedDict()
         layer_counts = {layer_type: 0 for layer_type in self._LAYER_DEFS.keys()}
+        unmatched_regions = []
+        unmatched_ops = []
         op_idx = 0
-        while op_idx < len(self._sess.graph.get_operations()):
-
-            for layer_type, layer_def in self._LAYER_DEFS.items():
+        while op_idx < len(ops):
+            for layer_type, layer_def in layer_defs_by_type.get(ops[op_idx].type, ()):
                 try:
-                    matching_ops = self._match_layer_def(op_idx, layer_def)
-                    # Increment count for layer type.
-                    layer_counts[layer_type] += 1
-                    layer_name = '{}_{}'.format(self._to_keras_name(layer_type), layer_counts[layer_type])
-                    layer_dict[layer_name] = self._LAYER_TYPES_TO_CLASSES[layer_type](self, matching_ops)
-                    # If the layer definition was successfully
-                    # matched, advance the number of ops that were
-                    # matched. Don't try to match another layer
-                    # definition at the same op by breaking the for
-                    # loop.
-                    op_idx += len(layer_def) - 1
-                    break
+                    matching_ops = self._match_layer_def(ops, op_idx, layer_def)
                 except NonMatchingLayerDefinition:
                     continue
-            # Try to match at the next op.
-            op_idx += 1
+                # Increment count for layer type.
+                layer_counts[layer_type] += 1
+                layer_name = '{}_{}'.format(self._to_keras_name(layer_type), layer_counts[layer_type])
+                layer_dict[layer_name] = self._LAYER_TYPES_TO_CLASSES[layer_type](self, matching_ops)
+                if unmatched_ops:
+                    unmatched_regions.append(unmatched_ops)
+                    unmatched_ops = []
+                # If the layer definition was successfully matched, advance
+                # the number of ops that were matched. Don't try to match
+                # another layer definition at the same op.
+                op_idx += len(layer_def)
+                break
+            else:
+                unmatched_ops.append(ops[op_idx])
+                # Try to match at the next op.
+                op_idx += 1
+        if unmatched_ops:
+            unmatched_regions.append(unmatched_ops)
 
         if not layer_dict:
             raise ParsingError('Could not find any layers in TensorFlow graph.')
 
+        self._unmatched_regions = [region for region in unmatched_regions
+                                   if any(op.type not in self._BOOKKEEPING_OP_TYPES for op in region)]
         layer_dict = FrozenOrderedDict(layer_dict)
         return layer_dict
 
-    def _match_layer_def(self, op_idx: int, layer_def: dict) -> list:
+    @property
+    def unmatched_regions(self) -> list:
+        """Regions of consecutive operations of the graph that could not be
+        matched to any layer definition. Regions consisting only of
+        bookkeeping operations (variables, constants, saving) are left
+        out. Each region is a list of operations.
+        """
+        return self._unmatched_regions
+
+    def _layer_defs_by_first_type(self) -> dict:
+        """Index the layer definitions by the types their first operation
+        can have. The order of the definitions in `_LAYER_DEFS` is kept.
+
+        Returns
+        -------
+        A dict mapping operation types to lists of (layer_type, layer_def)
+        pairs, where layer_def is a list of sets of operation types.
+        """
+        layer_defs_by_type = {}
+        for layer_type, layer_def in self._LAYER_DEFS.items():
+            # A set describes a layer consisting of a single operation.
+            if isinstance(layer_def, set):
+                layer_def = [layer_def]
+            layer_def = [{op_group} if isinstance(op_group, str) else op_group
+                         for op_group in layer_def]
+            for op_type in layer_def[0]:
+                layer_defs_by_type.setdefault(op_type, []).append((layer_type, layer_def))
+        return layer_defs_by_type
+
+    @staticmethod
+    def _match_layer_def(ops: list, op_idx: int, layer_def: list) -> list:
         """Check whether the layer definition match the operations starting from a
         certain index.
 
         Parameters
         ----------
+        ops
+            The operations of the graph.
         op_idx
+            The index of the operation to start matching at.
         layer_def
+            A list of sets of operation types.
 
         Returns
         -------
+        The list of the matched operations.
 
+        Raises
+        ------
+        NonMatchingLayerDefinition
+            If the operations do not match the definition.
         """
-        ops = self._sess.graph.get_operations()
         matched_ops = []
         for i, op_group in enumerate(layer_def):
-            if ops[op_idx + i].type in op_group:
+            if op_idx + i < len(ops) and ops[op_idx + i].type in op_group:
                 matched_ops.append(ops[op_idx + i])
                 continue
             # The operation at this position is optional. This is only the case if we are dealing with a linear
@@ -208,19 +293,30 @@ class Network(BaseNetwork):
         -------
 
         """
-        # Get the tensors that actually hold the activations.
-        activation_tensors = []
-        for layer_id in layer_ids:
-            activation_tensors.append(self.layer_dict[layer_id].activation_tensor)
-        return self._feed_input(activation_tensors, input_samples)
+        return self._compute_outputs([(layer_id, 'activation') for layer_id in layer_ids], input_samples)
 
     def _compute_net_input(self, layer_ids: list, input_samples: np.ndarray):
-        net_input_tensors = []
-        for layer_id in layer_ids:
-            net_input_tensors.append(self.layer_dict[layer_id].net_input_tensor)
+        return self._compute_outputs([(layer_id, 'net_input') for layer_id in layer_ids], input_samples)
 
-        return self._feed_input(net_input_tensors, input_samples)
+    def _compute_outputs(self, requests: list, input_samples: np.ndarray) -> list:
+        # Get the tensors that actually hold the values and fetch them all in one run.
+        fetches = []
+        for layer_id, kind in requests:
+            layer = self.layer_dict[layer_id]
+            if kind == 'activation':
+                fetches.append(layer.activation_tensor)
+            else:
+                fetches.append(layer.net_input_tensor)
+        return self._feed_input(fetches, input_samples)
 
     def _feed_input(self, fetches: list, input_samples: np.ndarray):
-        network_input_tensor = self._sess.graph.get_operations()[0].outputs[0] # Assuming the first op is the input.
-        return self._sess.run(fetches=fetches, feed_dict={network_input_tensor: input_samples})
+        # Session.run only executes the subgraph the fetched tensors depend on,
+        # so fetching early layers does not compute the rest of the network.
+        # A callable compiles fetches and feeds once, which avoids the overhead
+        # of Session.run for repeated requests.
+        key = tuple(fetches)
+        run = self._callables.get(key)
+        if run is None:
+            run = self._sess.make_callable(list(fetches), feed_list=[self._input_tensor])
+            self._callables.put(key, run)
+        return run(input_samples)
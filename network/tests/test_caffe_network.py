@@ -119,6 +119,12 @@ class TestCaffeNetwork(TestCase):
         with self.assertRaises(AttributeError):
             self.loaded_network.layer_dict['conv2d_2'].pool_size
 
+    def test_activation_function(self):
+        self.assertEqual('relu', self.loaded_network.layer_dict['conv2d_2'].activation_function)
+        self.assertEqual('softmax', self.loaded_network.layer_dict['dense_2'].activation_function)
+        with self.assertRaises(AttributeError):
+            self.loaded_network.layer_dict['max_pooling2d_1'].activation_function
+
     # Test loaded_network functions.
 
     def test_get_activations(self):
@@ -145,6 +151,68 @@ class TestCaffeNetwork(TestCase):
         )
 
 
+    def test_get_all_activations(self):
+        input_image = self.data[0:1, :, :, np.newaxis]
+        activations, net_inputs = self.loaded_network.get_all_activations(input_image)
+        self.assertEqual(list(self.loaded_network.layer_dict.keys()), list(activations.keys()))
+        self.assertEqual(['conv2d_1', 'conv2d_2', 'dense_1', 'dense_2'], list(net_inputs.keys()))
+        self.assertTrue(
+            np.allclose(self.loaded_network.get_net_input('dense_2', input_image),
+                        net_inputs['dense_2'])
+        )
+        self.assertTrue(
+            np.allclose(self.loaded_network.get_activations('conv2d_2', input_image),
+                        activations['conv2d_2'])
+        )
+
+    def test_get_layer_outputs(self):
+        input_image = self.data[0:1, :, :, np.newaxis]
+        net_input, activation = self.loaded_network.get_layer_outputs('conv2d_1', input_image)
+        self.assertTrue(
+            np.allclose(self.loaded_network.get_net_input('conv2d_1', input_image), net_input)
+        )
+        self.assertTrue(
+            np.allclose(self.loaded_network.get_activations('conv2d_1', input_image), activation)
+        )
+
+    def test_padded_batches(self):
+        # Three samples are padded to a batch of four.
+        input_images = self.data[0:3, :, :, np.newaxis]
+        activations = self.loaded_network.get_activations('dense_2', input_images)
+        self.assertEqual(3, len(activations))
+        self.assertTrue(
+            np.allclose(self.loaded_network.get_activations('dense_2', input_images[1:2]),
+                        activations[1:2])
+        )
+
+    def test_replicas(self):
+        model_def = os.path.join(MODELS_DIRECTORY,
+                                 'example_caffe_network_deploy.prototxt')
+        model_weights = os.path.join(MODELS_DIRECTORY,'mnist.caffemodel')
+        network = CaffeNetwork(model_def=model_def, model_weights=model_weights,
+                               num_replicas=3, cache_size=0)
+        dataset = self.data[0:10, :, :, np.newaxis]
+        expected = self.loaded_network.get_activations('dense_2', dataset)
+        activations = np.concatenate([activations for _, activations in
+                                      network.iter_activations('dense_2', dataset, batch_size=3)])
+        self.assertTrue(np.allclose(expected, activations))
+
+    def test_forward_stops_at_deepest_requested_layer(self):
+        model_def = os.path.join(MODELS_DIRECTORY,
+                                 'example_caffe_network_deploy.prototxt')
+        model_weights = os.path.join(MODELS_DIRECTORY,'mnist.caffemodel')
+        network = CaffeNetwork(model_def=model_def, model_weights=model_weights)
+        recorder = ForwardRecorder(network._replicas.get())
+        network._replicas.put(recorder)
+        input_image = self.data[0:1, :, :, np.newaxis]
+        activations = network.get_activations('max_pooling2d_1', input_image)
+        # The ReLU computing the activation in place is run as well.
+        network.get_activations(['conv2d_1', 'conv2d_2'], input_image + 1)
+        network.get_net_input('dense_2', input_image + 2)
+        self.assertEqual(['max_pooling2d_1', 'relu_2', 'dense_2'], recorder.ends)
+        self.assertTrue(np.allclose(self.loaded_network.get_activations('max_pooling2d_1', input_image),
+                                    activations))
+
     def test_get_layer_input_shape(self):
         self.assertEqual((None, 13, 13, 32), self.loaded_network.get_layer_input_shape('conv2d_2'))
 
@@ -165,3 +233,17 @@ class TestCaffeNetwork(TestCase):
             )
         )
 
+
+
+class ForwardRecorder:
+    """Proxy of a caffe net recording the layers forward passes end at."""
+    def __init__(self, caffenet):
+        self._caffenet = caffenet
+        self.ends = []
+
+    def __getattr__(self, name):
+        return getattr(self._caffenet, name)
+
+    def forward(self, **kwargs):
+        self.ends.append(kwargs.get('end'))
+        return self._caffenet.forward(**kwargs)
@@ -55,6 +55,23 @@ class TestKerasTensorFlowNetwork(TestCase):
 
     # Test layer properties from layer dict.
 
+    def test_chunked_input(self):
+        input_images = self.data[0:5, :, :, np.newaxis]
+        network = self.loaded_network
+        fetches = [network.layer_dict['dense_2'].output]
+        expected = network._feed_input(fetches, input_images)[0]
+        # Other tests may have cached functions for other fetches before.
+        num_functions = len(network._functions)
+        batch_size = network._batch_size
+        try:
+            network._batch_size = 2
+            chunked = network._feed_input(fetches, input_images)[0]
+        finally:
+            network._batch_size = batch_size
+        self.assertTrue(np.allclose(expected, chunked))
+        # The chunks are fed to the function created for the unchunked call.
+        self.assertEqual(num_functions, len(network._functions))
+
     def test_layer_dict(self):
         # Check the names.
         self.assertEqual(list(self.loaded_network.layer_dict.keys()),
@@ -138,6 +155,12 @@ class TestKerasTensorFlowNetwork(TestCase):
         with self.assertRaises(AttributeError):
             self.loaded_network.layer_dict['conv2d_2'].pool_size
 
+    def test_activation_function(self):
+        self.assertEqual('relu', self.loaded_network.layer_dict['conv2d_2'].activation_function)
+        self.assertEqual('softmax', self.loaded_network.layer_dict['dense_2'].activation_function)
+        with self.assertRaises(AttributeError):
+            self.loaded_network.layer_dict['max_pooling2d_1'].activation_function
+
     # Testing wrappers around layer properties.
 
     def test_get_layer_input_shape(self):
@@ -175,6 +198,7 @@ class TestKerasTensorFlowParser(TestCase):
 
         self.assertEqual(network.layer_dict['dense_1'].input, model.get_layer('dense_1').input)
         self.assertEqual(network.layer_dict['dense_1'].output, model.get_layer('activation_1').output)
+        self.assertEqual('sigmoid', network.layer_dict['dense_1'].activation_function)
 
 
     def test_missing_activation(self):
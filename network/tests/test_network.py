@@ -1,6 +1,9 @@
 from .conf import MODELS_DIRECTORY
 from unittest import TestCase
 
+import threading
+import time
+
 import numpy as np
 from frozendict import FrozenOrderedDict
 
@@ -9,6 +12,8 @@ from frozendict import FrozenOrderedDict
 # if not __package__: import __init__
 
 from network import Network as BaseNetwork
+from network import NeuralLayer
+from network.cache import LRUCache
 
 class MockLayer:
 
@@ -54,3 +59,241 @@ class TestBaseNetwork(TestCase):
         gray_channel_only_input = np.zeros((28, 30, 1))
         input_samples = self.network_last._fill_up_ranks(gray_channel_only_input)
         self.assertEqual((1, 28, 30, 1), input_samples.shape)
+
+
+class CountingNetwork(BaseNetwork):
+    """Mock network computing simple activations and counting the calls
+    of the computation functions."""
+    def __init__(self, **kwargs):
+        self.num_computations = 0
+        super().__init__(**kwargs)
+
+    def _create_layer_dict(self):
+        return FrozenOrderedDict([('layer_1', MockLayer(input_shape=(None, 4, 5, 1))),
+                                  ('layer_2', MockLayer(input_shape=(None, 4, 5, 1)))])
+
+    def _has_net_input(self, layer_id):
+        return layer_id == 'layer_2'
+
+    def _compute_activations(self, layer_ids, input_samples):
+        return self._compute_outputs([(layer_id, 'activation') for layer_id in layer_ids], input_samples)
+
+    def _compute_net_input(self, layer_ids, input_samples):
+        return self._compute_outputs([(layer_id, 'net_input') for layer_id in layer_ids], input_samples)
+
+    def _compute_outputs(self, requests, input_samples):
+        self.num_computations += 1
+        factors = {'layer_1': 1, 'layer_2': 2}
+        return [input_samples * factors[layer_id] - (kind == 'net_input')
+                for layer_id, kind in requests]
+
+
+class TestActivationCache(TestCase):
+    def setUp(self):
+        self.network = CountingNetwork(data_format='channels_last')
+        self.input_sample = np.arange(20, dtype='float32').reshape((1, 4, 5, 1))
+
+    def test_repeated_request_is_cached(self):
+        first = self.network.get_activations('layer_1', self.input_sample)
+        second = self.network.get_activations('layer_1', self.input_sample.copy())
+        self.assertEqual(1, self.network.num_computations)
+        self.assertTrue(np.all(first == second))
+        self.assertEqual(1, self.network.activation_cache.hits)
+        self.assertEqual(1, self.network.activation_cache.misses)
+
+    def test_kind_and_input_are_part_of_key(self):
+        self.network.get_activations('layer_1', self.input_sample)
+        self.network.get_net_input('layer_1', self.input_sample)
+        self.network.get_activations('layer_1', self.input_sample + 1)
+        self.assertEqual(3, self.network.num_computations)
+
+    def test_only_missing_layers_are_computed(self):
+        self.network.get_activations('layer_1', self.input_sample)
+        activations = self.network.get_activations(['layer_1', 'layer_2'], self.input_sample)
+        self.assertEqual(2, self.network.num_computations)
+        self.assertTrue(np.all(activations[0] == self.input_sample))
+        self.assertTrue(np.all(activations[1] == 2 * self.input_sample))
+
+    def test_invalidate_cache(self):
+        self.network.get_activations('layer_1', self.input_sample)
+        self.network.invalidate_cache()
+        self.network.get_activations('layer_1', self.input_sample)
+        self.assertEqual(2, self.network.num_computations)
+
+    def test_memory_budget(self):
+        network = CountingNetwork(data_format='channels_last',
+                                  cache_size=self.input_sample.nbytes)
+        network.get_activations('layer_1', self.input_sample)
+        network.get_activations('layer_1', self.input_sample + 1)
+        self.assertEqual(1, len(network.activation_cache))
+        self.assertLessEqual(network.activation_cache.num_bytes, self.input_sample.nbytes)
+        # The first entry has been evicted.
+        network.get_activations('layer_1', self.input_sample)
+        self.assertEqual(3, network.num_computations)
+
+
+class TestLRUCache(TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(['a', 'c'], [key for key in ('a', 'b', 'c') if key in cache])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+
+class TestGetAllActivations(TestCase):
+    def setUp(self):
+        self.network = CountingNetwork(data_format='channels_last')
+        self.input_sample = np.arange(20, dtype='float32').reshape((1, 4, 5, 1))
+
+    def test_single_forward_pass(self):
+        activations, net_inputs = self.network.get_all_activations(self.input_sample)
+        self.assertEqual(1, self.network.num_computations)
+        self.assertEqual(['layer_1', 'layer_2'], list(activations.keys()))
+        self.assertEqual(['layer_2'], list(net_inputs.keys()))
+        self.assertTrue(np.all(net_inputs['layer_2'] == 2 * self.input_sample - 1))
+
+    def test_without_net_input(self):
+        activations = self.network.get_all_activations(self.input_sample, include_net_input=False)
+        self.assertEqual(['layer_1', 'layer_2'], list(activations.keys()))
+        # The values are now cached for the individual layers.
+        self.network.get_activations('layer_2', self.input_sample)
+        self.assertEqual(1, self.network.num_computations)
+
+
+class TestGetLayerOutputs(TestCase):
+    def setUp(self):
+        self.network = CountingNetwork(data_format='channels_last')
+        self.input_sample = np.arange(20, dtype='float32').reshape((1, 4, 5, 1))
+
+    def test_single_forward_pass(self):
+        net_input, activation = self.network.get_layer_outputs('layer_2', self.input_sample)
+        self.assertEqual(1, self.network.num_computations)
+        self.assertTrue(np.all(net_input == 2 * self.input_sample - 1))
+        self.assertTrue(np.all(activation == 2 * self.input_sample))
+
+    def test_list_of_layers(self):
+        activations, = self.network.get_layer_outputs(['layer_1', 'layer_2'], self.input_sample,
+                                                       kinds=('activation',))
+        self.assertEqual(2, len(activations))
+        self.assertTrue(np.all(activations[0] == self.input_sample))
+
+    def test_layer_without_net_input(self):
+        with self.assertRaises(ValueError):
+            self.network.get_layer_outputs('layer_1', self.input_sample)
+
+    def test_mixed_kinds(self):
+        activation, net_input = self.network.get_outputs([('layer_1', 'activation'), ('layer_2', 'net_input')],
+                                                         self.input_sample, use_cache=False)
+        self.assertEqual(1, self.network.num_computations)
+        self.assertTrue(np.all(activation == self.input_sample))
+        self.assertTrue(np.all(net_input == 2 * self.input_sample - 1))
+        with self.assertRaises(ValueError):
+            self.network.get_outputs([('layer_1', 'net_input')], self.input_sample)
+
+
+class TestIterActivations(TestCase):
+    def setUp(self):
+        self.network = CountingNetwork(data_format='channels_last')
+        self.dataset = np.arange(7 * 20, dtype='float32').reshape((7, 4, 5, 1))
+
+    def test_batches(self):
+        chunks = list(self.network.iter_activations('layer_2', self.dataset, batch_size=3))
+        self.assertEqual([3, 3, 1], [len(indices) for indices, _ in chunks])
+        indices = np.concatenate([indices for indices, _ in chunks])
+        activations = np.concatenate([activations for _, activations in chunks])
+        self.assertTrue(np.all(indices == np.arange(7)))
+        self.assertTrue(np.all(activations == 2 * self.dataset))
+        # The scan does not populate the activation cache.
+        self.assertEqual(0, len(self.network.activation_cache))
+
+    def test_list_of_layers(self):
+        indices, activations = next(self.network.iter_activations(['layer_1', 'layer_2'],
+                                                                  self.dataset, batch_size=4))
+        self.assertEqual(2, len(activations))
+        self.assertEqual((4, 4, 5, 1), activations[0].shape)
+
+    def test_empty_dataset(self):
+        self.assertEqual([], list(self.network.iter_activations('layer_1', self.dataset[:0])))
+
+    def test_concurrent_forward_passes_are_limited(self):
+        network = ConcurrencyProbingNetwork(data_format='channels_last')
+        list(network.iter_activations('layer_1', self.dataset, batch_size=1))
+        self.assertEqual(1, network.max_running)
+
+
+class ConcurrencyProbingNetwork(CountingNetwork):
+    """Mock network recording the maximal number of forward passes
+    running at the same time."""
+    def __init__(self, **kwargs):
+        self._lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        super().__init__(**kwargs)
+
+    def _compute_activations(self, layer_ids, input_samples):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        try:
+            return super()._compute_activations(layer_ids, input_samples)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+class TestPrefetchActivations(TestCase):
+    def setUp(self):
+        self.network = CountingNetwork(data_format='channels_last')
+        self.dataset = np.arange(5 * 20, dtype='float32').reshape((5, 4, 5, 1))
+
+    def test_prefetched_samples_are_cached(self):
+        self.network.prefetch_activations('layer_2', self.dataset[[0, 1, 3]])
+        self.assertEqual(1, self.network.num_computations)
+        activations = self.network.get_activations('layer_2', self.dataset[3:4])
+        self.assertEqual(1, self.network.num_computations)
+        self.assertTrue(np.all(activations == 2 * self.dataset[3:4]))
+
+    def test_cached_samples_are_skipped(self):
+        self.network.prefetch_activations('layer_1', self.dataset[0:2])
+        self.network.prefetch_activations('layer_1', self.dataset[0:2])
+        self.assertEqual(1, self.network.num_computations)
+
+
+class CountingNeuralLayer(NeuralLayer):
+    """Mock layer counting how often the parameters are fetched."""
+    def __init__(self, network):
+        super().__init__(network)
+        self.num_fetches = 0
+
+    def _fetch_parameters(self):
+        self.num_fetches += 1
+        return (np.ones((3, 2)), np.zeros(2))
+
+
+class TestParameterSnapshot(TestCase):
+    def setUp(self):
+        self.network = CountingNetwork(data_format='channels_last')
+        self.layer = CountingNeuralLayer(self.network)
+        self.network.layer_dict = FrozenOrderedDict(dense=self.layer)
+
+    def test_parameters_are_fetched_once(self):
+        self.assertEqual((3, 2), self.network.get_layer_weights('dense').shape)
+        self.assertEqual((2,), self.network.get_layer_biases('dense').shape)
+        self.assertEqual(1, self.layer.num_fetches)
+        self.assertFalse(self.layer.weights.flags.writeable)
+
+    def test_invalidate_cache_refetches(self):
+        self.layer.parameters
+        self.network.invalidate_cache()
+        self.layer.parameters
+        self.assertEqual(2, self.layer.num_fetches)
+
+    def test_num_parameters(self):
+        self.assertEqual(8, self.network.get_layer_number_of_parameters('dense'))
@@ -0,0 +1,67 @@
+from .conf import MODELS_DIRECTORY
+from unittest import TestCase, skipUnless
+
+import gc
+
+import numpy as np
+
+from network.process import Network as ProcessNetwork, shared_memory
+from .test_network import CountingNetwork
+
+# The worker process looks up the class `Network` in the backend module.
+Network = CountingNetwork
+
+
+@skipUnless(shared_memory, 'multiprocessing.shared_memory needs Python 3.8 or newer')
+class TestProcessNetwork(TestCase):
+    def setUp(self):
+        self.network = ProcessNetwork(backend=__name__, data_format='channels_last')
+        self.input_sample = np.arange(20, dtype='float32').reshape((1, 4, 5, 1))
+
+    def tearDown(self):
+        self.network.close()
+
+    def test_layers_are_described(self):
+        self.assertEqual(['layer_1', 'layer_2'], self.network.layer_ids)
+        self.assertEqual((None, 4, 5, 1), tuple(self.network.layer_dict['layer_1'].input_shape))
+        self.assertTrue(self.network._has_net_input('layer_2'))
+
+    def test_activations_are_computed_in_worker(self):
+        activations, net_inputs = self.network.get_all_activations(self.input_sample)
+        self.assertTrue(np.all(activations['layer_2'] == self.input_sample * 2))
+        self.assertTrue(np.all(net_inputs['layer_2'] == self.input_sample * 2 - 1))
+
+    def test_segment_grows(self):
+        self.network._segment.close()
+        self.network._segment.unlink()
+        self.network._segment = type(self.network._segment)(create=True, size=64)
+        input_samples = np.ones((10, 4, 5, 1), dtype='float32')
+        activation = self.network.get_activations('layer_1', input_samples)
+        self.assertTrue(np.all(activation == input_samples))
+        self.assertGreaterEqual(self.network._segment.size, input_samples.nbytes)
+
+    def test_worker_errors_are_reported(self):
+        with self.assertRaises(RuntimeError):
+            self.network._compute_outputs([('no_layer', 'activation')], self.input_sample)
+
+    def test_input_shapes_are_requested_once(self):
+        requests = []
+        request = self.network._request
+
+        def counting_request(*message):
+            requests.append(message[0])
+            return request(*message)
+
+        self.network._request = counting_request
+        self.network.get_activations('layer_1', self.input_sample)
+        self.network.get_activations('layer_1', self.input_sample + 1)
+        self.assertEqual(1, requests.count('fill_up_ranks'))
+
+    def test_resources_are_released_when_dropped(self):
+        network = ProcessNetwork(backend=__name__, data_format='channels_last')
+        process, segment_name = network._process, network._segment.name
+        del network
+        gc.collect()
+        self.assertFalse(process.is_alive())
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=segment_name)
@@ -0,0 +1,45 @@
+from .conf import MODELS_DIRECTORY
+from unittest import TestCase
+
+import tempfile
+import numpy as np
+
+from network.store import ActivationStore
+from .test_network import CountingNetwork
+
+
+class TestActivationStore(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.network = CountingNetwork(data_format='channels_last', cache_size=0)
+        self.dataset = np.arange(7 * 20, dtype='float32').reshape((7, 4, 5, 1))
+        store = ActivationStore(self.directory.name)
+        store.write(self.network, ['layer_1', 'layer_2'], self.dataset, batch_size=3)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reopened_store_serves_activations(self):
+        # Open the store again, as when restarting the application.
+        store = ActivationStore(self.directory.name)
+        self.assertTrue(store.contains(self.network, 'layer_2'))
+        self.network.attach_store(store)
+        num_computations = self.network.num_computations
+        activations = self.network.get_activations('layer_2', self.dataset[2:4])
+        self.assertEqual(num_computations, self.network.num_computations)
+        self.assertTrue(np.all(activations == 2 * self.dataset[2:4]))
+        # Consecutive samples are served as a view into the memory map.
+        self.assertIsInstance(activations.base, np.memmap)
+
+    def test_unknown_sample_is_computed(self):
+        self.network.attach_store(ActivationStore(self.directory.name))
+        num_computations = self.network.num_computations
+        activations = self.network.get_activations('layer_1', self.dataset[0] + 1)
+        self.assertEqual(num_computations + 1, self.network.num_computations)
+        self.assertTrue(np.all(activations == self.dataset[0:1] + 1))
+
+    def test_single_sample_without_batch_axis(self):
+        store = ActivationStore(self.directory.name)
+        digests = store.sample_digests(self.network, self.dataset[5, :, :, 0])
+        activations = store.get(self.network, 'layer_1', 'channels_last', digests)
+        self.assertTrue(np.all(activations == self.dataset[5:6]))
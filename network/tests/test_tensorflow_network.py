@@ -65,6 +65,65 @@ class TestTensorFlowNetwork(TestCase):
 
         # Test layer properties from layer dict.
 
+    def test_only_required_subgraph_is_run(self):
+        input_image = self.data[1:2, :, :, np.newaxis]
+        network = self.loaded_network
+        session = network._sess
+        run_metadata = tf.RunMetadata()
+
+        def traced_callable(fetches, feed_list):
+            # Run the fetches chosen by the network with tracing enabled.
+            def run(*feeds):
+                return session.run(fetches, feed_dict=dict(zip(feed_list, feeds)),
+                                   options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+                                   run_metadata=run_metadata)
+            return run
+
+        callables = network._callables
+        try:
+            network._callables = type(callables)(1)
+            session.make_callable = traced_callable
+            network.invalidate_cache()
+            network.get_activations('conv2d_1', input_image)
+        finally:
+            del session.make_callable
+            network._callables = callables
+        executed = {node.node_name for device in run_metadata.step_stats.dev_stats
+                    for node in device.node_stats}
+        self.assertIn(network.layer_dict['conv2d_1']._ops[0].name, executed)
+        for layer_id in ('conv2d_2', 'dense_1', 'dense_2'):
+            for op in network.layer_dict[layer_id]._ops:
+                self.assertNotIn(op.name, executed)
+
+    def test_unmatched_regions(self):
+        # Besides the layers, the example graph only holds bookkeeping and
+        # training operations (initializers, loss, gradients, optimizer).
+        regions = self.loaded_network.unmatched_regions
+        unmatched = [op for region in regions for op in region]
+        self.assertIn('loss/SoftmaxCrossEntropyWithLogits', [op.name for op in unmatched])
+        layer_like = [op.name for op in unmatched
+                      if op.type in {'Conv2D', 'MaxPool', 'MatMul', 'BiasAdd', 'Relu', 'Softmax'}
+                      and not op.name.startswith('gradients/')]
+        self.assertEqual([], layer_like)
+        # Regions of bookkeeping operations only are left out.
+        for region in regions:
+            self.assertTrue(any(op.type not in TensorFlowNetwork._BOOKKEEPING_OP_TYPES for op in region))
+
+    def test_unmatched_regions_report_unknown_ops(self):
+        graph = tf.Graph()
+        with graph.as_default():
+            inputs = tf.placeholder(tf.float32, (None, 8, 8, 1))
+            kernel = tf.constant(np.ones((3, 3, 1, 2), dtype='float32'))
+            bias = tf.constant(np.zeros(2, dtype='float32'))
+            convolution = tf.nn.relu(tf.nn.bias_add(tf.nn.conv2d(inputs, kernel, [1, 1, 1, 1], 'VALID'), bias))
+            unknown = tf.sin(convolution, name='unknown')
+            tf.nn.max_pool(unknown, [1, 2, 2, 1], [1, 2, 2, 1], 'VALID')
+        with tf.Session(graph=graph) as session:
+            network = TensorFlowNetwork(session=session)
+            self.assertEqual(['conv2d_1', 'max_pooling2d_1'], network.layer_ids)
+            self.assertEqual([['unknown']], [[op.name for op in region]
+                                             for region in network.unmatched_regions])
+
     def test_layer_dict(self):
         # Check the names.
         self.assertEqual(list(self.loaded_network.layer_dict.keys()),
@@ -167,6 +226,12 @@ class TestTensorFlowNetwork(TestCase):
         with self.assertRaises(AttributeError):
             self.loaded_network.layer_dict['conv2d_2'].pool_size
 
+    def test_activation_function(self):
+        self.assertEqual('relu', self.loaded_network.layer_dict['conv2d_2'].activation_function)
+        self.assertEqual('softmax', self.loaded_network.layer_dict['dense_2'].activation_function)
+        with self.assertRaises(AttributeError):
+            self.loaded_network.layer_dict['max_pooling2d_1'].activation_function
+
             # Testing wrappers around layer properties.
 
     def test_get_layer_input_shape(self):
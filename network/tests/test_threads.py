@@ -0,0 +1,72 @@
+from .conf import MODELS_DIRECTORY
+from unittest import TestCase
+
+import os
+import sys
+import types
+import warnings
+from unittest import mock
+
+import numpy as np
+
+from network import threads
+from network.threads import ThreadingPolicy, benchmark_policies, candidate_policies
+from .test_network import CountingNetwork
+
+
+class TestThreadingPolicy(TestCase):
+    def setUp(self):
+        self.environment = dict(os.environ)
+        self.policy = threads.current_policy()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environment)
+        threads._current_policy = self.policy
+
+    def test_apply(self):
+        policy = ThreadingPolicy(intra_op_threads=2, inter_op_threads=1)
+        policy.apply()
+        self.assertIs(policy, threads.current_policy())
+        self.assertEqual('2', os.environ['OPENBLAS_NUM_THREADS'])
+
+    def test_missing_threadpoolctl_warns(self):
+        with mock.patch.dict(sys.modules, {'threadpoolctl': None}):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                ThreadingPolicy(blas_threads=2).apply()
+        self.assertEqual(1, len(caught))
+        self.assertIn('threadpoolctl', str(caught[0].message))
+
+    def test_torch_interop_threads_warn(self):
+        def set_num_interop_threads(num_threads):
+            raise RuntimeError('parallel work has started')
+
+        torch = types.SimpleNamespace(set_num_threads=lambda num_threads: None,
+                                      set_num_interop_threads=set_num_interop_threads)
+        with mock.patch.dict(sys.modules, {'torch': torch}):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                ThreadingPolicy(intra_op_threads=2, inter_op_threads=2, blas_threads=0).apply()
+        self.assertEqual(1, len(caught))
+        self.assertIn('inter op', str(caught[0].message))
+
+    def test_candidates(self):
+        policies = candidate_policies(8)
+        self.assertIn(ThreadingPolicy(8, 1), policies)
+        self.assertNotIn(ThreadingPolicy(8, 2), policies)
+
+    def test_benchmark(self):
+        policies = [ThreadingPolicy(1, 1), ThreadingPolicy(2, 1)]
+        networks = []
+
+        def create_network():
+            networks.append(CountingNetwork(data_format='channels_last'))
+            return networks[-1]
+
+        input_samples = np.zeros((4, 4, 5, 1), dtype='float32')
+        policy, timings = benchmark_policies(create_network, input_samples, policies, repeat=2)
+        self.assertIn(policy, policies)
+        self.assertEqual(2, len(timings))
+        self.assertEqual(3, networks[0].num_computations)
+        self.assertIs(policy, threads.current_policy())
@@ -0,0 +1,99 @@
+from .conf import MODELS_DIRECTORY
+from unittest import TestCase, mock
+
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from network.torch import Network as TorchNetwork
+
+
+class TestTorchNetwork(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loaded_network = TorchNetwork(os.path.join(MODELS_DIRECTORY, 'example_torch_mnist_net.py'),
+                                          os.path.join(MODELS_DIRECTORY, 'example_torch_mnist_model.pth'),
+                                          input_shape=(28, 28))
+        cls.data = np.random.RandomState(0).rand(2, 28, 28, 1).astype('float32')
+
+    def test_forward_stops_at_deepest_requested_layer(self):
+        network = self.loaded_network
+        calls = []
+        handles = [network._get_layer(layer_id).register_forward_hook(
+                       lambda module, input, output, layer_id=layer_id: calls.append(layer_id))
+                   for layer_id in ('conv2', 'fc1', 'fc2')]
+        try:
+            network.get_layer_outputs('conv1', self.data, use_cache=False)
+            self.assertEqual([], calls)
+            network.get_layer_outputs(['conv1', 'fc1'], self.data, use_cache=False)
+            # The hook of the network stops the pass at fc1 before the hook
+            # registered here is called.
+            self.assertEqual(['conv2'], calls)
+        finally:
+            for handle in handles:
+                handle.remove()
+
+    def test_stopped_forward_gives_same_values(self):
+        network = self.loaded_network
+        early = network.get_layer_outputs('conv2', self.data, use_cache=False)
+        late = network.get_layer_outputs(['conv2', 'fc2'], self.data, use_cache=False)
+        for early_values, late_values in zip(early, late):
+            self.assertTrue(np.allclose(early_values, late_values[0]))
+
+
+class ConvNet(nn.Module):
+    """A small model whose forward pass works with any memory format."""
+    def __init__(self):
+        super().__init__()
+        self.conv1 = nn.Conv2d(1, 4, kernel_size=3)
+        self.conv2 = nn.Conv2d(4, 6, kernel_size=3, stride=2)
+        self.fc = nn.Linear(6 * 12 * 12, 10)
+
+    def forward(self, x):
+        x = F.relu(self.conv2(F.relu(self.conv1(x))))
+        return self.fc(torch.flatten(x, 1))
+
+
+class TestChannelsLast(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        torch.manual_seed(0)
+        model = ConvNet()
+        # The conversion to channels last changes the model in place.
+        channels_last_model = ConvNet()
+        channels_last_model.load_state_dict(model.state_dict())
+        cls.contiguous_network = TorchNetwork(model, input_shape=(28, 28))
+        cls.loaded_network = TorchNetwork(channels_last_model, input_shape=(28, 28),
+                                          memory_format='channels_last')
+        cls.data = np.random.RandomState(0).rand(2, 28, 28, 1).astype('float32')
+
+    def test_model_is_converted(self):
+        weight = self.loaded_network._get_layer('conv1').weight
+        self.assertTrue(weight.is_contiguous(memory_format=torch.channels_last))
+
+    def test_activations_are_contiguous_views(self):
+        activations, = self.loaded_network.get_layer_outputs('conv2', self.data, kinds=('activation',),
+                                                             use_cache=False)
+        self.assertEqual((2, 12, 12, 6), activations.shape)
+        self.assertTrue(activations.flags['C_CONTIGUOUS'])
+        self.assertFalse(activations.flags['OWNDATA'])
+
+    def test_same_values_as_contiguous(self):
+        layer_ids = ['conv1', 'conv2', 'fc']
+        expected = self.contiguous_network.get_activations(layer_ids, self.data)
+        for layer_id, values, reference in zip(layer_ids, self.loaded_network.get_activations(layer_ids, self.data),
+                                               expected):
+            self.assertTrue(np.allclose(reference, values, atol=1e-5), layer_id)
+
+    def test_unsupported_memory_format(self):
+        with self.assertRaises(ValueError):
+            TorchNetwork(ConvNet(), memory_format='channels_first')
+        # Older versions of torch do not know the memory format.
+        with mock.patch.dict(torch.__dict__):
+            del torch.channels_last
+            with self.assertRaises(ValueError):
+                TorchNetwork(ConvNet(), memory_format='channels_last')
@@ -0,0 +1,201 @@
+"""Control of the number of CPU threads used by the frameworks.
+
+TensorFlow, Torch and the BLAS library used by numpy and Caffe
+(OpenBLAS, MKL) each maintain their own thread pools. With default
+settings each of them tries to use all cores, so that they compete with
+each other on many-core machines. A `ThreadingPolicy` configures all of
+them consistently.
+
+The policy is applied by calling `ThreadingPolicy.apply`, which should
+happen before networks are created, as TensorFlow fixes its thread
+pools when a session is created. The BLAS libraries are limited at
+runtime with threadpoolctl. The environment variables OMP_NUM_THREADS
+etc. are set as well, but BLAS libraries only read them when they are
+loaded, which has already happened for numpy when this module is
+imported. Without threadpoolctl, the policy thus only affects
+libraries loaded later, and a warning is issued.
+"""
+from typing import Callable, List, Tuple
+
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+
+class ThreadingPolicy:
+    """The number of threads used for computations on the CPU. A value of 0
+    means to keep the default of the respective library.
+    """
+
+    _BLAS_ENVIRONMENT_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+    def __init__(self, intra_op_threads: int=0, inter_op_threads: int=0, blas_threads: int=None):
+        """
+
+        Parameters
+        ----------
+        intra_op_threads
+            Threads used to parallelize a single operation (TensorFlow
+            intra op parallelism, torch.set_num_threads).
+        inter_op_threads
+            Threads used to run independent operations in parallel
+            (TensorFlow inter op parallelism, torch interop threads).
+        blas_threads
+            Threads used by the BLAS library (numpy, Caffe). Defaults to
+            intra_op_threads.
+        """
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.blas_threads = intra_op_threads if blas_threads is None else blas_threads
+
+    def __repr__(self) -> str:
+        return 'ThreadingPolicy(intra_op_threads={}, inter_op_threads={}, blas_threads={})'.format(
+            self.intra_op_threads, self.inter_op_threads, self.blas_threads)
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, ThreadingPolicy) and
+                (self.intra_op_threads, self.inter_op_threads, self.blas_threads) ==
+                (other.intra_op_threads, other.inter_op_threads, other.blas_threads))
+
+    @property
+    def is_default(self) -> bool:
+        """Whether all libraries keep their default settings."""
+        return not (self.intra_op_threads or self.inter_op_threads or self.blas_threads)
+
+    def apply(self) -> None:
+        """Configure the libraries and make this the current policy, which is
+        used for TensorFlow sessions created by networks afterwards.
+        """
+        global _current_policy
+        _current_policy = self
+
+        if self.blas_threads:
+            # Only read by BLAS libraries loaded from now on.
+            for variable in self._BLAS_ENVIRONMENT_VARIABLES:
+                os.environ[variable] = str(self.blas_threads)
+            try:
+                from threadpoolctl import threadpool_limits
+            except ImportError:
+                warnings.warn('threadpoolctl is not installed, the number of threads of '
+                              'BLAS libraries that are already loaded (e.g. by numpy) '
+                              'can not be limited.', RuntimeWarning)
+            else:
+                threadpool_limits(limits=self.blas_threads)
+
+        # Only configure torch if it is in use, as importing it is expensive.
+        torch = sys.modules.get('torch')
+        if torch is not None:
+            if self.intra_op_threads:
+                torch.set_num_threads(self.intra_op_threads)
+            if self.inter_op_threads and hasattr(torch, 'set_num_interop_threads'):
+                try:
+                    torch.set_num_interop_threads(self.inter_op_threads)
+                except RuntimeError as error:
+                    # Can only be set before the first parallel work was started.
+                    warnings.warn('The torch inter op threads can not be set: {}'.format(error),
+                                  RuntimeWarning)
+
+    def session_config(self):
+        """A TensorFlow session configuration following this policy.
+
+        Returns
+        -------
+        tf.ConfigProto
+        """
+        import tensorflow as tf
+        return tf.ConfigProto(intra_op_parallelism_threads=self.intra_op_threads,
+                              inter_op_parallelism_threads=self.inter_op_threads)
+
+    @staticmethod
+    def add_arguments(parser) -> None:
+        """Add command line options for a policy to an argparse parser."""
+        parser.add_argument('--intra-op-threads', type=int, default=0,
+                            help='threads used to parallelize a single operation '
+                            '(0: framework default)')
+        parser.add_argument('--inter-op-threads', type=int, default=0,
+                            help='threads used to run independent operations in parallel '
+                            '(0: framework default)')
+        parser.add_argument('--blas-threads', type=int, default=None,
+                            help='threads used by the BLAS library '
+                            '(default: same as --intra-op-threads)')
+
+    @classmethod
+    def from_arguments(cls, args) -> 'ThreadingPolicy':
+        """Create a policy from parsed command line options, see `add_arguments`."""
+        return cls(args.intra_op_threads, args.inter_op_threads, args.blas_threads)
+
+
+_current_policy = ThreadingPolicy()
+
+
+def current_policy() -> ThreadingPolicy:
+    """The policy applied last (a default policy if none was applied)."""
+    return _current_policy
+
+
+def candidate_policies(num_cores: int=None) -> List[ThreadingPolicy]:
+    """Some reasonable policies for a machine with the given number of cores.
+
+    Parameters
+    ----------
+    num_cores
+        The number of cores. Defaults to the number of cores available.
+    """
+    num_cores = num_cores or os.cpu_count() or 1
+    intra_op_threads = sorted({1, max(1, num_cores // 4), max(1, num_cores // 2), num_cores})
+    return [ThreadingPolicy(intra, inter)
+            for intra in intra_op_threads for inter in (1, 2)
+            if intra * inter <= max(num_cores, 2)]
+
+
+def benchmark_policies(create_network: Callable, input_samples: np.ndarray,
+                       policies: List[ThreadingPolicy]=None,
+                       repeat: int=3) -> Tuple[ThreadingPolicy, List[Tuple[ThreadingPolicy, float]]]:
+    """Find the fastest threading policy for a model.
+
+    For every policy, the policy is applied, a network is created and the
+    time of a forward pass through the whole network is measured. The
+    policy found to be fastest is applied at the end.
+
+    Parameters
+    ----------
+    create_network
+        A function without arguments creating the network. A new network
+        is needed for every policy, as TensorFlow fixes the threads when
+        a session is created.
+    input_samples
+        The input used for the measurement, a batch as it would be fed
+        in practice.
+    policies
+        The policies to try. Defaults to `candidate_policies()`.
+    repeat
+        The number of measured forward passes per policy. The best
+        time is used.
+
+    Returns
+    -------
+    The fastest policy and a list of (policy, seconds) pairs for all
+    policies.
+    """
+    if policies is None:
+        policies = candidate_policies()
+    timings = []
+    for policy in policies:
+        policy.apply()
+        network = create_network()
+        # Bypass the activation cache by using the computation directly.
+        inputs = network._transform_input(input_samples, 'channels_last')
+        layer_ids = network.layer_ids[-1:]
+        network._compute_activations(layer_ids, inputs)  # warm up
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            network._compute_activations(layer_ids, inputs)
+            best = min(best, time.perf_counter() - start)
+        timings.append((policy, best))
+    fastest = min(timings, key=lambda timing: timing[1])[0]
+    fastest.apply()
+    return fastest, timings
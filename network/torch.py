@@ -2,14 +2,18 @@ from __future__ import absolute_import
 from typing import List
 
 from collections import OrderedDict
+from frozendict import FrozenOrderedDict
+import functools
+import hashlib
 import importlib.util
+import threading
 import numpy as np
 
 import torch
 import torch.nn as nn
-from torch.autograd import Variable
 
 from . import Network as BaseNetwork
+from .cache import array_digest
 
 
 ## FIXME[todo]: check docstrings
@@ -19,6 +23,11 @@ from . import Network as BaseNetwork
 ## FIXME[todo]: cuda activation (if available)
 
 
+class _ForwardComplete(Exception):
+    """Raised by the forward hook to stop a forward pass, once all
+    requested layers have been recorded."""
+
+
 class Network(BaseNetwork):
     """
     A class implmeenting the network interface (BaseNetwork)
@@ -32,18 +41,27 @@ class Network(BaseNetwork):
     * Torch does not store activation values. However, one can
       register hooks to be executed before or after the forward or
       backward propagation.  These hooks can be use to access and
-      store input and output values.
-    
-    * The nn.Module (layers) does not have a name. I store the
-      key by which they have been registered in the parent Module
-      under the property _name. These names will also function
-      as layer_id to identify individual layers from the outside.
+      store input and output values. A hook is registered once for
+      every layer when the network is created. It only records values
+      for the layers requested by the forward pass of the calling
+      thread, so several threads can use the network at the same time.
+
+    * The recorded outputs are handed out as numpy arrays sharing the
+      memory of the output tensors, without copying. Only if some
+      output is found to be modified in place later in the forward
+      pass (e.g. by ReLU(inplace=True)), the network switches to
+      copying the outputs. Conversion to channels last is done by
+      a view (see `convert_data_format`). With the memory format
+      'channels_last', this view is contiguous.
+
+    * The nn.Module (layers) does not have a name. The key by which
+      they have been registered in the parent Module is used as
+      layer_id to identify individual layers from the outside.
     """
 
     _model : nn.Module
     _input_shapes : dict = None
     _output_shapes : dict = None
-    _hooks : dict = {}
 
     def __init__(self, *args, **kwargs):
         """
@@ -53,6 +71,18 @@ class Network(BaseNetwork):
         ----------
         model_file
             Path to the .h5 model file.
+        **kwargs
+            memory_format: {'contiguous', 'channels_last'}
+                The memory format of the model and its 4D tensors.
+                With 'channels_last', activations can be provided in
+                channels last data format without copying. This needs
+                torch 1.5 or newer.
+
+        Raises
+        ------
+        ValueError
+            If the memory format is unknown or not supported by the
+            installed torch.
         """
 
         i = 0
@@ -100,10 +130,40 @@ class Network(BaseNetwork):
         # if self._use_cuda:
         #    self._model.cuda()
 
+        memory_format = kwargs.get('memory_format', 'contiguous')
+        if memory_format not in ('contiguous', 'channels_last'):
+            raise ValueError('Unknown memory format: {}'.format(memory_format))
+        self._channels_last = memory_format == 'channels_last'
+        if self._channels_last:
+            if not hasattr(torch, 'channels_last'):
+                raise ValueError('The memory format channels_last needs torch 1.5 or newer.')
+            self._model = self._model.to(memory_format=torch.channels_last)
+        # Whether the outputs have to be copied in the hook, as they
+        # are modified in place later in the forward pass.
+        self._copy_outputs = False
+
+        ## Torch convolution follows the channel first scheme.
+        kwargs['data_format'] = 'channels_first'
+        super().__init__(**kwargs)
+
+        # The layers recorded by the forward pass of each thread.
+        self._local = threading.local()
+        # Guards the computation of the layer shapes.
+        self._shape_lock = threading.Lock()
+        self._hook_handles = [module.register_forward_hook(functools.partial(self._forward_hook, layer_id))
+                              for layer_id, module in self.layer_dict.items()]
+
         if 'input_shape' in kwargs:
             self._compute_layer_shapes(kwargs['input_shape'])
 
 
+    def _create_layer_dict(self) -> FrozenOrderedDict:
+        """Use the submodules of the model as layers. The name under which
+        a module is registered in the model is used as layer_id.
+        """
+        return FrozenOrderedDict(self._model._modules)
+
+
     def _compute_layer_shapes(self, input_shape : tuple) -> None:
         """Compute the input and output shapes of all layers.
         The shapes are determined by probagating some dummy input through
@@ -119,13 +179,18 @@ class Network(BaseNetwork):
         ## Torch convolution follows the channel first scheme, that is
         ## the shape of a 2D convolution is (batch, channel, height, width).
         torch_input_shape = tuple(input_shape[_] for _ in [0,3,1,2])
-        
-        self._input_shapes = {}
-        self._output_shapes = {}
-        self._prepare_hooks(self._shape_hook)
-        self._model(Variable(torch.zeros(*torch_input_shape), volatile=True))
-        self._remove_hooks()
-    
+
+        recorded = self._forward(torch.zeros(*torch_input_shape), self.layer_ids)
+        input_shapes = {}
+        output_shapes = {}
+        for layer_id, (input_shape, output, _) in recorded.items():
+            # Shapes will be (N, C, H, W) -> store (H ,W, C)
+            input_shapes[layer_id] = (*input_shape[2:], input_shape[1])
+            output_shape = tuple(output.size())
+            output_shapes[layer_id] = (*output_shape[2:], output_shape[1])
+        self._input_shapes = input_shapes
+        self._output_shapes = output_shapes
+
 
     def _get_number_of_input_channels(self) -> int:
         """Get the number of input channels for this network.
@@ -143,46 +208,52 @@ class Network(BaseNetwork):
         return first.in_channels if self.layer_is_convolutional(first) else 0
 
     
-    def _prepare_hooks(self, hook, layer_ids = None) -> None:
+    def _forward_hook(self, layer_id, module, input, output) -> None:
+        """Forward hook registered on every layer. It records the input
+        shape and the output of the layer, if the layer was requested by
+        the forward pass of the current thread.
+        """
+        recorded = getattr(self._local, 'recorded', None)
+        if recorded is not None and layer_id in recorded and recorded[layer_id] is None:
+            if self._copy_outputs:
+                output = output.clone()
+            # The version counter reveals later in-place modifications.
+            recorded[layer_id] = (tuple(input[0].size()), output, output._version)
+            self._local.remaining -= 1
+            if not self._local.remaining:
+                # There is no need to compute the remaining layers.
+                raise _ForwardComplete()
+
+    def _forward(self, torch_input: torch.Tensor, layer_ids: list) -> dict:
+        """Run a forward pass without tracking gradients and record the
+        input shapes and outputs of the given layers. The forward pass
+        is stopped as soon as all these layers have been recorded.
 
-        if layer_ids is None:
-            layer_ids = self.layer_ids
-    
-        for id in layer_ids:
-            module = self._model._modules[id]
-            module._name = id # FIXME[hack]: how to acces the module name?
-            self._hooks[id] = module.register_forward_hook(hook)
-            
-    def _remove_hooks(self, layer_ids = None) -> None:
-        if layer_ids is None:
-            layer_ids = list(self._hooks.keys())
-        for id in layer_ids:
-            self._hooks[id].remove()
-            del self._hooks[id]
-
-
-    def _shape_hook(self, module, input, output):
-        name = module._name # FIXME[hack]: how to acces the module name?
-        # input[0].size() will be (N, C, H, W) -> store (H ,W, C)
-        input_shape = input[0].size()
-        self._input_shapes[name] = (*input_shape[2:],input_shape[1])
-        # output.size() will be (N, C, H, W) -> store (C, H ,W)
-        output_shape = output.size()
-        self._output_shapes[name] = (*output_shape[2:],output_shape[1])
-        
-    def _activation_hook(self, module, input, output):
-        name = module._name # FIXME[hack]: how to acces the module name?
-        # output is a torch.autograd.variable.Variable,
-        # output.data holds the actual data
-        # FIXME[quesion]: it is said in the documentation, that
-        # the TorchTensor and the numpy array share the same memory.
-        # However, the TorchTensor may be removed after usage (is this true?)
-        # what will then happen with the numpy array? do we need to
-        # copy or is that a waste of resources?
-        self._activations[name] = output.data.numpy().copy()
-        if len(output.data.size()) == 4: # convolution, (N,C,H,W)
-            self._activations[name] = self._activations[name].transpose(0,2,3,1)
-        
+        Returns
+        -------
+        A dict mapping each layer_id to a triple (input_shape, output,
+        version) for that layer, where output is a tensor.
+        """
+        recorded = dict.fromkeys(layer_ids)
+        self._local.recorded = recorded
+        self._local.remaining = len(recorded)
+        try:
+            # torch.inference_mode would be cheaper, but inference
+            # tensors have no version counter.
+            with torch.no_grad():
+                self._model(torch_input)
+        except _ForwardComplete:
+            pass
+        finally:
+            self._local.recorded = None
+
+        if not self._copy_outputs and any(output._version != version
+                                          for _, output, version in recorded.values()):
+            # An output was overwritten by an in-place operation:
+            # copy the outputs from now on and repeat the computation.
+            self._copy_outputs = True
+            return self._forward(torch_input, layer_ids)
+        return recorded
 
     def _get_layer(self, layer_id) -> nn.Module:
         """Get a torch Module representing the layer for the given identifier.
@@ -211,18 +282,6 @@ class Network(BaseNetwork):
         return self._get_layer(self.layer_ids[0])
 
 
-    @property
-    def layer_ids(self) -> list:
-        """Get list of layer ids. These ids can be used to access layers via
-        this Network API.
-        
-        Returns
-        -------
-        The list of layer identifiers.
-        """
-        return list(self._model._modules.keys())
-
-
     def layer_is_convolutional(self, layer_id) -> bool:
         """Check if the given layer is a convolutional layer. If so,
         additional information can be obtained by the methods
@@ -477,68 +536,72 @@ class Network(BaseNetwork):
         
 
 
-    def get_activations(self, layer_ids, input_samples: np.ndarray) -> list:
-        """Gives activations values of the network/model
-        for a given layername and an input (inputsample).
-        Parameters
-        ----------
-        layer_ids: The layer(s) the activations should be fetched for,
-            either an atomic id or a list of ids.
-        input_samples:
-            Array of samples the activations should be computed for.
-            Default format is 4D: (batch,width,height,channel)
-            If batch or channel is 1, it can be omitted.
-
-        Returns
-        -------
-
+    @property
+    def fingerprint(self) -> str:
+        """A digest identifying the model, computed from the module
+        structure and the values in the state dict.
         """
-        ## We need to know the network input shape to get a cannonical
-        ## representation of the input_samples.
-        if self._input_shapes is None or self._output_shapes is None:
-            self._compute_layer_shapes(input_samples.shape)
-        
-        _layer_ids, _input_samples = \
-            super().get_activations(layer_ids, input_samples)
+        if self._fingerprint is None:
+            digest = hashlib.sha1(repr(self._model).encode('utf8'))
+            for name, tensor in self._model.state_dict().items():
+                digest.update(name.encode('utf8'))
+                digest.update(array_digest(tensor.cpu().numpy()).encode('utf8'))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
 
-        ## pytorch expects channel first (N,C,H,W)
-        # FIXME[concept]: we may want to directly get the preferred order
-        # from the _canonical_input_data method!
-        _input_samples = _input_samples.transpose((0,3,1,2))
 
-        torch_samples = torch.from_numpy(_input_samples)
-        torch_input =  Variable(torch_samples, volatile=True)
+    def _has_net_input(self, layer_id) -> bool:
+        return isinstance(self._get_layer(layer_id), (nn.Conv2d, nn.Linear))
 
-        ## FIXME[todo]: use GPU
-        # if self._use_cuda:
-        #    torch_input = torch_input.cuda()
-
-        ## prepare to record the activations
-        self._activations = {}
-        self._prepare_hooks(self._activation_hook, _layer_ids)
 
-        torch_output = self._model(torch_input)
-
-        self._remove_hooks(layer_ids)
+    def _fill_up_ranks(self, inputs: np.ndarray) -> np.ndarray:
+        """Bring the input samples into the canonical (N,H,W,C) form.
+        As torch networks do not know their input shape, the layer
+        shapes are determined from the first input that is seen.
+        """
+        ## We need to know the network input shape to get a cannonical
+        ## representation of the input_samples.
+        with self._shape_lock:
+            if self._input_shapes is None or self._output_shapes is None:
+                self._compute_layer_shapes(inputs.shape)
+        return inputs.reshape(self._canonical_input_shape(inputs.shape))
 
-        ## if no batch data was provided, remove batch dimension from
-        ## activations
-        if (_input_samples.shape[0] == 1
-            and len(input_samples.shape) < 4
-            and input_samples.shape[0] != 1):
-            for id in self._activations.keys():
-                self._activations[id] = self._activations[id].squeeze(0)
 
-        ## if a single layer_id was given (not a list), then just return
-        ## a single activtion array
-        return ([self._activations[_] for _ in layer_ids]
-                if isinstance(layer_ids, list)
-                else self._activations[layer_ids])
+    def _compute_activations(self, layer_ids: list, input_samples: np.ndarray) -> list:
+        return self._compute_outputs([(layer_id, 'activation') for layer_id in layer_ids], input_samples)
 
 
+    def _compute_net_input(self, layer_ids: list, input_samples: np.ndarray) -> list:
+        return self._compute_outputs([(layer_id, 'net_input') for layer_id in layer_ids], input_samples)
 
 
+    def _compute_outputs(self, requests: list, input_samples: np.ndarray) -> list:
+        """Compute values for all requested layers in one forward pass.
+        The output of a module is recorded by a forward hook. Activation
+        functions are usually not realized as modules in torch, so the
+        output of a module is used for both, activation and net input.
 
+        Parameters
+        ----------
+        requests:
+            List of (layer_id, kind) pairs.
+        input_samples:
+            Array of samples in channel first format (N,C,H,W).
+        """
+        layer_ids = list(OrderedDict.fromkeys(layer_id for layer_id, _ in requests))
 
+        # The input may be a channels last array with moved axes, which
+        # torch adopts without copying.
+        torch_input = torch.from_numpy(input_samples.astype(np.float32, copy=False))
+        if self._channels_last and torch_input.dim() == 4:
+            torch_input = torch_input.contiguous(memory_format=torch.channels_last)
 
+        ## FIXME[todo]: use GPU
+        # if self._use_cuda:
+        #    torch_input = torch_input.cuda()
 
+        recorded = self._forward(torch_input, layer_ids)
+        # The activations are provided channel first (N,C,H,W) as views
+        # on the output tensors. The conversion to the requested data
+        # format is done by the caller.
+        return [recorded[layer_id][1].numpy() for layer_id, _ in requests]
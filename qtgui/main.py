@@ -4,8 +4,8 @@ from PyQt5.QtCore import QCoreApplication
 from PyQt5.QtWidgets import QMainWindow, QTabWidget, QAction, QStatusBar
 from PyQt5.QtGui import QIcon
 
-#from qtgui.panels import ActivationsPanel, ExperimentsPanel, OcclusionPanel
-from qtgui.panels import ActivationsPanel, ExperimentsPanel
+from qtgui.panels import ActivationsPanel, ExperimentsPanel, OcclusionPanel
+from qtgui.worker import QComputeWorker
 
 # FIXME[todo]: add docstrings!
 
@@ -19,8 +19,16 @@ class DeepVisMainWindow(QMainWindow):
     switching between different panels, etc.
     '''
 
-    def __init__(self, network=None, data=None):
+    def __init__(self, network=None, data=None, heatmapStore=None):
+        '''Initialization of the DeepVisMainWindow.
+
+        Arguments
+        ---------
+        heatmapStore : HeatmapStore
+            A store for computed heatmaps, shared by the panels (optional).
+        '''
         super().__init__()
+        self.heatmapStore = heatmapStore
 
         # FIXME[matplotlib]: only needed if using matplotlib for ploting ...
         # prepare matplotlib for interactive plotting on the screen
@@ -57,14 +65,18 @@ class DeepVisMainWindow(QMainWindow):
         ##
         ## Initialize the panels
         ##
-        self.activations = ActivationsPanel()
+        # The worker computing activations etc. in the background,
+        # shared by all panels.
+        self.worker = QComputeWorker(self)
+
+        self.activations = ActivationsPanel(worker=self.worker)
         self.experiments = ExperimentsPanel()
-#        self.occlusion = OcclusionPanel()
+        self.occlusion = OcclusionPanel(worker=self.worker, store=self.heatmapStore)
 
         self.tabs = QTabWidget(self);
         self.tabs.addTab(self.activations, "Main")
         self.tabs.addTab(self.experiments, "Experiments")
-#        self.tabs.addTab(self.occlusion, "Occlusion")
+        self.tabs.addTab(self.occlusion, "Occlusion")
 
         self.setCentralWidget(self.tabs)
 
@@ -80,6 +92,8 @@ class DeepVisMainWindow(QMainWindow):
         ##
         self.activations.inputSelected.connect(self.setInputData)
         self.activations.layerSelected.connect(self.setLayer)
+        self.activations.statusMessage.connect(self.showStatusMessage)
+        self.occlusion.statusMessage.connect(self.showStatusMessage)
         #self.activations.networkSelected.connect(self.setNetwork)
 
 
@@ -88,11 +102,21 @@ class DeepVisMainWindow(QMainWindow):
         self.activations.addNetwork(network)
         self.activations.setInputData(data)
         self.experiments.setNetwork(network)
-#        self.occlusion.addNetwork(network)
-#        self.occlusion.setInputData(data)
+        self.occlusion.addNetwork(network)
+        self.occlusion.setInputData(data)
         self.update()
 
 
+    def closeEvent(self, event):
+        '''Stop the background computations when the window is closed.
+        Closing the panels stops the workers they created themselves.
+        '''
+        self.activations.close()
+        self.occlusion.close()
+        self.worker.stop()
+        super().closeEvent(event)
+
+
     def showStatusMessage(self, message):
         self.statusBar.showMessage(message, 2000)
 
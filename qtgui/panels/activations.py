@@ -5,6 +5,7 @@ from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QGroupBox, QSplitter
 from qtgui.widgets import QActivationView
 from qtgui.widgets import QInputSelector, QInputInfoBox, QImageView
 from qtgui.widgets import QNetworkView, QNetworkInfoBox
+from qtgui.worker import QComputeWorker
 
 # FIXME[todo]: rearrange the layer selection on network change!
 # FIXME[todo]: add docstrings!
@@ -23,19 +24,31 @@ class ActivationsPanel(QWidget):
     data : object = None
     dataIndex : int = None
 
+    # The number of samples before and after the current input, for
+    # which activations are computed speculatively.
+    prefetchDistance : int = 2
+
     inputSelected = pyqtSignal(object)
     layerSelected = pyqtSignal(object)
+    statusMessage = pyqtSignal(str)
 
     
-    def __init__(self, parent = None):
+    def __init__(self, parent = None, worker : QComputeWorker = None):
         '''Initialization of the ActivationsView.
 
         Arguments
         ---------
         parent : QWidget
             The parent argument is sent to the QWidget constructor.
+        worker : QComputeWorker
+            The worker computing the activations in the background.
+            If None, the panel creates its own worker.
         '''
         super().__init__(parent)
+        self._ownWorker = worker is None
+        self.worker = QComputeWorker(self) if worker is None else worker
+        self.worker.resultReady.connect(self.computationFinished)
+        self.worker.failed.connect(self.computationFailed)
         self.initUI()
         self.setNetwork()
         self.setInputData()
@@ -186,26 +199,67 @@ class ActivationsPanel(QWidget):
             self.networkinfo.setLayer(self.layer)
 
         ## We update the activation on every invocation, no matter if
-        ## the selected layer changed. This allows for some dynamics
-        ## if layers like dropout are involved. However, if such
-        ## layers do not exist, it will only waste computing power ...
+        ## the selected layer changed. Repeated requests for the same
+        ## input and layer are answered from the activation cache of
+        ## the network, so this does not trigger another forward pass.
         self.layerSelected.emit(layer)
         self.updateActivation()
 
 
     def updateActivation(self):
+        '''Request the activations for the current network, layer and
+        input. The activations are computed in the background and
+        displayed once they are available (see computationFinished).
+        '''
 
-        if self.network is None:
-            activations = None
-        elif self.layer is None:
-            activations = None
-        elif self.dataIndex is None:
-            activations = None
+        if self.network is None or self.layer is None or self.dataIndex is None:
+            self.worker.cancel(self)
+            self.activationview.setActivation(None)
         else:
             input = self.data[self.dataIndex:self.dataIndex+1,:,:,0:1]
-            activations = self.network.get_activations([self.layer], input)[0]
+            self.worker.submit(self, self.network.get_activations,
+                               [self.layer], input)
+            self.prefetchActivations()
+
+
+    def prefetchActivations(self):
+        '''Speculatively compute the activations of the current layer for
+        the neighbours of the current input, so that stepping through
+        the inputs is answered from the activation cache.
+        '''
+        if self.prefetchDistance > 0:
+            first = max(self.dataIndex - self.prefetchDistance, 0)
+            last = min(self.dataIndex + self.prefetchDistance, len(self.data) - 1)
+            indices = [index for index in range(first, last + 1)
+                       if index != self.dataIndex]
+            if indices:
+                self.worker.prefetch(self, self.network.prefetch_activations,
+                                     [self.layer], self.data[indices,:,:,0:1])
+
+
+    def computationFinished(self, channel, request_id : int, activations):
+        '''Display activations computed by the worker. Results of
+        outdated requests are ignored.
+        '''
+        if channel is self and self.worker.isLatest(channel, request_id):
+            self.activationview.setActivation(activations[0])
 
-        self.activationview.setActivation(activations)
+
+    def computationFailed(self, channel, request_id : int, error):
+        '''Clear the activations of a failed request, instead of
+        showing those of the previous input, and report the error.
+        '''
+        if channel is self and self.worker.isLatest(channel, request_id):
+            self.activationview.setActivation(None)
+            self.statusMessage.emit("Computing activations failed: {}".format(error))
+
+
+    def closeEvent(self, event):
+        '''Stop the worker, if it was created by this panel.
+        '''
+        if self._ownWorker:
+            self.worker.stop()
+        super().closeEvent(event)
 
 
     def setUnit(self, unit : int = None):
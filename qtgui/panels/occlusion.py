@@ -1,16 +1,34 @@
 import numpy as np
 
+from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtWidgets import QWidget
 from qtgui.widgets import QMatrixView
 from PyQt5.QtWidgets import QWidget, QPushButton, QLabel, QComboBox
-from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QGroupBox
-import matplotlib.pyplot as plt
+from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QGroupBox, QProgressBar
 from qtgui.widgets import QActivationView
 from qtgui.widgets import QInputSelector, QInputInfoBox, QImageView
 from qtgui.widgets import QNetworkView, QNetworkInfoBox
+from qtgui.worker import QComputeWorker
+from visualizations.occlusion import Occlusion
+from visualizations.store import HeatmapStore
 
 # FIXME[todo]: add docstrings!
 
+
+def occlusionSteps(occlusion : Occlusion, input_sample,
+                   store : HeatmapStore = None):
+    '''Compute an occlusion map chunk by chunk, yielding a snapshot
+    (heatmap, done, total) after each chunk. Snapshots are copies, as
+    they are displayed while the computation goes on. The completed
+    map is put into the store, if one is given.
+    '''
+    heatmap = None
+    for heatmap, done, total in occlusion.iterate(input_sample):
+        yield heatmap.copy(), done, total
+    if store is not None:
+        store.put(occlusion.network, input_sample, occlusion.parameters, heatmap)
+
+
 class OcclusionPanel(QWidget):
     '''This Panel is intended visualization of occlusion algorithm
     '''
@@ -20,16 +38,31 @@ class OcclusionPanel(QWidget):
     dataIndex : int = None
     layer : str = None
 
-    def __init__(self, parent = None):
+    statusMessage = pyqtSignal(str)
+
+    def __init__(self, parent = None, worker : QComputeWorker = None,
+                 store : HeatmapStore = None):
         '''Initialization of the ExperimentsView.
 
         Arguments
         ---------
         parent : QWidget
             The parent argument is sent to the QWidget constructor.
+        worker : QComputeWorker
+            The worker computing the occlusion maps in the background.
+            If None, the panel creates its own worker.
+        store : HeatmapStore
+            A store keeping computed occlusion maps, so that they are
+            shown instantly when a sample is selected again (optional).
         '''
 
         super().__init__(parent)
+        self._ownWorker = worker is None
+        self.worker = QComputeWorker(self) if worker is None else worker
+        self.store = store
+        self.worker.resultReady.connect(self.computationFinished)
+        self.worker.progress.connect(self.computationProgress)
+        self.worker.failed.connect(self.computationFailed)
         self.initUI()
         self.setNetwork()
         self.setInputData()
@@ -38,8 +71,11 @@ class OcclusionPanel(QWidget):
     def initUI(self):
         '''occlusion'''
         self.occlusionview=QImageView(self)
+        self.progressbar = QProgressBar(self)
+        self.progressbar.setVisible(False)
         occlusionLayout=QVBoxLayout()
         occlusionLayout.addWidget(self.occlusionview)
+        occlusionLayout.addWidget(self.progressbar)
         occlusionBox = QGroupBox("Oclussion")
         occlusionBox.setLayout(occlusionLayout)
 
@@ -145,23 +181,76 @@ class OcclusionPanel(QWidget):
             #self.setLayer(None)
 
     def updateOcclusion(self):
+        '''Request the occlusion map for the current input. The map is
+        computed in the background, chunk by chunk. Partial maps are
+        displayed as the chunks finish (see computationProgress). A
+        computation for a previous input is aborted.
+        '''
 
-        if self.network is None:
-            occlusion = None
-        elif self.dataIndex is None:
-            occlusion = None
+        if self.network is None or self.dataIndex is None:
+            self.worker.cancel(self)
+            self.progressbar.setVisible(False)
         else:
             input = self.data[self.dataIndex:self.dataIndex+1,:,:,0:1]
+            self.occlusionview.setImage(input[0,:,:,0])
+            self.occlusionview.setActivationMask(None)
+            self.progressbar.setValue(0)
+            self.progressbar.setVisible(True)
             #FIXME kernerlsize
-            slidingwindowsize=1
-            occlusion = self.network.get_occlussion_map(input, slidingwindowsize)
-
-
-        plt.imshow(occlusion[0,:,:,0],cmap='gray')
-        self.occlusionview.setImage(input[0,:,:,0])
+            occlusion = Occlusion(self.network, patch_size=3, fill_value=1.)
+            heatmap = (None if self.store is None else
+                       self.store.get(self.network, input, occlusion.parameters))
+            if heatmap is not None:
+                # Abort a computation for the previous input.
+                self.worker.cancel(self)
+                self.occlusionview.setActivationMask(self.heatmapMask(heatmap))
+                self.progressbar.setVisible(False)
+            else:
+                self.worker.submitJob(self, occlusionSteps, occlusion, input, self.store)
+
+    def computationProgress(self, channel, request_id : int, step):
+        '''Display a partial occlusion map and the progress of the
+        computation. Results of outdated requests are ignored.
+        '''
+        if channel is self and self.worker.isLatest(channel, request_id):
+            heatmap, done, total = step
+            self.progressbar.setMaximum(total)
+            self.progressbar.setValue(done)
+            self.occlusionview.setActivationMask(self.heatmapMask(heatmap))
+
+    def computationFinished(self, channel, request_id : int, step):
+        '''Display an occlusion map computed by the worker. Results of
+        outdated requests are ignored.
+        '''
+        if channel is self and self.worker.isLatest(channel, request_id):
+            heatmap, _, _ = step
+            self.occlusionview.setActivationMask(self.heatmapMask(heatmap))
+            self.progressbar.setVisible(False)
 
+    def computationFailed(self, channel, request_id : int, error):
+        '''Hide the progress of a failed computation and report the error.
+        '''
+        if channel is self and self.worker.isLatest(channel, request_id):
+            self.progressbar.setVisible(False)
+            self.statusMessage.emit("Computing the occlusion map failed: {}".format(error))
 
-        self.occlusionview.setActivationMask(occlusion[0,:,:,0])
+    def closeEvent(self, event):
+        '''Stop the worker, if it was created by this panel.
+        '''
+        if self._ownWorker:
+            self.worker.stop()
+        super().closeEvent(event)
+
+    @staticmethod
+    def heatmapMask(heatmap):
+        '''Scale the positive part of a heatmap (the regions whose
+        occlusion decreases the score) to a mask of uint8 values.
+        '''
+        heatmap = np.maximum(heatmap, 0)
+        maximum = heatmap.max()
+        if maximum > 0:
+            heatmap = heatmap * (255 / maximum)
+        return np.ascontiguousarray(heatmap, dtype=np.uint8)
 
     def setInput(self, input : int = None):
         '''Set the current input stimulus for the network.
@@ -0,0 +1,244 @@
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class _Job:
+    """A computation proceeding in steps, see `QComputeWorker.submitJob`."""
+
+    def __init__(self, function, args, kwargs):
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+        self._steps = None
+        self.result = None
+
+    def advance(self) -> bool:
+        """Compute the next step. Its result is stored in `result`.
+
+        Returns
+        -------
+        False if there was no further step, True otherwise.
+        """
+        if self._steps is None:
+            self._steps = iter(self._function(*self._args, **self._kwargs))
+        try:
+            self.result = next(self._steps)
+        except StopIteration:
+            return False
+        return True
+
+    def close(self) -> None:
+        """Abort the computation."""
+        close = getattr(self._steps, 'close', None)
+        if close is not None:
+            close()
+
+
+class QComputeWorker(QThread):
+    """A background thread performing expensive computations, like forward
+    passes through a network, so that the Qt event loop is never blocked.
+
+    Computations are submitted on a channel (any hashable object, usually
+    the panel submitting the request). Each channel has latest-wins
+    semantics: a new request replaces a request of the same channel
+    that has not been started yet, and results of requests that have
+    been superseded are dropped. Results are delivered by the
+    `resultReady` signal, which is received in the thread of the
+    connected object (usually the GUI thread).
+
+    Long computations can be submitted as jobs via `submitJob`. They
+    proceed in steps, report their progress, and can be cancelled
+    between two steps.
+
+    In addition, speculative computations (e.g. filling a cache with
+    values that will probably be requested soon) can be submitted via
+    `prefetch`. They are only processed if no regular request is
+    waiting, and their results are discarded.
+    """
+
+    resultReady = pyqtSignal(object, int, object)
+    """Emitted with (channel, request_id, result) when a computation has
+    finished and no newer request was submitted on that channel.
+    """
+
+    progress = pyqtSignal(object, int, object)
+    """Emitted with (channel, request_id, result) when a step of a job has
+    finished, with the result of that step.
+    """
+
+    failed = pyqtSignal(object, int, object)
+    """Emitted with (channel, request_id, exception) when a computation
+    raised an exception.
+    """
+
+    def __init__(self, parent=None):
+        '''Initialization of the QComputeWorker.
+
+        Arguments
+        ---------
+        parent : QObject
+            The parent argument is sent to the QThread constructor.
+        '''
+        super().__init__(parent)
+        self._condition = threading.Condition()
+        # Requests that are waiting to be processed, by channel.
+        self._pending = OrderedDict()
+        # Speculative requests, processed when nothing else is pending.
+        self._prefetching = OrderedDict()
+        # The id of the latest request for each channel.
+        self._latest = {}
+        self._counter = 0
+        self._stopped = False
+
+    def submit(self, channel, function, *args, **kwargs) -> int:
+        """Submit a computation. A pending request on the same channel is
+        discarded.
+
+        Arguments
+        ---------
+        channel
+            The channel (a hashable object) on which the result is reported.
+        function
+            The function to be called in the background thread.
+        *args, **kwargs
+            The arguments passed to the function.
+
+        Returns
+        -------
+        The id of the request.
+        """
+        with self._condition:
+            self._counter += 1
+            request_id = self._counter
+            self._pending.pop(channel, None)
+            self._pending[channel] = (request_id, function, args, kwargs)
+            self._latest[channel] = request_id
+            self._condition.notify()
+        if not self.isRunning():
+            self.start()
+        return request_id
+
+    def submitJob(self, channel, function, *args, **kwargs) -> int:
+        """Submit a computation proceeding in steps. The function has to
+        return an iterator (e.g. a generator), each item of which is the
+        result of one step. The results are reported by `progress`,
+        the last one also by `resultReady`.
+
+        A job is aborted after the current step if a new request is
+        submitted on its channel or the channel is cancelled. After each
+        step, pending requests of other channels are processed first, so
+        that a long job does not hold them up.
+
+        Arguments
+        ---------
+        channel
+            The channel (a hashable object) on which the results are reported.
+        function
+            The function returning the iterator, called in the background
+            thread.
+        *args, **kwargs
+            The arguments passed to the function.
+
+        Returns
+        -------
+        The id of the request.
+        """
+        return self.submit(channel, _Job(function, args, kwargs))
+
+    def prefetch(self, channel, function, *args, **kwargs) -> None:
+        """Submit a speculative computation with low priority. A pending
+        prefetch request on the same channel is discarded. The result of
+        the computation is not reported.
+        """
+        with self._condition:
+            self._prefetching.pop(channel, None)
+            self._prefetching[channel] = (function, args, kwargs)
+            self._condition.notify()
+        if not self.isRunning():
+            self.start()
+
+    def cancel(self, channel) -> None:
+        """Discard the pending request of a channel and drop the result of a
+        request of that channel that is currently computed.
+        """
+        with self._condition:
+            self._pending.pop(channel, None)
+            self._prefetching.pop(channel, None)
+            self._counter += 1
+            self._latest[channel] = self._counter
+
+    def isLatest(self, channel, request_id: int) -> bool:
+        """Check whether a request is the latest one submitted on its channel.
+        Receivers of `resultReady` should check this, as a newer request
+        may have been submitted while the signal was queued.
+        """
+        with self._condition:
+            return self._latest.get(channel) == request_id
+
+    def stop(self) -> None:
+        """Stop the worker thread after the current computation has finished."""
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._prefetching.clear()
+            self._condition.notify()
+        self.wait()
+
+    def run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._prefetching and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                if self._pending:
+                    channel, (request_id, function, args, kwargs) = self._pending.popitem(last=False)
+                else:
+                    channel, (function, args, kwargs) = self._prefetching.popitem(last=False)
+                    request_id = None
+
+            if request_id is None:
+                try:
+                    function(*args, **kwargs)
+                except Exception:
+                    # Errors show up again, and are reported, when the
+                    # values are actually requested.
+                    pass
+                continue
+
+            if isinstance(function, _Job):
+                self._step(channel, request_id, function)
+                continue
+
+            try:
+                result = function(*args, **kwargs)
+            except Exception as error:
+                self.failed.emit(channel, request_id, error)
+                continue
+
+            if self.isLatest(channel, request_id):
+                self.resultReady.emit(channel, request_id, result)
+
+    def _step(self, channel, request_id: int, job: _Job) -> None:
+        """Perform one step of a job and queue the job again, behind the
+        requests that are pending for other channels.
+        """
+        try:
+            proceeding = job.advance()
+        except Exception as error:
+            self.failed.emit(channel, request_id, error)
+            return
+
+        if not self.isLatest(channel, request_id):
+            job.close()
+        elif not proceeding:
+            self.resultReady.emit(channel, request_id, job.result)
+        else:
+            self.progress.emit(channel, request_id, job.result)
+            with self._condition:
+                if self._latest.get(channel) == request_id:
+                    self._pending[channel] = (request_id, job, (), {})
+                    return
+            job.close()
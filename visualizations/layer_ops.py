@@ -0,0 +1,220 @@
+"""Computation of single layers with numpy.
+
+The networks are evaluated by their frameworks. Some analyses however
+need to compute parts of a layer themselves, e.g. only a small spatial
+window of a convolution. The functions here operate on batches in
+channels last format (N,H,W,C) and compute 'valid' convolutions and
+poolings; padding is done by the caller, see `extract_window`.
+"""
+from typing import Callable, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+def _softmax(values: np.ndarray) -> np.ndarray:
+    exponentials = np.exp(values - values.max(axis=-1, keepdims=True))
+    return exponentials / exponentials.sum(axis=-1, keepdims=True)
+
+
+ACTIVATION_FUNCTIONS = {
+    'linear': lambda values: values,
+    'relu': lambda values: np.maximum(values, 0),
+    'relu6': lambda values: np.clip(values, 0, 6),
+    'elu': lambda values: np.where(values > 0, values, np.expm1(np.minimum(values, 0))),
+    'sigmoid': lambda values: 1 / (1 + np.exp(-values)),
+    'tanh': np.tanh,
+    'softplus': lambda values: np.logaddexp(values, 0),
+    'softsign': lambda values: values / (1 + np.abs(values)),
+    'softmax': _softmax
+}
+
+# Activation functions computed independently for every unit.
+ELEMENTWISE_ACTIVATION_FUNCTIONS = set(ACTIVATION_FUNCTIONS) - {'softmax'}
+
+
+def activation_function(name: str) -> Callable[[np.ndarray], np.ndarray]:
+    """The activation function of the given name, see `NeuralLayer.activation_function`.
+
+    Raises
+    ------
+    ValueError
+        If the activation function is not known.
+    """
+    try:
+        return ACTIVATION_FUNCTIONS[name]
+    except KeyError:
+        raise ValueError('Unknown activation function {}.'.format(name))
+
+
+def padding_amounts(input_size: int, output_size: int,
+                    kernel_size: int, stride: int) -> Tuple[int, int]:
+    """The padding before and after an input dimension that yields the given
+    output size. The padding is split as evenly as possible, putting
+    the additional pixel at the end. This agrees with the 'valid' and
+    'same' padding of TensorFlow and with Caffe's pooling.
+    """
+    total = max((output_size - 1) * stride + kernel_size - input_size, 0)
+    return total // 2, total - total // 2
+
+
+def layer_padding(layer, input_shape: Tuple[int, ...],
+                  output_shape: Tuple[int, ...]) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """The padding ((top, bottom), (left, right)) of a convolution or pooling
+    layer. It is taken from the padding of the layer, if that is
+    'valid', and otherwise inferred from the input and output shapes
+    (N,H,W,C), see `padding_amounts`. This also covers frameworks that
+    do not describe their padding as 'valid' or 'same'.
+    """
+    kernel_size = tuple(layer.kernel_size if hasattr(layer, 'kernel_size') else layer.pool_size)
+    strides = tuple(layer.strides)
+    try:
+        padding = layer.padding.lower()
+    except NotImplementedError:
+        padding = None
+    if padding == 'valid':
+        return (0, 0), (0, 0)
+    return tuple(padding_amounts(input_shape[axis + 1], output_shape[axis + 1],
+                                 kernel_size[axis], strides[axis])
+                 for axis in range(2))
+
+
+def extract_window(values: np.ndarray, top: int, bottom: int, left: int, right: int,
+                   fill_value: float=0.) -> np.ndarray:
+    """Cut the region [top:bottom, left:right] out of a batch (N,H,W,C). The
+    region may exceed the borders, in which case it is padded with the
+    fill value.
+    """
+    _, height, width, _ = values.shape
+    window = np.full((values.shape[0], bottom - top, right - left, values.shape[3]),
+                     fill_value, dtype=values.dtype)
+    inner_top, inner_bottom = max(top, 0), min(bottom, height)
+    inner_left, inner_right = max(left, 0), min(right, width)
+    if inner_top < inner_bottom and inner_left < inner_right:
+        window[:, inner_top - top:inner_bottom - top, inner_left - left:inner_right - left] = \
+            values[:, inner_top:inner_bottom, inner_left:inner_right]
+    return window
+
+
+def _patches(inputs: np.ndarray, kernel_size: Tuple[int, int], strides: Tuple[int, int]) -> np.ndarray:
+    """A view (N,H',W',C,KH,KW) of the kernel sized patches of a batch (N,H,W,C)."""
+    batch_size, height, width, channels = inputs.shape
+    output_height = (height - kernel_size[0]) // strides[0] + 1
+    output_width = (width - kernel_size[1]) // strides[1] + 1
+    batch_stride, row_stride, column_stride, channel_stride = inputs.strides
+    return as_strided(inputs,
+                      shape=(batch_size, output_height, output_width, channels) + tuple(kernel_size),
+                      strides=(batch_stride, row_stride * strides[0], column_stride * strides[1],
+                               channel_stride, row_stride, column_stride),
+                      writeable=False)
+
+
+def conv2d(inputs: np.ndarray, weights: np.ndarray, bias: np.ndarray,
+           strides: Tuple[int, int]=(1, 1)) -> np.ndarray:
+    """The net input of a 'valid' convolution.
+
+    Parameters
+    ----------
+    inputs
+        Batch (N,H,W,C_in).
+    weights
+        Kernel (KH,KW,C_in,C_out), see `conv2d_weights`.
+    bias
+        Bias (C_out,).
+    strides
+        The strides in height and width direction.
+    """
+    patches = _patches(inputs, weights.shape[:2], strides)
+    # Contracting (C,KH,KW) with the kernel amounts to im2col and a matrix product.
+    return np.tensordot(patches, weights.transpose(2, 0, 1, 3), axes=3) + bias
+
+
+def conv2d_backward(values: np.ndarray, weights: np.ndarray, strides: Tuple[int, int],
+                    input_size: Tuple[int, int]) -> np.ndarray:
+    """Distribute values given for the outputs of a 'valid' convolution
+    onto its inputs, weighted by the kernel (a transposed convolution).
+    This is the gradient of the convolution with respect to its input.
+
+    Parameters
+    ----------
+    values
+        Batch (N,H',W',C_out) in the shape of the convolution output.
+    weights
+        Kernel (KH,KW,C_in,C_out).
+    strides
+        The strides in height and width direction.
+    input_size
+        The height and width of the convolution input.
+
+    Returns
+    -------
+    Batch (N,H,W,C_in) in the shape of the convolution input.
+    """
+    kernel_height, kernel_width = weights.shape[:2]
+    batch_size, output_height, output_width, _ = values.shape
+    result = np.zeros((batch_size,) + tuple(input_size) + (weights.shape[2],),
+                      dtype=np.result_type(values, weights))
+    # The contribution (N,H',W',KH,KW,C_in) of each output to its receptive field,
+    # which is added to the input for one kernel position at a time (col2im).
+    contributions = np.tensordot(values, weights, axes=([3], [3]))
+    for row in range(kernel_height):
+        for column in range(kernel_width):
+            result[:, row:row + strides[0] * (output_height - 1) + 1:strides[0],
+                   column:column + strides[1] * (output_width - 1) + 1:strides[1]] += \
+                contributions[:, :, :, row, column]
+    return result
+
+
+def max_pool2d(inputs: np.ndarray, pool_size: Tuple[int, int],
+               strides: Tuple[int, int]) -> np.ndarray:
+    """'valid' max pooling of a batch (N,H,W,C)."""
+    return _patches(inputs, pool_size, strides).max(axis=(4, 5))
+
+
+def max_pool2d_backward(inputs: np.ndarray, values: np.ndarray, pool_size: Tuple[int, int],
+                        strides: Tuple[int, int]) -> np.ndarray:
+    """Route values given for the outputs of a 'valid' max pooling to the
+    input positions holding the maxima. This is the gradient of the
+    pooling with respect to its input.
+
+    Parameters
+    ----------
+    inputs
+        The input (N,H,W,C) of the pooling.
+    values
+        Batch (N,H',W',C) in the shape of the pooling output.
+    """
+    patches = _patches(inputs, pool_size, strides)
+    batch_size, output_height, output_width, channels = patches.shape[:4]
+    winners = patches.reshape(batch_size, output_height, output_width, channels, -1).argmax(axis=-1)
+    result = np.zeros(inputs.shape, dtype=values.dtype)
+    for row in range(pool_size[0]):
+        for column in range(pool_size[1]):
+            result[:, row:row + strides[0] * (output_height - 1) + 1:strides[0],
+                   column:column + strides[1] * (output_width - 1) + 1:strides[1]] += \
+                np.where(winners == row * pool_size[1] + column, values, 0)
+    return result
+
+
+def conv2d_weights(weights: np.ndarray, kernel_size: Tuple[int, int],
+                   in_channels: int, out_channels: int) -> np.ndarray:
+    """Bring convolution weights into the layout (KH,KW,C_in,C_out). The
+    frameworks use this layout (TensorFlow, Keras) or (C_out,C_in,KH,KW)
+    (Caffe), which is told apart by the shape.
+    """
+    if weights.shape == tuple(kernel_size) + (in_channels, out_channels):
+        return weights
+    if weights.shape == (out_channels, in_channels) + tuple(kernel_size):
+        return weights.transpose(2, 3, 1, 0)
+    raise ValueError('Unexpected shape {} of convolution weights.'.format(weights.shape))
+
+
+def dense_weights(weights: np.ndarray, in_units: int, out_units: int) -> np.ndarray:
+    """Bring dense weights into the layout (in_units, out_units). Caffe
+    stores them as (out_units, in_units).
+    """
+    if weights.shape == (in_units, out_units):
+        return weights
+    if weights.shape == (out_units, in_units):
+        return weights.T
+    raise ValueError('Unexpected shape {} of dense weights.'.format(weights.shape))
@@ -1,43 +1,545 @@
+from typing import Iterator, Tuple, Union
+from collections import OrderedDict
+
 import numpy as np
 
+from network.cache import array_digest
+from network.layers.layers import Conv2D, Dense, Dropout, Flatten, MaxPooling2D
+from .layer_ops import (ELEMENTWISE_ACTIVATION_FUNCTIONS, activation_function, conv2d,
+                        conv2d_weights, dense_weights, extract_window, layer_padding,
+                        max_pool2d)
+
+
+class Occlusion:
+    """Occlusion analysis: a patch of the input is covered with a constant
+    value and the decrease of the score of the predicted class (or of
+    other target units) is recorded, for patches at all positions of a
+    regular grid (Zeiler & Fergus, 2014).
+
+    The occluded inputs are generated lazily, a chunk at a time, and
+    fed to the network without using its activation cache. The memory
+    needed is thus bounded by the chunk size, independent of the size
+    of the input. The scores are written into a preallocated heatmap of
+    the size of the input: each grid position covers a cell of
+    stride x stride pixels.
+
+    Any number of targets can be analysed at once. Their scores are
+    taken from the same forward passes and the result is a stack of
+    heatmaps, one per target.
+    """
+
+    def __init__(self, network, patch_size: int=3, stride: int=1,
+                 fill_value: float=0., chunk_size: int=64,
+                 targets: Union[str, list]=None):
+        """
+
+        Parameters
+        ----------
+        network
+            The network to analyse.
+        patch_size
+            The height and width of the occluding patch.
+        stride
+            The distance between the centers of neighbouring patches.
+        fill_value
+            The value the occluded pixels are set to.
+        chunk_size
+            The number of occluded inputs fed to the network at once.
+        targets
+            The units whose scores are recorded. None for the class
+            predicted for the sample, 'all' for all units of the last
+            layer, or a list of (layer_id, unit) pairs. A unit is an
+            index into the output of the layer, e.g. (row, column,
+            channel). A single number denotes a unit of a flat layer or
+            a channel of a convolutional layer, whose values are summed.
+            Units of the last layer are scored by their net input (e.g.
+            the logits before a softmax), where available, units of all
+            other layers by their activation.
+        """
+        self._network = network
+        self.patch_size = patch_size
+        self.stride = stride
+        self.fill_value = fill_value
+        self.chunk_size = chunk_size
+        self.targets = targets
+
+    @property
+    def network(self):
+        """The network analysed."""
+        return self._network
+
+    @property
+    def parameters(self) -> dict:
+        """The parameters determining the result of the analysis."""
+        return {
+            'algorithm': type(self).__name__,
+            'patch_size': self.patch_size,
+            'stride': self.stride,
+            'fill_value': self.fill_value,
+            'targets': self.targets
+        }
+
+    def compute(self, input_sample: np.ndarray) -> np.ndarray:
+        """Compute the occlusion heatmap for an input sample.
+
+        Parameters
+        ----------
+        input_sample
+            A single input sample (H,W,C), (H,W) or (1,H,W,C).
+
+        Returns
+        -------
+        The heatmap of shape (H,W) for the predicted class, or a stack
+        of heatmaps (T,H,W) for the targets given in the constructor.
+        High values mark regions whose occlusion decreases the score.
+        """
+        heatmap = None
+        for heatmap, _, _ in self.iterate(input_sample):
+            pass
+        return heatmap
+
+    def iterate(self, input_sample: np.ndarray) -> Iterator[Tuple[np.ndarray, int, int]]:
+        """Compute the occlusion heatmap chunk by chunk.
+
+        Yields
+        ------
+        Tuples (heatmap, done, total) after each chunk, where done is
+        the number of occlusion positions processed so far and total
+        the number of all positions. The heatmap is the same array
+        every time, containing zeros for positions not processed yet.
+        """
+        sample = self._canonical_sample(input_sample)
+        positions = self._positions(sample.shape[:2])
+        targets, clean_scores = self._resolve_targets(sample)
+        heatmaps = np.zeros((len(targets),) + sample.shape[:2], dtype=np.float32)
+        heatmap = heatmaps[0] if self.targets is None else heatmaps
+
+        total = len(positions)
+        yield heatmap, 0, total
+        for start in range(0, total, self.chunk_size):
+            chunk = positions[start:start + self.chunk_size]
+            changes = clean_scores - self._chunk_scores(sample, chunk, targets)
+            for (row, column), change in zip(chunk, changes):
+                heatmaps[:, row:row + self.stride, column:column + self.stride] = change[:, np.newaxis, np.newaxis]
+            yield heatmap, start + len(chunk), total
+
+    @staticmethod
+    def _canonical_sample(input_sample: np.ndarray) -> np.ndarray:
+        """Bring an input sample into the form (H,W,C)."""
+        sample = np.asarray(input_sample, dtype=np.float32)
+        if sample.ndim == 4:
+            sample = sample[0]
+        elif sample.ndim == 2:
+            sample = sample[..., np.newaxis]
+        return sample
+
+    def _positions(self, shape: Tuple[int, int], cell_size: int=None) -> list:
+        """The top left corners of the heatmap cells, one per occlusion."""
+        cell_size = cell_size or self.stride
+        return [(row, column)
+                for row in range(0, shape[0], cell_size)
+                for column in range(0, shape[1], cell_size)]
+
+    def _patch_bounds(self, row: int, column: int, shape: Tuple[int, int],
+                      cell_size: int=None) -> Tuple[int, int, int, int]:
+        """The region (top, bottom, left, right) occluded for a cell, i.e. the
+        patch centered on the cell, clipped to the input. Cells larger
+        than the stride are occluded with a patch enlarged by the same
+        amount."""
+        cell_size = cell_size or self.stride
+        patch_size = self.patch_size + cell_size - self.stride
+        top = row + cell_size // 2 - patch_size // 2
+        left = column + cell_size // 2 - patch_size // 2
+        return (max(top, 0), min(top + patch_size, shape[0]),
+                max(left, 0), min(left + patch_size, shape[1]))
+
+    def _occluded_batch(self, sample: np.ndarray, positions: list,
+                        cell_size: int=None) -> np.ndarray:
+        """Create a batch of copies of the sample, each occluded at one position."""
+        batch = np.repeat(sample[np.newaxis], len(positions), axis=0)
+        for idx, (row, column) in enumerate(positions):
+            top, bottom, left, right = self._patch_bounds(row, column, sample.shape[:2], cell_size)
+            batch[idx, top:bottom, left:right] = self.fill_value
+        return batch
+
+    def _chunk_scores(self, sample: np.ndarray, positions: list, targets: list,
+                      cell_size: int=None) -> np.ndarray:
+        """The scores (N,T) of the targets for the sample occluded at each
+        of the positions, for cells of the given size (default: stride)."""
+        return self._scores(self._occluded_batch(sample, positions, cell_size), targets)
+
+    def _resolve_targets(self, sample: np.ndarray) -> Tuple[list, np.ndarray]:
+        """The targets as list of (layer_id, unit) pairs and their scores (T,)
+        for the unoccluded sample. Without explicit targets, this is the
+        unit of the last layer with the highest activation for the
+        sample, i.e. the predicted class. The values needed are fetched
+        in a single forward pass."""
+        if self.targets is not None and self.targets != 'all':
+            targets = [(layer_id, unit if isinstance(unit, tuple) else int(unit))
+                       for layer_id, unit in self.targets]
+            return targets, self._scores(sample[np.newaxis], targets, use_cache=True)[0]
+        network = self._network
+        layer_id = network.layer_ids[-1]
+        score_kind = self._score_kind(layer_id)
+        kinds = ('activation',) if score_kind == 'activation' else ('activation', score_kind)
+        outputs = network.get_layer_outputs(layer_id, sample[np.newaxis], kinds)
+        activations = outputs[0][0]
+        units = [np.argmax(activations)] if self.targets is None else range(activations.size)
+        if activations.ndim == 1:
+            targets = [(layer_id, int(unit)) for unit in units]
+        else:
+            targets = [(layer_id, tuple(int(idx) for idx in np.unravel_index(unit, activations.shape)))
+                       for unit in units]
+        return targets, self._select_units({layer_id: outputs[-1]}, targets)[0]
+
+    def _score_kind(self, layer_id) -> str:
+        """The kind of layer output the scores of units of a layer are taken
+        from. For the last layer, this is the net input where available,
+        as it is not squashed by the activation function (e.g. softmax).
+        Units of all other layers are scored by their activation."""
+        network = self._network
+        if layer_id == network.layer_ids[-1] and network.has_net_input(layer_id):
+            return 'net_input'
+        return 'activation'
+
+    def _scores(self, batch: np.ndarray, targets: list, use_cache: bool=False) -> np.ndarray:
+        """The scores (N,T) of the targets for each input in the batch,
+        see `_score_kind`. The activation cache is not used by default,
+        as occluded inputs are not seen again. The values of all target
+        layers are computed in a single forward pass."""
+        layer_ids = list(OrderedDict.fromkeys(layer_id for layer_id, _ in targets))
+        requests = [(layer_id, self._score_kind(layer_id)) for layer_id in layer_ids]
+        values = self._network.get_outputs(requests, batch, use_cache=use_cache)
+        return self._select_units(dict(zip(layer_ids, values)), targets)
+
+    @staticmethod
+    def _select_units(outputs: dict, targets: list) -> np.ndarray:
+        """Pick the scores (N,T) of the targets from the outputs of their
+        layers, given as dict mapping layer_ids to batches."""
+        columns = []
+        for layer_id, unit in targets:
+            output = outputs[layer_id]
+            if isinstance(unit, tuple):
+                columns.append(output[(slice(None),) + unit])
+            elif output.ndim > 2:
+                # A channel of a convolutional layer.
+                columns.append(output[..., unit].reshape(len(output), -1).sum(axis=1))
+            else:
+                columns.append(output[:, unit])
+        return np.stack(columns, axis=1)
+
+
+class IncrementalOcclusion(Occlusion):
+    """Occlusion analysis recomputing only what an occlusion changes.
+
+    An occluded input differs from the clean input only inside the
+    patch. The output of a convolution or pooling layer thus only
+    changes where its receptive field overlaps the changed region of
+    its input. The activations of the clean input are computed once
+    by the network. For each occlusion, only the changed regions are
+    recomputed with numpy, layer by layer, following the kernel sizes,
+    strides and paddings of the layers. The dense layers at the end
+    are recomputed in full, for a chunk of occlusions at once.
+
+    Supported are networks of convolution, max pooling and dropout
+    layers, followed by flatten, dense and dropout layers, with targets
+    in the last layer.
+    """
+
+    def __init__(self, network, **kwargs):
+        """
+
+        Parameters
+        ----------
+        network
+            The network to analyse.
+        **kwargs
+            See `Occlusion`.
+
+        Raises
+        ------
+        ValueError
+            If the network contains layers that can not be computed
+            incrementally.
+        """
+        super().__init__(network, **kwargs)
+        self._spatial_layer_ids, self._dense_layer_ids = self._split_layers()
+        # The digest of the sample and the targets the clean values were
+        # prepared for, see `_prepare`.
+        self._clean_digest = None
+        self._clean_targets = None
+
+    def _split_layers(self) -> Tuple[list, list]:
+        """Split the layers into the spatial layers at the beginning, which
+        are recomputed in regions, and the dense layers at the end."""
+        network = self._network
+        spatial_layer_ids, dense_layer_ids = [], []
+        for layer_id in network.layer_ids:
+            layer = network.layer_dict[layer_id]
+            if not dense_layer_ids and isinstance(layer, (Conv2D, MaxPooling2D, Dropout)):
+                if (isinstance(layer, Conv2D) and
+                        layer.activation_function not in ELEMENTWISE_ACTIVATION_FUNCTIONS):
+                    raise ValueError('Activation function {} of layer {} is not supported '
+                                     'by incremental occlusion.'.format(layer.activation_function, layer_id))
+                spatial_layer_ids.append(layer_id)
+            elif isinstance(layer, (Flatten, Dense, Dropout)):
+                dense_layer_ids.append(layer_id)
+            else:
+                raise ValueError('Layer {} ({}) is not supported by incremental occlusion.'.format(
+                    layer_id, type(layer).__name__))
+        return spatial_layer_ids, dense_layer_ids
+
+    def _prepare(self, sample: np.ndarray, targets: list) -> None:
+        """Compute the clean values for a sample, unless already done. The
+        sample is recognized by its content, as arrays may be changed in
+        place between calls."""
+        digest = array_digest(sample)
+        if self._clean_digest == digest and self._clean_targets == targets:
+            return
+        network = self._network
+        last_layer_id = network.layer_ids[-1]
+        if any(layer_id != last_layer_id for layer_id, _ in targets):
+            raise ValueError('Incremental occlusion only supports targets in the last layer.')
+        activations, net_inputs = network.get_all_activations(sample[np.newaxis])
+        # The scores are taken from the net input, see `Occlusion._score_kind`.
+        outputs = net_inputs if last_layer_id in net_inputs else activations
+        self._reference_scores = self._select_units(outputs, targets)[0]
+
+        self._spatial_steps = []
+        clean_input = sample[np.newaxis]
+        for layer_id in self._spatial_layer_ids:
+            layer = network.layer_dict[layer_id]
+            # Dropout does not change anything at inference time.
+            if isinstance(layer, Dropout):
+                continue
+            net_input_only = layer_id == last_layer_id and isinstance(layer, Conv2D)
+            clean_output = (net_inputs if net_input_only else activations)[layer_id]
+            self._spatial_steps.append(self._spatial_step(layer, clean_input, clean_output, net_input_only))
+            clean_input = clean_output
+        self._clean_output = clean_input
+
+        self._dense_steps = []
+        units = int(np.prod(clean_input.shape[1:]))
+        for layer_id in self._dense_layer_ids:
+            layer = network.layer_dict[layer_id]
+            if isinstance(layer, Dense):
+                output_units = activations[layer_id].shape[-1]
+                name = 'linear' if layer_id == last_layer_id else layer.activation_function
+                self._dense_steps.append((dense_weights(layer.weights, units, output_units),
+                                          layer.bias, activation_function(name)))
+                units = output_units
+        # Differences to the reference are computed with the same arithmetic.
+        self._clean_dense_scores = self._dense_scores(self._clean_output, targets)[0]
+        self._clean_digest, self._clean_targets = digest, targets
+
+    @staticmethod
+    def _spatial_step(layer, clean_input: np.ndarray, clean_output: np.ndarray,
+                      net_input_only: bool) -> tuple:
+        """Everything needed to recompute a region of the output of a
+        convolution or pooling layer.
+
+        Returns
+        -------
+        A tuple (clean_input, output_size, kernel_size, strides, padding,
+        fill_value, function), where padding are the pixels added
+        before the input in height and width direction and function
+        computes a 'valid' window of the layer output.
+        """
+        strides = tuple(layer.strides)
+        if isinstance(layer, Conv2D):
+            kernel_size, fill_value = tuple(layer.kernel_size), 0.
+            weights = conv2d_weights(layer.weights, kernel_size,
+                                     clean_input.shape[-1], clean_output.shape[-1])
+            bias = layer.bias
+            activation = activation_function('linear' if net_input_only else layer.activation_function)
+
+            def function(window):
+                return activation(conv2d(window, weights, bias, strides))
+        else:
+            kernel_size, fill_value = tuple(layer.pool_size), -np.inf
+
+            def function(window):
+                return max_pool2d(window, kernel_size, strides)
+
+        padding = tuple(before for before, _ in
+                        layer_padding(layer, clean_input.shape, clean_output.shape))
+        return (clean_input, clean_output.shape[1:3], kernel_size, strides,
+                padding, fill_value, function)
+
+    def _propagate(self, bounds: list, values: np.ndarray):
+        """Propagate a change of the input through the spatial layers.
+
+        Parameters
+        ----------
+        bounds
+            The changed region [(top, bottom), (left, right)] of the input.
+        values
+            The new values (1,h,w,C) in that region.
+
+        Returns
+        -------
+        The changed region of the output of the last spatial layer and
+        the new values in it, or None if nothing changes.
+        """
+        for step in self._spatial_steps:
+            clean_input, output_size, kernel_size, strides, padding, fill_value, function = step
+            output_bounds, window_bounds = [], []
+            for axis in range(2):
+                start, stop = bounds[axis]
+                kernel, stride, before = kernel_size[axis], strides[axis], padding[axis]
+                # The outputs whose receptive field overlaps the changed region.
+                first = max(0, -((kernel - 1 - start - before) // stride))
+                last = min(output_size[axis], (stop - 1 + before) // stride + 1)
+                if first >= last:
+                    return None
+                output_bounds.append((first, last))
+                window_bounds.append((first * stride - before, (last - 1) * stride - before + kernel))
+            (top, bottom), (left, right) = window_bounds
+            window = extract_window(clean_input, top, bottom, left, right, fill_value)
+            # Overwrite the window with the changed values, as far as they are inside.
+            (changed_top, changed_bottom), (changed_left, changed_right) = bounds
+            inner_top, inner_bottom = max(top, changed_top), min(bottom, changed_bottom)
+            inner_left, inner_right = max(left, changed_left), min(right, changed_right)
+            window[:, inner_top - top:inner_bottom - top, inner_left - left:inner_right - left] = \
+                values[:, inner_top - changed_top:inner_bottom - changed_top,
+                       inner_left - changed_left:inner_right - changed_left]
+            bounds, values = output_bounds, function(window)
+        return bounds, values
+
+    def _dense_scores(self, batch: np.ndarray, targets: list) -> np.ndarray:
+        """Compute the dense layers for a batch of outputs of the last spatial layer."""
+        values = batch
+        if self._dense_steps and values.ndim == 4 and self._network._data_format == 'channels_first':
+            # The dense weights expect the units flattened in the order of the framework.
+            values = values.transpose(0, 3, 1, 2)
+        for weights, bias, function in self._dense_steps:
+            values = function(np.dot(values.reshape(len(values), -1), weights) + bias)
+        return self._select_units({self._network.layer_ids[-1]: values}, targets)
+
+    def _chunk_scores(self, sample: np.ndarray, positions: list, targets: list,
+                      cell_size: int=None) -> np.ndarray:
+        self._prepare(sample, targets)
+        scores = np.repeat(self._reference_scores[np.newaxis], len(positions), axis=0)
+        changed, changes = [], []
+        for idx, (row, column) in enumerate(positions):
+            top, bottom, left, right = self._patch_bounds(row, column, sample.shape[:2], cell_size)
+            values = np.full((1, bottom - top, right - left, sample.shape[2]),
+                             self.fill_value, dtype=sample.dtype)
+            change = self._propagate([(top, bottom), (left, right)], values)
+            if change is not None:
+                changed.append(idx)
+                changes.append(change)
+        if changed:
+            batch = np.repeat(self._clean_output, len(changed), axis=0)
+            for idx, (((top, bottom), (left, right)), values) in enumerate(changes):
+                batch[idx, top:bottom, left:right] = values[0]
+            scores[changed] += self._dense_scores(batch, targets) - self._clean_dense_scores
+        return scores
+
+
+class AdaptiveOcclusion(Occlusion):
+    """Occlusion analysis refining the heatmap only where it matters.
+
+    The input is first occluded on a coarse grid of large cells, with
+    patches enlarged to the cell size. Cells whose occlusion changes
+    the score by more than a threshold are divided into four cells of
+    half the size, which are occluded in the next round, down to cells
+    of stride x stride pixels. All other regions of the heatmap keep
+    the value of their coarse cell. Where most of the heatmap is flat,
+    this needs only a fraction of the forward passes.
+    """
+
+    def __init__(self, network, coarse_stride: int=16, threshold: float=0.1, **kwargs):
+        """
+
+        Parameters
+        ----------
+        network
+            The network to analyse.
+        coarse_stride
+            The size of the cells in the first round. It is rounded down
+            to the stride times a power of two.
+        threshold
+            Cells are refined if the absolute change of the score of any
+            target exceeds this fraction of the largest absolute change
+            of that target in the first round. 0 refines all cells whose
+            occlusion changes a score at all.
+        **kwargs
+            See `Occlusion`.
+        """
+        super().__init__(network, **kwargs)
+        self.coarse_stride = coarse_stride
+        self.threshold = threshold
+
+    @property
+    def parameters(self) -> dict:
+        parameters = super().parameters
+        parameters['coarse_stride'] = self.coarse_stride
+        parameters['threshold'] = self.threshold
+        return parameters
+
+    def iterate(self, input_sample: np.ndarray) -> Iterator[Tuple[np.ndarray, int, int]]:
+        """Compute the occlusion heatmap chunk by chunk.
+
+        Yields
+        ------
+        Tuples (heatmap, done, total) after each chunk, as
+        `Occlusion.iterate`. The total only counts the cells known so
+        far and grows when cells are refined.
+        """
+        sample = self._canonical_sample(input_sample)
+        targets, clean_scores = self._resolve_targets(sample)
+        heatmaps = np.zeros((len(targets),) + sample.shape[:2], dtype=np.float32)
+        heatmap = heatmaps[0] if self.targets is None else heatmaps
+
+        # Cell sizes are the stride times a power of two, so that they can
+        # be halved until reaching the stride.
+        cell_size = self.stride
+        while cell_size * 2 <= self.coarse_stride:
+            cell_size *= 2
+        cells = self._positions(sample.shape[:2], cell_size)
+        limit = None
+        done = 0
+        yield heatmap, done, len(cells)
+        while cells:
+            changes = np.empty((len(cells), len(targets)), dtype=np.float32)
+            for start in range(0, len(cells), self.chunk_size):
+                chunk = cells[start:start + self.chunk_size]
+                scores = self._chunk_scores(sample, chunk, targets, cell_size)
+                changes[start:start + len(chunk)] = clean_scores - scores
+                for (row, column), change in zip(chunk, changes[start:]):
+                    heatmaps[:, row:row + cell_size, column:column + cell_size] = \
+                        change[:, np.newaxis, np.newaxis]
+                done += len(chunk)
+                yield heatmap, done, done + len(cells) - start - len(chunk)
+            if cell_size == self.stride:
+                break
+            if limit is None:
+                limit = self.threshold * np.max(np.abs(changes), axis=0)
+            half_size = cell_size // 2
+            refine = np.any(np.abs(changes) > limit, axis=1)
+            cells = [(row + row_offset, column + column_offset)
+                     for (row, column), selected in zip(cells, refine) if selected
+                     for row_offset in (0, half_size) for column_offset in (0, half_size)
+                     if row + row_offset < sample.shape[0] and column + column_offset < sample.shape[1]]
+            cell_size = half_size
+
+
 def get_occlussion_map(self, input_sample: np.ndarray, kernel_size: int) -> np.ndarray:
     """gives a heatmap of oclussion algorithm for maskes defined by kernel_shape
 
+    Kept for compatibility, use `Occlusion` instead. The occluding
+    patch has size 2*kernel_size+1 and is filled with ones.
+
+    Returns
+    -------
+    The heatmap scaled to uint8 values, in the shape of the input sample.
     """
-    input_shape = input_sample.shape
-    heatmap = np.empty([input_shape[1] * input_shape[2]])
-
-    padded_input = np.lib.pad(input_sample,
-                              pad_width=((0, 0), (kernel_size, kernel_size), (kernel_size, kernel_size), (0, 0)),
-                              mode='constant')
-
-    maskmulti = np.ones(
-        [input_shape[1] * input_shape[2], input_shape[1] + (kernel_size) * 2, input_shape[2] + (kernel_size) * 2, 1])
-    maskadd = np.zeros(
-        [input_shape[1] * input_shape[2], input_shape[1] + (kernel_size) * 2, input_shape[2] + (kernel_size) * 2, 1])
-
-    for i in range(input_shape[1] * input_shape[2]):
-        maskmulti[i,
-        i // input_shape[2] + kernel_size - (kernel_size):i // input_shape[2] + kernel_size + (kernel_size + 1),
-        i % input_shape[2] + kernel_size - (kernel_size):i % input_shape[2] + kernel_size + (kernel_size + 1), 0] = 0
-        maskadd[i,
-        i // input_shape[2] + kernel_size - (kernel_size):i // input_shape[2] + kernel_size + (kernel_size + 1),
-        i % input_shape[2] + kernel_size - (kernel_size):i % input_shape[2] + kernel_size + (kernel_size + 1), 0] = 1
-    occluded_list = np.multiply(padded_input, maskmulti) + maskadd
-
-    heatmap = self.get_activations([list(self.layer_dict.keys())[-3]],
-                                   occluded_list[:, kernel_size:-kernel_size, kernel_size:-kernel_size])
-    # print(np.asarray(heatmap).shape)
-    # print(self.get_layer_weights(self.layer_dict.keys()[-1])[0].shape)
-
-
-    heatmap = np.dot(np.asarray(heatmap)[0, :, :], self.get_layer_weights(self.layer_ids[-1]))[:,
-              np.argmax(self._model.predict(input_sample))]
+    occlusion = Occlusion(self, patch_size=2 * kernel_size + 1, stride=1, fill_value=1.)
+    heatmap = occlusion.compute(input_sample)
     heatmap = heatmap - np.min(heatmap)
-    heatmap = heatmap / (np.max(heatmap) - np.min(heatmap))
-
-    heatmap = heatmap * 255
-    heatmap = (255 - heatmap).astype(np.uint8)
-    # heatmap=((heatmap-np.min(heatmap))*255/(np.max(heatmap)-np.min(heatmap))).astype(int)
-
-    return np.reshape(heatmap, input_shape, order='A')
\ No newline at end of file
+    heatmap_range = np.max(heatmap)
+    if heatmap_range > 0:
+        heatmap = heatmap / heatmap_range
+    heatmap = (heatmap * 255).astype(np.uint8)
+    return np.reshape(heatmap, np.shape(input_sample))
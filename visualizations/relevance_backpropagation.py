@@ -1,153 +1,146 @@
-from network.network import BaseNetwork
+from typing import List
+
 import numpy as np
 
+from network import Network as BaseNetwork
+from network.layers.layers import Conv2D, Dense, Dropout, Flatten, MaxPooling2D
+from .layer_ops import (conv2d, conv2d_backward, conv2d_weights, dense_weights,
+                        layer_padding, max_pool2d_backward)
+
+
 class RelevanceBackpropagation:
+    """Layer-wise relevance propagation (Bach et al., 2015) with the
+    epsilon rule.
+
+    The score of the predicted class is distributed backwards over the
+    layers down to the input. Dense and convolutional layers pass the
+    relevance of each unit on to their inputs in proportion to their
+    contributions to its net input. Max pooling layers pass it on to
+    the maximal input (winner takes all), flatten and dropout layers
+    just pass it on.
+
+    All rules operate on whole layers and batches at once. The net
+    inputs are taken from the forward pass of the network, and only
+    computed with numpy (im2col) where the network does not provide
+    them. Convolutions distribute the relevance with a transposed
+    convolution, honouring the strides and paddings of the layers.
     """
-    Relevance backpropagation limited to the first maxpool layer.
-    """
+
     def __init__(self, network: BaseNetwork):
         self._network = network
 
-    def visualize(self, input_sample, eps=1) -> np.ndarray:
-        last_layer_id = self._network.get_layer_id_list()[-1]
-        activations = []
-        for idx, layer_id in reversed(list(enumerate(self._network.get_layer_id_list()))):
-            activations.append(self._network.get_activations(layer_id, input_sample))
-
-        return self._compute_relevance_heatmap(activations)
-
-
-
-    def _compute_relevance_heatmap(self, activations, relevance):
-
-        relevances = [activations[0]]
-        print(reversed(list(enumerate(self._network.get_layer_id_list()))))
-        for idx, layer in reversed(list(enumerate(self._model.layers))):
-
-            # print("Propagating relevance backwards from layer {} to layer {} ({}).".format(idx+1,idx,type(layer)))
+    def visualize(self, input_sample: np.ndarray, eps: float=1) -> np.ndarray:
+        """Compute the relevance of each input value for the predicted class.
+
+        Parameters
+        ----------
+        input_sample
+            Input samples (N,H,W,C), or a single sample (H,W,C) or (H,W).
+        eps
+            The stabilizer of the epsilon rule, which absorbs some
+            relevance of units with small net input.
+
+        Returns
+        -------
+        The relevance heatmap (N,H,W,C).
+        """
+        return self.compute_relevances(input_sample, eps)[0]
+
+    def compute_relevances(self, input_sample: np.ndarray, eps: float=1) -> List[np.ndarray]:
+        """Compute the relevances of the input and of the outputs of all
+        layers, see `visualize` for the arguments.
+
+        Returns
+        -------
+        A list with the relevances of the input first, followed by those
+        of the outputs of the layers. Each entry is shaped like the
+        values it refers to, with channels last.
+
+        Raises
+        ------
+        ValueError
+            If the network contains layers that are not supported.
+        """
+        network = self._network
+        inputs = network._fill_up_ranks(np.asarray(input_sample, dtype=np.float32))
+        if inputs.ndim == 1:
+            inputs = inputs[np.newaxis]
+        # Fetch the activations of all layers in a single forward pass.
+        activations, net_inputs = network.get_all_activations(inputs)
+        layer_inputs = [inputs] + list(activations.values())[:-1]
+
+        # Only the predicted class is relevant at the output. Its score is
+        # taken from the net input, if available, as it is not squashed
+        # by the activation function (e.g. softmax).
+        last_layer_id = network.layer_ids[-1]
+        outputs = activations[last_layer_id]
+        scores = net_inputs.get(last_layer_id, outputs)
+        flat_outputs = outputs.reshape(len(outputs), -1)
+        selection = np.zeros_like(flat_outputs)
+        selection[np.arange(len(outputs)), flat_outputs.argmax(axis=1)] = 1
+        relevance = scores * selection.reshape(scores.shape)
+
+        relevances = []
+        for layer_id, layer_input in reversed(list(zip(activations.keys(), layer_inputs))):
+            relevances.insert(0, relevance)
+            layer = network.layer_dict[layer_id]
+            layer_output = activations[layer_id]
 
             if isinstance(layer, Dense):
-                # Dense layer (stores weights from previous layer to this layer)
-                W, B = layer.get_weights()
-
-                # compute local pre-activation matrix,
-                # i.e. z_{ij} in [1], formula (50)
-                local_pre_activation = activations[idx-1][:, np.newaxis] * W
-
-                # compute global pre-activation vector (that is the net input
-                # to activation function), i.e. z_{j} in [1], formula (51)
-                global_pre_activation = local_pre_activation.sum(0) + B
-
-                # Check: compare this to
-                # net_input = np.dot(activation[0],W) + B
-
-                # compute the relevance matrix
-                print(local_pre_activation.shape)
-                print(global_pre_activation.shape)
-
-                relevance_matrix = local_pre_activation / (global_pre_activation + eps) * relevances[0]
-
-                # compute new relevance vector for previous layer
-                relevance = relevance_matrix.sum(1)
+                weights = dense_weights(layer.weights, layer_input.shape[-1], layer_output.shape[-1])
+                net_input = net_inputs.get(layer_id)
+                if net_input is None:
+                    net_input = np.dot(layer_input, weights) + layer.bias
+                scaled = relevance / self._stabilize(net_input, eps)
+                relevance = layer_input * np.dot(scaled, weights.T)
 
             elif isinstance(layer, Conv2D):
-                # 2D convolution. Compute a "backward convolution"
-
-                # layer.input_shape[1:] is (channels, nb_row, nb_col)
-                relevance = np.zeros(layer.input_shape[1:])
-
-                # Get weights and bias values of the kernels.
-                # weights are a 4-tuple:
-                #   (nb_filter, channels, filter_row, filter_col)
-                #   nb_filter is depth in output, channels is depth in input
-                # biases are just a vector (nb_filter,)
-                #   i.e. one bias per filter
-                W, B = layer.get_weights()
-
-                # get activation in previous layer
-                # Shape: (channels, nb_row, nb_col) like input_shape
-                activation = activations[idx-1]
-
-                # Now loop through all positions in the output array and
-                # consider the "receptive field" for each position (and all
-                # filters).  For this sub-problem perform the standard (fully
-                # connected) method to compute the relevance values (that is,
-                # relevance of output pixel in position (r,c) will only
-                # contribute to the relevance in its receptive field).
-
-                # FIXME[todo]: care for the border_mode ('valid', 'same' or 'full')
-                # For now we simply ignore boundary pixels
-                if layer.padding != 'valid':
-                    print("warning: Ignoring the border_mode ({}) - may get implemented in the future ...".format(
-                        layer.border_mode), file=sys.stderr)
-
-                # layer.output_shape[2:] is (out_rows, out_cols)
-
-                for r, c in np.ndindex(layer.output_shape[1:3]):
-                    # print(layer.output_shape)
-
-
-                    # compute local pre-activation matrix:
-                    # extract activation for the receptive field
-                    # from the full activation matrix
-                    # (and add one dimension to enumerate the filters).
-                    # Multiply with connections weights.
-                    # Shape: (nb_filter, channel, filter_row, filter_col)
-                    # local_pre_activation = activation[np.newaxis,:,r:r+layer.nb_row,c:c+layer.nb_col] * W   for the theano
-                    print(W.shape)
-                    print(activation[r:r + layer.kernel_size[0], c:c + layer.kernel_size[1], np.newaxis, :].shape)
-                    print(local_pre_activation.shape)
-                    local_pre_activation = activation[r:r + layer.kernel_size[0], c:c + layer.kernel_size[1], :,
-                                           np.newaxis] * W
-
-                    # compute the total net activation for each filter by
-                    # summing up over channels (1), rows (2), and columns (3)
-                    # and adding the bias.
-                    # Shape: (nb_filter,)
-                    # global_pre_activation = local_pre_activation.sum((1,2,3)) + B
-                    global_pre_activation = local_pre_activation.sum((0, 1, 2)) + B
-
-                    # a local relevance matrix for the current filter and
-                    # position providing relevance values for all pixels
-                    # that may get relevance from the current output pixel
-                    # (its "receptive field").
-                    # Shape: (nb_filter, channel, filter_row, filter_col)
-                    # print(local_pre_activation.shape)
-                    # print(relevances[0][r,c,:].shape)
-                    # print(global_pre_activation.shape)
-                    # relevance_matrix = local_pre_activation * (relevances[0][r,c,:]/(global_pre_activation+eps))[:,np.newaxis,np.newaxis,np.newaxis]
-                    relevance_matrix = local_pre_activation * (relevances[0][r, c, :] / (global_pre_activation + eps))[
-                                                              np.newaxis, np.newaxis, np.newaxis, :]
-
-                    # update relevance values for the "receptive field", by
-                    # summing the relevance up the relevances of all filters:
-                    # print(relevance_matrix.shape)
-                    # print(relevance.shape)
-                    relevance[r:r + layer.kernel_size[0], c:c + layer.kernel_size[1], :] += relevance_matrix.sum(3)
-
+                (top, bottom), (left, right) = layer_padding(layer, layer_input.shape, layer_output.shape)
+                padded = np.pad(layer_input, ((0, 0), (top, bottom), (left, right), (0, 0)), 'constant')
+                weights = conv2d_weights(layer.weights, layer.kernel_size,
+                                         layer_input.shape[-1], layer_output.shape[-1])
+                net_input = net_inputs.get(layer_id)
+                if net_input is None:
+                    net_input = conv2d(padded, weights, layer.bias, layer.strides)
+                scaled = relevance / self._stabilize(net_input, eps)
+                relevance = padded * conv2d_backward(scaled, weights, layer.strides, padded.shape[1:3])
+                relevance = self._crop(relevance, top, left, layer_input.shape)
 
+            elif isinstance(layer, MaxPooling2D):
+                (top, bottom), (left, right) = layer_padding(layer, layer_input.shape, layer_output.shape)
+                padded = np.pad(layer_input, ((0, 0), (top, bottom), (left, right), (0, 0)),
+                                'constant', constant_values=-np.inf)
+                relevance = max_pool2d_backward(padded, relevance, layer.pool_size, layer.strides)
+                relevance = self._crop(relevance, top, left, layer_input.shape)
 
             elif isinstance(layer, Flatten):
                 # Flatten changes the shape of the node array. This does not
                 # affect the relevance values. We just have to adapt their
-                # shape.
-                relevance = relevances[0].reshape(layer.input_shape[1:])
-            elif isinstance(layer, MaxPooling2D):
-                print(idx-1)
-                print(layer)
-                relevance = relevances[0]
-                break
+                # shape, taking the order of the flattened units of the
+                # framework into account.
+                if network._data_format == 'channels_first' and layer_input.ndim == 4:
+                    batch_size, height, width, channels = layer_input.shape
+                    relevance = relevance.reshape(batch_size, channels, height, width).transpose(0, 2, 3, 1)
+                else:
+                    relevance = relevance.reshape(layer_input.shape)
+
             elif isinstance(layer, Dropout):
-                # Dropout does not change the output shape and should not
-                # affect the relevance vmodel = load_model(model_file)alue. Hence we simply keep the old
-                # relevance value.
-                relevance = relevances[0]
+                # Dropout does not change anything at inference time.
+                pass
 
             else:
-                # Other types of layer are not supported yet.
-                print("error: Layers of type {} are not supported yet. Sorry!".format(type(layer)), file=sys.stderr)
-                sys.exit(1)
-
-            relevances.insert(0, relevance)
+                raise ValueError('Layers of type {} are not supported by relevance '
+                                 'propagation.'.format(type(layer).__name__))
 
+        relevances.insert(0, relevance)
         return relevances
+
+    @staticmethod
+    def _stabilize(net_input: np.ndarray, eps: float) -> np.ndarray:
+        """Move the net input away from zero by eps, keeping its sign."""
+        return net_input + eps * np.where(net_input >= 0, 1, -1)
+
+    @staticmethod
+    def _crop(values: np.ndarray, top: int, left: int, shape: tuple) -> np.ndarray:
+        """Remove the padding from values (N,H,W,C) to fit the shape."""
+        return values[:, top:top + shape[1], left:left + shape[2]]
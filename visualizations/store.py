@@ -0,0 +1,145 @@
+from typing import Optional
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from network.cache import array_digest
+
+
+class HeatmapStore:
+    """A persistent on-disk cache for the results of visualizations, like
+    occlusion or relevance heatmaps.
+
+    Such results are determined by the model, the input sample and the
+    parameters of the algorithm. They are stored under a key computed
+    from the fingerprint of the network (architecture and weights), a
+    digest of the sample and the parameters, one `.npy` file per
+    result. When the files exceed the size limit, the least recently
+    used ones are removed. The modification time of a file records its
+    last use.
+    """
+
+    _SUFFIX = '.npy'
+
+    def __init__(self, directory: str, max_bytes: int=256 * 2**20):
+        """
+
+        Parameters
+        ----------
+        directory
+            The directory holding the results. It is created if it does
+            not exist.
+        max_bytes
+            The maximal total size of the stored results.
+        """
+        self._directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @staticmethod
+    def key(network, input_sample: np.ndarray, parameters: dict) -> str:
+        """The key of a result.
+
+        Parameters
+        ----------
+        network
+            The network the result was computed for.
+        input_sample
+            The input sample the result was computed for.
+        parameters
+            The parameters of the algorithm, including its name (e.g.
+            `Occlusion.parameters`). They have to be JSON serializable,
+            other values are included by their string representation.
+        """
+        digest = hashlib.sha1(network.fingerprint.encode('utf8'))
+        digest.update(array_digest(np.asarray(input_sample)).encode('utf8'))
+        digest.update(json.dumps(parameters, sort_keys=True, default=str).encode('utf8'))
+        return digest.hexdigest()
+
+    def get(self, network, input_sample: np.ndarray, parameters: dict) -> Optional[np.ndarray]:
+        """Get a stored result, see `key` for the arguments.
+
+        Returns
+        -------
+        The result or None, if it is not contained in the store.
+        """
+        path = self._path(self.key(network, input_sample, parameters))
+        try:
+            result = np.load(path)
+            # Mark the result as recently used.
+            os.utime(path)
+        except (OSError, ValueError):
+            # Not stored, or removed or overwritten concurrently.
+            return None
+        return result
+
+    def put(self, network, input_sample: np.ndarray, parameters: dict, result: np.ndarray) -> None:
+        """Store a result, see `key` for the arguments. Old results are
+        removed if the store gets too large.
+        """
+        path = self._path(self.key(network, input_sample, parameters))
+        # Write to a temporary file first, so that readers never see partial files.
+        with tempfile.NamedTemporaryFile(dir=self._directory, suffix='.tmp', delete=False) as fp:
+            try:
+                np.save(fp, np.asarray(result))
+            except BaseException:
+                fp.close()
+                self._remove(fp.name)
+                raise
+        os.replace(fp.name, path)
+        self._evict()
+
+    @property
+    def size(self) -> int:
+        """The total size of the stored results in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self) -> None:
+        """Remove all stored results."""
+        with self._lock:
+            for path, _, _ in self._entries():
+                self._remove(path)
+
+    def _evict(self) -> None:
+        """Remove the least recently used results until the store fits its
+        size limit."""
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def _entries(self) -> list:
+        """(path, size, last use) for all stored results."""
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(self._SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key + self._SUFFIX)
@@ -0,0 +1,197 @@
+import numpy as np
+from frozendict import FrozenOrderedDict
+
+from network import Network as BaseNetwork
+from network.layers.layers import Conv2D, Dense, Dropout, Flatten, MaxPooling2D
+
+
+class MockLayerMixin:
+    """Layer described by constructor arguments instead of a framework."""
+    def __init__(self, network, input_shape=None, **kwargs):
+        super().__init__(network)
+        self._input_shape = input_shape
+        self.__dict__.update(('_' + key, value) for key, value in kwargs.items())
+
+    @property
+    def input_shape(self):
+        return self._input_shape
+
+
+class MockNeuralLayerMixin(MockLayerMixin):
+    def _fetch_parameters(self):
+        return (self._weights.copy(), self._bias.copy())
+
+    @property
+    def activation_function(self):
+        return self._activation_function
+
+
+class MockConv2D(MockNeuralLayerMixin, Conv2D):
+    """Convolution with weights (KH,KW,C_in,C_out)."""
+    @property
+    def kernel_size(self):
+        return self._weights.shape[:2]
+
+    @property
+    def strides(self):
+        return self._strides
+
+    @property
+    def padding(self):
+        return self._padding
+
+
+class MockMaxPooling2D(MockLayerMixin, MaxPooling2D):
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @property
+    def strides(self):
+        return self._strides
+
+    @property
+    def padding(self):
+        return self._padding
+
+
+class MockDense(MockNeuralLayerMixin, Dense):
+    pass
+
+
+class MockDropout(MockLayerMixin, Dropout):
+    pass
+
+
+class MockFlatten(MockLayerMixin, Flatten):
+    pass
+
+
+def naive_padding(size, kernel, stride, padding):
+    """The output size and the padding (before, after) of an input
+    dimension, as defined by TensorFlow."""
+    if padding == 'valid':
+        return (size - kernel) // stride + 1, (0, 0)
+    output_size = -(-size // stride)
+    total = max((output_size - 1) * stride + kernel - size, 0)
+    return output_size, (total // 2, total - total // 2)
+
+
+def naive_windows(values, kernel_size, strides, padding, fill_value):
+    """Yield (row, column, window) for every output position of a
+    convolution or pooling of a single sample (H,W,C)."""
+    height, rows = naive_padding(values.shape[0], kernel_size[0], strides[0], padding)
+    width, columns = naive_padding(values.shape[1], kernel_size[1], strides[1], padding)
+    padded = np.pad(values, (rows, columns, (0, 0)), 'constant', constant_values=fill_value)
+    for row in range(height):
+        for column in range(width):
+            yield (row, column, padded[row * strides[0]:row * strides[0] + kernel_size[0],
+                                       column * strides[1]:column * strides[1] + kernel_size[1]])
+
+
+def naive_conv2d(values, weights, bias, strides, padding):
+    outputs = {}
+    for row, column, window in naive_windows(values, weights.shape[:2], strides, padding, 0.):
+        outputs[row, column] = np.tensordot(window, weights, axes=3) + bias
+    return _assemble(outputs)
+
+
+def naive_max_pool2d(values, pool_size, strides, padding):
+    outputs = {}
+    for row, column, window in naive_windows(values, pool_size, strides, padding, -np.inf):
+        outputs[row, column] = window.max(axis=(0, 1))
+    return _assemble(outputs)
+
+
+def _assemble(outputs):
+    height, width = (max(indices) + 1 for indices in zip(*outputs))
+    return np.array([[outputs[row, column] for column in range(width)] for row in range(height)])
+
+
+ACTIVATIONS = {
+    'linear': lambda values: values,
+    'relu': lambda values: np.maximum(values, 0),
+    'tanh': np.tanh,
+    'softmax': lambda values: np.exp(values - values.max()) / np.exp(values - values.max()).sum()
+}
+
+
+class NumpyNetwork(BaseNetwork):
+    """Mock network of convolution, pooling, dropout, flatten and dense
+    layers with random weights, computed sample by sample with plain
+    loops. The network can be cut off after a given layer. Counts the
+    forward passes."""
+
+    def __init__(self, input_shape=(17, 15, 2), paddings=('same', 'valid', 'valid'),
+                 last_layer='output', seed=0, **kwargs):
+        """
+
+        Parameters
+        ----------
+        input_shape
+            The shape (H,W,C) of the input samples.
+        paddings
+            The paddings of the first convolution (stride 2), the
+            pooling (stride 2) and the second convolution (stride 1).
+        last_layer
+            The id of the last layer of the network.
+        seed
+            The seed for the random weights.
+        """
+        self.num_computations = 0
+        self._shape = input_shape
+        self._paddings = paddings
+        self._last_layer = last_layer
+        self._random = np.random.RandomState(seed)
+        kwargs.setdefault('data_format', 'channels_last')
+        super().__init__(**kwargs)
+
+    def _create_layer_dict(self):
+        random = self._random
+        size = self._shape[:2]
+        for kernel, stride, padding in zip((3, 2, 3), (2, 2, 1), self._paddings):
+            size = [naive_padding(extent, kernel, stride, padding)[0] for extent in size]
+        conv1_padding, pool_padding, conv2_padding = self._paddings
+        layers = [
+            ('conv1', MockConv2D(self, input_shape=(None,) + self._shape,
+                                 weights=random.randn(3, 3, self._shape[2], 4).astype(np.float32),
+                                 bias=0.1 * random.randn(4).astype(np.float32),
+                                 strides=(2, 2), padding=conv1_padding, activation_function='relu')),
+            ('pool', MockMaxPooling2D(self, pool_size=(2, 2), strides=(2, 2), padding=pool_padding)),
+            ('dropout', MockDropout(self)),
+            ('conv2', MockConv2D(self, weights=random.randn(3, 3, 4, 5).astype(np.float32),
+                                 bias=0.1 * random.randn(5).astype(np.float32),
+                                 strides=(1, 1), padding=conv2_padding, activation_function='tanh')),
+            ('flatten', MockFlatten(self)),
+            ('dense', MockDense(self, weights=random.randn(size[0] * size[1] * 5, 6).astype(np.float32),
+                                bias=random.randn(6).astype(np.float32), activation_function='relu')),
+            ('output', MockDense(self, weights=random.randn(6, 3).astype(np.float32),
+                                 bias=random.randn(3).astype(np.float32), activation_function='softmax'))
+        ]
+        layer_ids = [layer_id for layer_id, _ in layers]
+        return FrozenOrderedDict(layers[:layer_ids.index(self._last_layer) + 1])
+
+    def _compute_outputs(self, requests, input_samples):
+        self.num_computations += 1
+        samples = [self._forward(sample) for sample in input_samples]
+        return [np.stack([sample[request] for sample in samples]).astype(np.float32)
+                for request in requests]
+
+    def _forward(self, sample) -> dict:
+        """The net inputs and activations of all layers for a single sample."""
+        outputs = {}
+        values = sample.astype(np.float64)
+        for layer_id, layer in self.layer_dict.items():
+            if isinstance(layer, Conv2D):
+                values = naive_conv2d(values, layer.weights, layer.bias, layer.strides, layer.padding)
+            elif isinstance(layer, MaxPooling2D):
+                values = naive_max_pool2d(values, layer.pool_size, layer.strides, layer.padding)
+            elif isinstance(layer, Flatten):
+                values = values.reshape(-1)
+            elif isinstance(layer, Dense):
+                values = np.dot(values, layer.weights) + layer.bias
+            if isinstance(layer, (Conv2D, Dense)):
+                outputs[layer_id, 'net_input'] = values
+                values = ACTIVATIONS[layer.activation_function](values)
+            outputs[layer_id, 'activation'] = values
+        return outputs
@@ -0,0 +1,94 @@
+from unittest import TestCase
+
+import numpy as np
+
+from visualizations.layer_ops import (conv2d, conv2d_backward, conv2d_weights, layer_padding,
+                                      max_pool2d, max_pool2d_backward)
+from .mock_network import MockConv2D, naive_conv2d, naive_max_pool2d, naive_padding
+
+# (padding, strides) combinations for odd and even input sizes.
+CONFIGURATIONS = [('valid', (1, 1)), ('valid', (2, 2)), ('same', (1, 1)), ('same', (2, 2)),
+                  ('same', (2, 1))]
+
+
+def pad(values, kernel_size, strides, padding, fill_value=0.):
+    """Pad a batch (N,H,W,C) for a 'valid' computation."""
+    amounts = [naive_padding(values.shape[axis + 1], kernel_size[axis], strides[axis], padding)[1]
+               for axis in range(2)]
+    return np.pad(values, [(0, 0)] + amounts + [(0, 0)], 'constant', constant_values=fill_value)
+
+
+class TestConvolution(TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.inputs = random.randn(2, 9, 8, 3)
+        self.weights = random.randn(3, 3, 3, 4)
+        self.bias = random.randn(4)
+
+    def test_conv2d(self):
+        for padding, strides in CONFIGURATIONS:
+            padded = pad(self.inputs, (3, 3), strides, padding)
+            outputs = conv2d(padded, self.weights, self.bias, strides)
+            for sample, output in zip(self.inputs, outputs):
+                reference = naive_conv2d(sample, self.weights, self.bias, strides, padding)
+                self.assertTrue(np.allclose(reference, output), (padding, strides))
+
+    def test_conv2d_backward(self):
+        random = np.random.RandomState(1)
+        for padding, strides in CONFIGURATIONS:
+            padded = pad(self.inputs, (3, 3), strides, padding)
+            values = random.randn(*conv2d(padded, self.weights, self.bias, strides).shape)
+            result = conv2d_backward(values, self.weights, strides, padded.shape[1:3])
+            # Distribute each output value over its receptive field.
+            reference = np.zeros(padded.shape)
+            for batch, row, column, channel in np.ndindex(*values.shape):
+                top, left = row * strides[0], column * strides[1]
+                reference[batch, top:top + 3, left:left + 3] += \
+                    values[batch, row, column, channel] * self.weights[..., channel]
+            self.assertEqual(padded.shape, result.shape)
+            self.assertTrue(np.allclose(reference, result), (padding, strides))
+
+    def test_conv2d_weights(self):
+        self.assertIs(self.weights, conv2d_weights(self.weights, (3, 3), 3, 4))
+        caffe_weights = self.weights.transpose(3, 2, 0, 1)
+        self.assertTrue(np.all(self.weights == conv2d_weights(caffe_weights, (3, 3), 3, 4)))
+        with self.assertRaises(ValueError):
+            conv2d_weights(self.weights, (3, 3), 4, 3)
+
+    def test_layer_padding(self):
+        for padding, strides in CONFIGURATIONS:
+            layer = MockConv2D(None, weights=self.weights, bias=self.bias,
+                               strides=strides, padding=padding)
+            outputs = naive_conv2d(self.inputs[0], self.weights, self.bias, strides, padding)
+            amounts = layer_padding(layer, self.inputs.shape, (1,) + outputs.shape)
+            self.assertEqual(tuple(naive_padding(self.inputs.shape[axis + 1], 3, strides[axis], padding)[1]
+                                   for axis in range(2)), amounts)
+
+
+class TestMaxPooling(TestCase):
+    def setUp(self):
+        self.inputs = np.random.RandomState(0).randn(2, 9, 8, 3)
+
+    def test_max_pool2d(self):
+        for padding, strides in CONFIGURATIONS:
+            padded = pad(self.inputs, (2, 2), strides, padding, -np.inf)
+            outputs = max_pool2d(padded, (2, 2), strides)
+            for sample, output in zip(self.inputs, outputs):
+                reference = naive_max_pool2d(sample, (2, 2), strides, padding)
+                self.assertTrue(np.allclose(reference, output), (padding, strides))
+
+    def test_max_pool2d_backward(self):
+        random = np.random.RandomState(1)
+        for padding, strides in CONFIGURATIONS:
+            padded = pad(self.inputs, (2, 2), strides, padding, -np.inf)
+            values = random.randn(*max_pool2d(padded, (2, 2), strides).shape)
+            result = max_pool2d_backward(padded, values, (2, 2), strides)
+            # Route each output value to the maximum of its window.
+            reference = np.zeros(padded.shape)
+            for batch, row, column, channel in np.ndindex(*values.shape):
+                top, left = row * strides[0], column * strides[1]
+                window = padded[batch, top:top + 2, left:left + 2, channel]
+                winner_row, winner_column = np.unravel_index(np.argmax(window), window.shape)
+                reference[batch, top + winner_row, left + winner_column, channel] += \
+                    values[batch, row, column, channel]
+            self.assertTrue(np.allclose(reference, result), (padding, strides))
@@ -0,0 +1,160 @@
+from unittest import TestCase
+
+import numpy as np
+
+from visualizations.occlusion import AdaptiveOcclusion, IncrementalOcclusion, Occlusion
+from .mock_network import NumpyNetwork
+
+
+def reference_heatmaps(network, sample, targets, patch_size, stride, fill_value):
+    """Occlusion heatmaps (T,H,W) computed position by position. Targets are
+    (layer_id, kind, unit) triples with units given as tuples."""
+    def scores(input_sample):
+        return np.array([network.get_layer_outputs(layer_id, input_sample[np.newaxis], (kind,),
+                                                   use_cache=False)[0][(0,) + unit]
+                         for layer_id, kind, unit in targets])
+
+    clean_scores = scores(sample)
+    height, width = sample.shape[:2]
+    heatmaps = np.zeros((len(targets), height, width))
+    for row in range(0, height, stride):
+        for column in range(0, width, stride):
+            occluded = sample.copy()
+            top = row + stride // 2 - patch_size // 2
+            left = column + stride // 2 - patch_size // 2
+            occluded[max(top, 0):top + patch_size, max(left, 0):left + patch_size] = fill_value
+            change = clean_scores - scores(occluded)
+            heatmaps[:, row:row + stride, column:column + stride] = change[:, np.newaxis, np.newaxis]
+    return heatmaps
+
+
+class TestOcclusionTargets(TestCase):
+    def setUp(self):
+        self.network = NumpyNetwork()
+        self.sample = np.random.RandomState(1).rand(17, 15, 2).astype(np.float32)
+        self.kwargs = dict(patch_size=5, stride=3, fill_value=0.5)
+
+    def test_predicted_class(self):
+        heatmap = Occlusion(self.network, chunk_size=7, **self.kwargs).compute(self.sample)
+        predicted = int(np.argmax(self.network.get_activations('output', self.sample[np.newaxis])))
+        # The scores of the last layer are taken from the net input.
+        reference = reference_heatmaps(self.network, self.sample, [('output', 'net_input', (predicted,))],
+                                       **self.kwargs)
+        self.assertEqual((17, 15), heatmap.shape)
+        self.assertTrue(np.allclose(reference[0], heatmap, atol=1e-4))
+
+    def test_all_units(self):
+        heatmaps = Occlusion(self.network, targets='all', chunk_size=7, **self.kwargs).compute(self.sample)
+        reference = reference_heatmaps(self.network, self.sample,
+                                       [('output', 'net_input', (unit,)) for unit in range(3)],
+                                       **self.kwargs)
+        self.assertEqual((3, 17, 15), heatmaps.shape)
+        self.assertTrue(np.allclose(reference, heatmaps, atol=1e-4))
+
+    def test_all_units_of_spatial_layer(self):
+        network = NumpyNetwork(last_layer='conv2')
+        heatmaps = Occlusion(network, targets='all', chunk_size=7, **self.kwargs).compute(self.sample)
+        reference = reference_heatmaps(network, self.sample,
+                                       [('conv2', 'net_input', (row, column, channel))
+                                        for row in range(2) for column in range(2) for channel in range(5)],
+                                       **self.kwargs)
+        self.assertEqual((2 * 2 * 5, 17, 15), heatmaps.shape)
+        self.assertTrue(np.allclose(reference, heatmaps, atol=1e-4))
+
+    def test_hidden_targets(self):
+        targets = [('conv2', (0, 1, 2)), ('dense', 4), ('pool', (3, 2, 1)), ('output', 2)]
+        heatmaps = Occlusion(self.network, targets=targets, chunk_size=7, **self.kwargs).compute(self.sample)
+        # Hidden units are scored by their activation, output units by their net input.
+        reference = reference_heatmaps(self.network, self.sample,
+                                       [('conv2', 'activation', (0, 1, 2)), ('dense', 'activation', (4,)),
+                                        ('pool', 'activation', (3, 2, 1)), ('output', 'net_input', (2,))],
+                                       **self.kwargs)
+        self.assertEqual((4, 17, 15), heatmaps.shape)
+        self.assertTrue(np.allclose(reference, heatmaps, atol=1e-4))
+
+    def test_channel_target(self):
+        heatmaps = Occlusion(self.network, targets=[('conv2', 3)], chunk_size=7, **self.kwargs).compute(self.sample)
+        reference = reference_heatmaps(self.network, self.sample,
+                                       [('conv2', 'activation', (row, column, 3))
+                                        for row in range(2) for column in range(2)],
+                                       **self.kwargs)
+        # The values of the channel are summed.
+        self.assertEqual((1, 17, 15), heatmaps.shape)
+        self.assertTrue(np.allclose(reference.sum(axis=0), heatmaps[0], atol=1e-4))
+
+    def test_mixed_targets_in_one_pass_per_chunk(self):
+        # Hidden units are scored by their activation, output units by their net input.
+        targets = [('dense', 4), ('output', 2)]
+        Occlusion(self.network, targets=targets, chunk_size=10, **self.kwargs).compute(self.sample)
+        # One pass for the clean sample, one per chunk of the 6 * 5 occlusions.
+        self.assertEqual(1 + 3, self.network.num_computations)
+
+    def test_targets_and_clean_scores_in_one_pass(self):
+        occlusion = Occlusion(self.network, targets='all', chunk_size=7, **self.kwargs)
+        occlusion._resolve_targets(self.sample)
+        self.assertEqual(1, self.network.num_computations)
+
+
+class TestIncrementalOcclusion(TestCase):
+    def assert_equal_to_full_occlusion(self, network, sample, **kwargs):
+        full = Occlusion(network, **kwargs).compute(sample)
+        incremental = IncrementalOcclusion(network, **kwargs).compute(sample)
+        self.assertTrue(np.allclose(full, incremental, atol=1e-4), kwargs)
+
+    def test_equal_to_full_occlusion(self):
+        random = np.random.RandomState(1)
+        for input_shape, paddings in (((17, 15, 2), ('same', 'valid', 'valid')),
+                                      ((16, 16, 1), ('valid', 'same', 'same')),
+                                      ((13, 19, 3), ('same', 'same', 'valid'))):
+            network = NumpyNetwork(input_shape=input_shape, paddings=paddings)
+            sample = random.rand(*input_shape).astype(np.float32)
+            for patch_size, stride in ((3, 1), (1, 2), (5, 2), (4, 3)):
+                self.assert_equal_to_full_occlusion(network, sample, patch_size=patch_size, stride=stride,
+                                                    fill_value=0.5, chunk_size=16, targets='all')
+
+    def test_convolution_as_last_layer(self):
+        network = NumpyNetwork(last_layer='conv2')
+        sample = np.random.RandomState(1).rand(17, 15, 2).astype(np.float32)
+        self.assert_equal_to_full_occlusion(network, sample, patch_size=3, stride=2, targets='all')
+
+    def test_sample_changed_in_place(self):
+        network = NumpyNetwork()
+        random = np.random.RandomState(1)
+        sample = random.rand(17, 15, 2).astype(np.float32)
+        occlusion = IncrementalOcclusion(network, patch_size=3, stride=2, targets='all')
+        occlusion.compute(sample)
+        # Reuse the buffer for another sample, as the GUI does.
+        sample[...] = random.rand(17, 15, 2)
+        full = Occlusion(network, patch_size=3, stride=2, targets='all').compute(sample)
+        self.assertTrue(np.allclose(full, occlusion.compute(sample), atol=1e-4))
+
+    def test_hidden_targets_are_rejected(self):
+        sample = np.random.RandomState(1).rand(17, 15, 2).astype(np.float32)
+        occlusion = IncrementalOcclusion(NumpyNetwork(), targets=[('dense', 0)])
+        with self.assertRaises(ValueError):
+            occlusion.compute(sample)
+
+
+class TestAdaptiveOcclusion(TestCase):
+    def test_threshold_zero_equals_full_occlusion(self):
+        network = NumpyNetwork()
+        sample = np.random.RandomState(1).rand(17, 15, 2).astype(np.float32)
+        for patch_size, stride in ((3, 1), (5, 2)):
+            kwargs = dict(patch_size=patch_size, stride=stride, fill_value=0.5, targets='all')
+            full = Occlusion(network, **kwargs).compute(sample)
+            adaptive = AdaptiveOcclusion(network, coarse_stride=8, threshold=0, **kwargs).compute(sample)
+            self.assertTrue(np.allclose(full, adaptive, atol=1e-4), kwargs)
+
+    def test_flat_regions_need_fewer_forward_passes(self):
+        # Occlusions change the sample only around a small blob.
+        sample = np.full((24, 24, 1), 0.5, dtype=np.float32)
+        sample[15:18, 5:9] = 1.
+        kwargs = dict(patch_size=3, stride=1, fill_value=0.5)
+        network = NumpyNetwork(input_shape=(24, 24, 1))
+        full = Occlusion(network, **kwargs).compute(sample)
+        network.num_computations = 0
+        adaptive = AdaptiveOcclusion(network, coarse_stride=8, threshold=0, chunk_size=1,
+                                     **kwargs).compute(sample)
+        self.assertTrue(np.allclose(full, adaptive, atol=1e-4))
+        # One forward pass per occlusion, the full analysis needs 24 * 24.
+        self.assertLess(network.num_computations, 24 * 24 / 4)
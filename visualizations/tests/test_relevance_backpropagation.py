@@ -0,0 +1,103 @@
+from unittest import TestCase
+
+import numpy as np
+
+from network.layers.layers import Conv2D, Dense, Flatten, MaxPooling2D
+from visualizations.relevance_backpropagation import RelevanceBackpropagation
+from .mock_network import ACTIVATIONS, NumpyNetwork, naive_conv2d, naive_max_pool2d, naive_padding
+
+
+def stabilize(net_input, eps):
+    return net_input + eps * (1 if net_input >= 0 else -1)
+
+
+def reference_relevance(network, sample, eps):
+    """The epsilon rule for a single sample (H,W,C), unit by unit."""
+    layers = list(network.layer_dict.values())
+    inputs, net_inputs = [], []
+    values = sample.astype(np.float64)
+    for layer in layers:
+        inputs.append(values)
+        if isinstance(layer, Conv2D):
+            values = naive_conv2d(values, layer.weights, layer.bias, layer.strides, layer.padding)
+        elif isinstance(layer, MaxPooling2D):
+            values = naive_max_pool2d(values, layer.pool_size, layer.strides, layer.padding)
+        elif isinstance(layer, Flatten):
+            values = values.reshape(-1)
+        elif isinstance(layer, Dense):
+            values = np.dot(values, layer.weights) + layer.bias
+        net_inputs.append(values)
+        if isinstance(layer, (Conv2D, Dense)):
+            values = ACTIVATIONS[layer.activation_function](values)
+
+    predicted = np.argmax(values)
+    relevance = np.zeros(values.shape)
+    relevance[predicted] = net_inputs[-1][predicted]
+    for layer, layer_input, net_input in reversed(list(zip(layers, inputs, net_inputs))):
+        if isinstance(layer, Dense):
+            input_relevance = np.zeros(layer_input.shape)
+            for unit, weight in np.ndenumerate(layer.weights):
+                input_unit, output_unit = unit
+                input_relevance[input_unit] += (layer_input[input_unit] * weight /
+                                                stabilize(net_input[output_unit], eps) *
+                                                relevance[output_unit])
+            relevance = input_relevance
+        elif isinstance(layer, (Conv2D, MaxPooling2D)):
+            kernel_size = layer.kernel_size if isinstance(layer, Conv2D) else layer.pool_size
+            amounts = [naive_padding(layer_input.shape[axis], kernel_size[axis], layer.strides[axis],
+                                     layer.padding)[1] for axis in range(2)]
+            fill_value = 0. if isinstance(layer, Conv2D) else -np.inf
+            padded = np.pad(layer_input, amounts + [(0, 0)], 'constant', constant_values=fill_value)
+            input_relevance = np.zeros(padded.shape)
+            for row, column, channel in np.ndindex(*relevance.shape):
+                top, left = row * layer.strides[0], column * layer.strides[1]
+                window = padded[top:top + kernel_size[0], left:left + kernel_size[1]]
+                if isinstance(layer, Conv2D):
+                    input_relevance[top:top + kernel_size[0], left:left + kernel_size[1]] += \
+                        (window * layer.weights[..., channel] /
+                         stabilize(net_input[row, column, channel], eps) * relevance[row, column, channel])
+                else:
+                    winner_row, winner_column = np.unravel_index(np.argmax(window[..., channel]),
+                                                                 kernel_size)
+                    input_relevance[top + winner_row, left + winner_column, channel] += \
+                        relevance[row, column, channel]
+            relevance = input_relevance[amounts[0][0]:amounts[0][0] + layer_input.shape[0],
+                                        amounts[1][0]:amounts[1][0] + layer_input.shape[1]]
+        elif isinstance(layer, Flatten):
+            relevance = relevance.reshape(layer_input.shape)
+    return relevance
+
+
+class OutputNetInputNetwork(NumpyNetwork):
+    """Mock network providing the net input of the last layer only, so
+    that those of the hidden layers have to be computed."""
+    def _has_net_input(self, layer_id):
+        return layer_id == self.layer_ids[-1]
+
+
+class TestRelevanceBackpropagation(TestCase):
+    def setUp(self):
+        self.samples = np.random.RandomState(1).rand(3, 17, 15, 2).astype(np.float32)
+
+    def test_reference(self):
+        network = NumpyNetwork()
+        for eps in (1., 1e-3):
+            relevances = RelevanceBackpropagation(network).visualize(self.samples, eps)
+            self.assertEqual(self.samples.shape, relevances.shape)
+            for sample, relevance in zip(self.samples, relevances):
+                reference = reference_relevance(network, sample, eps)
+                self.assertTrue(np.allclose(reference, relevance, rtol=1e-3, atol=1e-5), eps)
+
+    def test_single_forward_pass(self):
+        network = NumpyNetwork()
+        RelevanceBackpropagation(network).visualize(self.samples)
+        self.assertEqual(1, network.num_computations)
+
+    def test_computed_net_inputs(self):
+        relevances = RelevanceBackpropagation(NumpyNetwork()).visualize(self.samples)
+        computed = RelevanceBackpropagation(OutputNetInputNetwork()).visualize(self.samples)
+        self.assertTrue(np.allclose(relevances, computed, rtol=1e-3, atol=1e-5))
+
+    def test_single_sample(self):
+        relevance = RelevanceBackpropagation(NumpyNetwork()).visualize(self.samples[0])
+        self.assertEqual((1,) + self.samples.shape[1:], relevance.shape)
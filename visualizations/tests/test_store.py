@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+import os
+import tempfile
+
+import numpy as np
+
+from visualizations.store import HeatmapStore
+
+
+class TestHeatmapStore(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = HeatmapStore(self.directory.name)
+        self.network = SimpleNamespace(fingerprint='network-1')
+        self.sample = np.arange(12, dtype=np.float32).reshape(3, 4, 1)
+        self.parameters = {'name': 'Occlusion', 'patch_size': 3, 'stride': 1}
+        self.heatmap = np.linspace(-1, 1, 12).reshape(3, 4)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def set_last_use(self, parameters, timestamp):
+        path = self.store._path(self.store.key(self.network, self.sample, parameters))
+        os.utime(path, (timestamp, timestamp))
+
+    def test_round_trip(self):
+        self.assertIsNone(self.store.get(self.network, self.sample, self.parameters))
+        self.store.put(self.network, self.sample, self.parameters, self.heatmap)
+        result = self.store.get(self.network, self.sample.copy(), dict(self.parameters))
+        self.assertTrue(np.all(self.heatmap == result))
+        # The store survives a restart.
+        result = HeatmapStore(self.directory.name).get(self.network, self.sample, self.parameters)
+        self.assertTrue(np.all(self.heatmap == result))
+
+    def test_key_changes(self):
+        self.store.put(self.network, self.sample, self.parameters, self.heatmap)
+        retrained = SimpleNamespace(fingerprint='network-2')
+        self.assertIsNone(self.store.get(retrained, self.sample, self.parameters))
+        self.assertIsNone(self.store.get(self.network, self.sample + 1, self.parameters))
+        self.assertIsNone(self.store.get(self.network, self.sample, dict(self.parameters, stride=2)))
+        # The order of the parameters does not matter.
+        reordered = dict(reversed(list(self.parameters.items())))
+        self.assertIsNotNone(self.store.get(self.network, self.sample, reordered))
+
+    def test_least_recently_used_are_evicted(self):
+        for stride in range(3):
+            self.store.put(self.network, self.sample, dict(self.parameters, stride=stride), self.heatmap)
+            self.set_last_use(dict(self.parameters, stride=stride), 1000 + stride)
+        entry_size = self.store.size // 3
+        self.store.max_bytes = 3 * entry_size
+        # Reading a result marks it as recently used.
+        self.assertIsNotNone(self.store.get(self.network, self.sample, dict(self.parameters, stride=0)))
+        self.store.put(self.network, self.sample, dict(self.parameters, stride=3), self.heatmap)
+        self.assertEqual(3 * entry_size, self.store.size)
+        stored = [self.store.get(self.network, self.sample, dict(self.parameters, stride=stride)) is not None
+                  for stride in range(4)]
+        self.assertEqual([True, False, True, True], stored)
+
+    def test_partial_file_is_ignored(self):
+        def failing_save(fp, values):
+            fp.write(b'\x93NUMPY')
+            raise OSError('disk full')
+
+        with mock.patch('visualizations.store.np.save', failing_save):
+            with self.assertRaises(OSError):
+                self.store.put(self.network, self.sample, self.parameters, self.heatmap)
+        self.assertIsNone(self.store.get(self.network, self.sample, self.parameters))
+        self.assertEqual(0, self.store.size)
+        self.assertEqual([], os.listdir(self.directory.name))
+        # A later write succeeds.
+        self.store.put(self.network, self.sample, self.parameters, self.heatmap)
+        self.assertTrue(np.all(self.heatmap == self.store.get(self.network, self.sample, self.parameters)))